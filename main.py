@@ -1,7 +1,11 @@
 from website import create_app
+from website.bootstrap import init_database
 
 app = create_app()
 
 
 if __name__ == '__main__':
+    # dev server: set up the database on first run (deployments run `flask init` once)
+    with app.app_context():
+        init_database()
     app.run(debug=True)
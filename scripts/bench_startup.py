@@ -0,0 +1,65 @@
+"""
+Measure worker startup cost: importing the `website` package and calling create_app().
+
+Every run is a fresh interpreter, like a newly forked or recycled worker without
+--preload. Also counts database connections opened during startup, which should be 0
+(schema and admin setup live in `flask init`).
+
+Usage:
+  python scripts/bench_startup.py            # 20 runs
+  python scripts/bench_startup.py --runs 50
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+CHILD = r"""
+import json, time
+t0 = time.perf_counter()
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+connects = []
+event.listen(Engine, "connect", lambda *a: connects.append(1))
+t1 = time.perf_counter()
+import website
+t2 = time.perf_counter()
+app = website.create_app()
+t3 = time.perf_counter()
+print(json.dumps({"import_ms": (t2 - t1) * 1000, "factory_ms": (t3 - t2) * 1000,
+                  "db_connections": len(connects)}))
+"""
+
+
+def run_once():
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD],
+        cwd=PROJECT_ROOT,
+        env={**os.environ, "PYTHONPATH": PROJECT_ROOT},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    results = [run_once() for _ in range(args.runs)]
+    print(f"{args.runs} fresh processes")
+    for key in ("import_ms", "factory_ms"):
+        values = [r[key] for r in results]
+        print(f"  {key:<11} median {statistics.median(values):7.1f}  "
+              f"min {min(values):7.1f}  max {max(values):7.1f}")
+    print(f"  db connections during startup: {max(r['db_connections'] for r in results)}")
+
+
+if __name__ == "__main__":
+    main()
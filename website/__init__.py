@@ -8,9 +8,12 @@ from flask_login import LoginManager
 from sqlalchemy import func
 from werkzeug.security import generate_password_hash
 
+from . import read_routing
+
 
 # --- DB handle (shared) ---
-db = SQLAlchemy()
+# SELECTs in read_routing.read_snapshot views go to the read engine, the rest to the primary
+db = SQLAlchemy(session_options={"class_": read_routing.RoutingSession})
 
 DB_NAME = "database.db"
 
@@ -21,17 +24,61 @@ def create_app():
 
     # ----- Resolve absolute DB path in /instance -----
     BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))  # project root
-    INSTANCE_DIR = os.path.join(BASE_DIR, "instance")
-    os.makedirs(INSTANCE_DIR, exist_ok=True)  # make sure folder exists
+    INSTANCE_DIR = os.path.join(BASE_DIR, "instance")  # created by `flask init`
 
     DB_PATH = os.path.join(INSTANCE_DIR, DB_NAME)
     DB_URI = "sqlite:///" + DB_PATH.replace("\\", "/")  # Windows-safe URI
 
     app.config["SQLALCHEMY_DATABASE_URI"] = DB_URI
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # same file, read-only: reports/dashboards/listings (see website/read_routing.py)
+    app.config["SQLALCHEMY_BINDS"] = {read_routing.READ_BIND: read_routing.read_uri(DB_PATH)}
 
     db.init_app(app)
 
+    # ----- WAL mode + read engine for report/dashboard reads -----
+    read_routing.init_app(app)
+
+    # ----- Per-table change markers (conditional GET validators) -----
+    from . import changes
+    changes.init_app(app)
+
+    # ----- Auth event log (batched background writer) -----
+    from .audit import writer as auth_event_writer
+    auth_event_writer.init_app(app)
+
+    # ----- Daily request rollup (report trends), kept in step with request writes -----
+    from . import rollups
+    rollups.init_app(app)
+
+    # ----- Trending score SQL functions (decayed view counts) -----
+    from . import trending
+    trending.init_app(app)
+
+    # ----- Near-duplicate request index (MinHash + LSH), kept in step with request writes -----
+    from . import duplicates
+    duplicates.init_app(app)
+
+    # ----- Search box typeahead (in-memory title prefix index) -----
+    from . import typeahead
+    typeahead.init_app(app)
+
+    # ----- Per-CSR recommended request feeds, kept in step with request/shortlist writes -----
+    from . import feed
+    feed.init_app(app)
+
+    # ----- Volunteer skills (many categories each) and the skill/availability bitmaps -----
+    from . import skills
+    skills.init_app(app)
+
+    # ----- Volunteer location grid (nearest-volunteer matching), stamp-invalidated -----
+    from . import geo
+    geo.init_app(app)
+
+    # ----- Request status events (server-sent events) -----
+    from . import events as request_events
+    request_events.init_app(app)
+
     # ----- Blueprints -----
     from .views import views
     from .auth import auth
@@ -41,6 +88,8 @@ def create_app():
     from .volunteer import volunteer
     from .platform import platform
     from .shortlist import shortlist
+    from .api import api
+    from .events import events
 
     app.register_blueprint(views, url_prefix="/")
     app.register_blueprint(auth, url_prefix="/")
@@ -50,6 +99,24 @@ def create_app():
     app.register_blueprint(volunteer, url_prefix="/")
     app.register_blueprint(platform, url_prefix="/")
     app.register_blueprint(shortlist, url_prefix="/")
+    app.register_blueprint(api, url_prefix="/api/v1")
+    app.register_blueprint(events, url_prefix="/")
+
+    # ----- Cached category lookups for templates (no query per card/row) -----
+    from .category_cache import categories as category_cache
+    app.jinja_env.globals["category_by_id"] = category_cache.get
+
+    # ----- Rendered request card/row fragments (LRU, memory capped) -----
+    from .fragments import fragment_cache
+    fragment_cache.init_app(app)
+
+    # ----- Home page filter counts (grouped query per search, briefly cached) -----
+    from .facets import facet_counts
+    facet_counts.init_app(app)
+
+    # ----- Response compression (gzip; zstd/brotli when installed) -----
+    from .compression import compressor
+    compressor.init_app(app)
 
     # ----- Login manager -----
     login_manager = LoginManager()
@@ -62,33 +129,22 @@ def create_app():
         # modern pattern; avoids extra query if already in session
         return db.session.get(User, int(user_id))
 
-    # ----- First-run: create DB + default admin -----
-    with app.app_context():
-        from .models import User  # import inside app ctx to avoid circulars
+    # No database I/O here: workers only build the app. Schema creation/upgrades and the
+    # default admin are done once by `flask init` (main.py runs it for the dev server).
 
-        if not os.path.exists(DB_PATH):
-            db.create_all()
-            print("Created database at:", DB_PATH)
-        else: 
-            print("Database already exists at:", DB_PATH)
+    # ----- CLI: one-time setup (schema + admin bootstrap) -----
+    @app.cli.command("init")
+    def init_command():
+        """
+        Create or upgrade the database schema and the default admin account.
+        Run once per deploy, before starting workers. Safe to re-run.
 
-        # create admin once
-        exists_admin = db.session.scalar(
-            db.select(User.id).where(User.role == "Admin")
-        )
-        if not exists_admin:
-            admin_user = User(
-                name="Admin",
-                email="admin",
-                password=generate_password_hash("admin", method="pbkdf2:sha256"),
-                role="Admin",
-                status="Active",
-            )
-            db.session.add(admin_user)
-            db.session.commit()
-            print("Admin account created.")
-        else:
-            print("Admin account already exists.")
+        Usage:
+          flask init
+        """
+        from .bootstrap import init_database
+        with app.app_context():
+            init_database(echo=click.echo)
 
     # ----- CLI: seed categories (idempotent) -----
     from .models import Category  # after db.init_app
@@ -236,10 +292,8 @@ def create_app():
                 # Resolve category id (optional)
                 cat_id = None
                 if category_name:
-                    cat_id = db.session.scalar(
-                        db.select(Category.id)
-                        .where(func.lower(Category.name) == category_name.lower())
-                    )
+                    cat = category_cache.by_name(category_name)
+                    cat_id = cat.id if cat else None
 
                 # Ensure a volunteer row exists
                 exists_vol = db.session.scalar(
@@ -307,10 +361,8 @@ def create_app():
                     missing_vol += 1
                     continue
 
-                cat_id = db.session.scalar(
-                    db.select(Category.id)
-                      .where(func.lower(Category.name) == cat_name.lower())
-                )
+                cat = category_cache.by_name(cat_name)
+                cat_id = cat.id if cat else None
                 if not cat_id:
                     missing_cat += 1
                     continue
@@ -507,4 +559,214 @@ def create_app():
                        f"across {len(categories)} categories "
                        f"({per_cat} per category).")
 
+    # ----- CLI: bulk activate/suspend/delete users by filter -----
+    @app.cli.command("bulk_users")
+    @click.argument("action", type=click.Choice(["activate", "suspend", "delete"]))
+    @click.option("--ids", default="", help="Comma-separated user ids.")
+    @click.option("--role", default=None, help="Only users with this role.")
+    @click.option("--status", default=None, help="Only users with this status (e.g. Pending).")
+    @click.option("--domain", "email_domain", default=None, help="Only emails @ this domain.")
+    @click.option("--created-after", type=click.DateTime(formats=["%Y-%m-%d"]), default=None)
+    @click.option("--created-before", type=click.DateTime(formats=["%Y-%m-%d"]), default=None)
+    @click.option("--dry-run", is_flag=True, help="Only report how many users match.")
+    def bulk_users(action, ids, role, status, email_domain, created_after, created_before, dry_run):
+        """
+        Example:
+          flask bulk_users activate --role PIN --status Pending --domain partner.org
+        """
+        from . import moderation
+
+        try:
+            conds = moderation.user_criteria(
+                user_ids=[i for i in ids.split(",") if i.strip()],
+                role=role,
+                status=status,
+                created_after=created_after,
+                created_before=created_before,
+                email_domain=email_domain,
+            )
+        except ValueError as e:
+            click.echo(str(e))
+            return
+
+        if action == "delete":
+            counts = moderation.bulk_delete(conds, dry_run=dry_run)
+            for name, count in counts.items():
+                click.echo(f"  {name}: {count}")
+            click.echo(f"delete: {counts['users']} users {'match' if dry_run else 'affected'}.")
+            return
+
+        if dry_run:
+            click.echo(f"{moderation.count_users(conds)} users match.")
+            return
+
+        affected = moderation.bulk_set_status(conds, moderation.BULK_STATUS_ACTIONS[action])
+        click.echo(f"{action}: {affected} users affected.")
+
+    # ----- CLI: resync cached shortlist counters -----
+    @app.cli.command("recount_shortlists")
+    def recount_shortlists_command():
+        """
+        Usage:
+          flask recount_shortlists
+        Recomputes request.shortlist_count from the shortlist table (e.g. after an upgrade).
+        """
+        from .shortlist import recount_shortlists
+
+        updated = recount_shortlists()
+        click.echo(f"Recounted shortlist totals for {updated} requests.")
+
+    # ----- CLI: move old completed requests to the archive tables -----
+    @app.cli.command("archive_requests")
+    @click.option("--older-than", "older_than", type=int, default=None,
+                  help="Age in days (default: REQUEST_ARCHIVE_AFTER_DAYS config, else 90)")
+    @click.option("--batch-size", type=int, default=None, help="Requests moved per transaction (default 500)")
+    @click.option("--dry-run", is_flag=True, help="Only report how many rows would move")
+    def archive_requests_command(older_than, batch_size, dry_run):
+        """
+        Usage:
+          flask archive_requests [--older-than DAYS] [--batch-size N] [--dry-run]
+        Moves requests (and their reviews) completed more than DAYS ago out of
+        the hot request/review tables. Safe to run repeatedly, e.g. nightly from cron.
+        """
+        from . import archive
+
+        older_than = older_than if older_than is not None else app.config.get(
+            "REQUEST_ARCHIVE_AFTER_DAYS", archive.DEFAULT_ARCHIVE_AFTER_DAYS)
+        batch_size = batch_size or app.config.get("REQUEST_ARCHIVE_BATCH_SIZE", archive.DEFAULT_BATCH_SIZE)
+        with app.app_context():
+            result = archive.archive_completed(older_than, batch_size, dry_run=dry_run)
+        verb = "Would archive" if dry_run else "Archived"
+        click.echo(f"{verb} {result['requests']} requests and {result['reviews']} reviews "
+                   f"older than {older_than} days"
+                   + ("" if dry_run else f" in {result['batches']} batches") + ".")
+
+    # ----- CLI: recompute the daily request rollup -----
+    @app.cli.command("rollup_requests")
+    @click.option("--since", type=click.DateTime(formats=["%Y-%m-%d"]), default=None,
+                  help="Only recompute days from this date (YYYY-MM-DD); default: all days")
+    def rollup_requests_command(since):
+        """
+        Usage:
+          flask rollup_requests [--since 2025-01-01]
+        Rebuilds request_daily_rollup from the request and archive tables, e.g. after
+        importing data with raw SQL. Normal writes keep it up to date on their own.
+        """
+        from . import rollups
+
+        with app.app_context():
+            written = rollups.rebuild(since.date() if since else None)
+        click.echo(f"Wrote {written} rollup rows" + (f" from {since.date()}." if since else "."))
+
+    # ----- CLI: bulk import of requests (partner spreadsheets) -----
+    @app.cli.command("import_requests")
+    @click.argument("file_path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--owner", required=True, help="Email of the PIN account the requests belong to")
+    @click.option("--format", "fmt", type=click.Choice(["csv", "ndjson"]), default=None,
+                  help="File format; default: from the extension (.csv, .ndjson/.jsonl)")
+    @click.option("--chunk-size", type=int, default=None, help="Rows per transaction (default 1000)")
+    def import_requests_command(file_path, owner, fmt, chunk_size):
+        """
+        Usage:
+          flask import_requests needs.csv --owner partner@example.org
+          flask import_requests needs.ndjson --owner partner@example.org --chunk-size 5000
+        Columns/keys: title, description, category (name or id), scheduled_datetime
+        (ISO 8601), optional latitude and longitude. The file is streamed; invalid rows
+        are skipped and listed with their line numbers.
+        """
+        from . import bulk_import
+        from .models import User
+
+        with app.app_context():
+            user = User.query.filter(func.lower(User.email) == owner.strip().lower()).first()
+            if not user:
+                click.echo(f"No user with email {owner}.")
+                return
+            with open(file_path, 'rb') as f:
+                try:
+                    result = bulk_import.import_requests(
+                        bulk_import.text_stream(f), fmt or bulk_import.format_for(file_path), user.id,
+                        chunk_size=chunk_size or bulk_import.DEFAULT_CHUNK_SIZE)
+                except bulk_import.ImportFormatError as e:
+                    click.echo(str(e))
+                    return
+        for line_no, message in result['errors']:
+            click.echo(f"line {line_no}: {message}")
+        if result['failed'] > len(result['errors']):
+            click.echo(f"... and {result['failed'] - len(result['errors'])} more errors")
+        click.echo(f"Imported {result['imported']} requests in {result['chunks']} chunks "
+                   f"({result['flagged']} flagged as possible duplicates); {result['failed']} rows skipped.")
+        if result['stopped']:
+            click.echo(f"{result['stopped']} The rest of the file was not imported.")
+
+    # ----- CLI: recompute the CSR recommended feeds -----
+    @app.cli.command("rebuild_csr_feed")
+    def rebuild_csr_feed_command():
+        """
+        Usage:
+          flask rebuild_csr_feed
+        Recomputes every CSR's category affinities and ranked feed from the shortlist and
+        acceptance history, e.g. after changing the weights in website/feed.py.
+        """
+        from . import feed
+
+        with app.app_context():
+            rows = feed.rebuild()
+        click.echo(f"Wrote {rows} feed rows.")
+
+    # ----- CLI: find near-duplicate open requests -----
+    @app.cli.command("scan_duplicates")
+    @click.option("--flag", is_flag=True, help="Mark each duplicate with the request it repeats.")
+    def scan_duplicates_command(flag):
+        """
+        Usage:
+          flask scan_duplicates          # list near-duplicate open requests
+          flask scan_duplicates --flag   # and record them (shown on the CSR dashboard)
+        Each open request is compared with older ones by the same user or in the same
+        category, through the LSH index (see website/duplicates.py).
+        """
+        from . import duplicates
+
+        with app.app_context():
+            pairs = duplicates.scan(flag=flag)
+        for request_id, duplicate_of, score in pairs:
+            click.echo(f"#{request_id} looks like #{duplicate_of} ({score:.0%} similar)")
+        click.echo(f"{len(pairs)} near-duplicates" + (" flagged." if flag else " found."))
+
+    # ----- CLI: save/restore named database snapshots -----
+    @app.cli.command("snapshot")
+    @click.argument("action", type=click.Choice(["save", "restore", "list", "delete"]))
+    @click.argument("name", required=False)
+    @click.option("--overwrite", is_flag=True, help="Replace an existing snapshot when saving.")
+    @click.option("--copy", "use_copy", is_flag=True,
+                  help="Restore by swapping the file (only when the server is stopped).")
+    def snapshot_command(action, name, overwrite, use_copy):
+        """
+        Usage:
+          flask snapshot save baseline
+          flask snapshot restore baseline [--copy]
+          flask snapshot list
+        """
+        from . import snapshots
+
+        try:
+            if action == "list":
+                for snap in snapshots.list_snapshots():
+                    click.echo(f"{snap['name']}\t{snap['size']} bytes\t{snap['created']}")
+                return
+            if not name:
+                click.echo("Please pass a snapshot name.")
+                return
+            if action == "save":
+                path = snapshots.save_snapshot(name, overwrite=overwrite)
+                click.echo(f"Saved snapshot to {path}.")
+            elif action == "restore":
+                snapshots.restore_snapshot(name, method="copy" if use_copy else "backup")
+                click.echo(f"Restored snapshot '{name}'.")
+            else:
+                snapshots.delete_snapshot(name)
+                click.echo(f"Deleted snapshot '{name}'.")
+        except snapshots.SnapshotError as e:
+            click.echo(str(e))
+
     return app
@@ -1,23 +1,90 @@
 from flask import Blueprint, render_template, redirect, request, url_for, flash, jsonify
-from sqlalchemy import text
+from sqlalchemy import and_, func, or_, text
 from flask_login import login_required, current_user
 from .models import User, Request
 from . import db
+from . import audit
+from . import moderation
+from . import cascade
+from . import snapshots
+from . import changes
+from .pagination import apply_keyset, split_page
+from .read_routing import read_snapshot
+from .fragments import fragment_cache
+from datetime import datetime
 from werkzeug.security import generate_password_hash
 
 admin = Blueprint('admin', __name__)
 
 # --- Admin Dashboard ---
+USERS_PER_PAGE = 50
+
+# sort -> (columns ending with a unique one, descending, cursor values for a row)
+# ids are assigned at creation, so id order is date_created order and uses the primary key
+USER_SORTS = {
+    'newest': ([User.id], True, lambda u: [u.id]),
+    'oldest': ([User.id], False, lambda u: [u.id]),
+    'name': ([func.lower(User.name), User.id], False, lambda u: [(u.name or '').lower(), u.id]),
+    'email': ([func.lower(User.email), User.id], False, lambda u: [(u.email or '').lower(), u.id]),
+}
+
+
+def _prefix_range(col, prefix):
+    """col LIKE 'prefix%' written as a range so SQLite can use an index on col."""
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    return and_(col >= prefix, col < upper)
+
+
 @admin.route('/admin')
 @login_required
+@read_snapshot
 def dashboard():
     # if current_user.role != 'Admin':
     #     flash("Only admin can access this page!.", "danger")
     #     return redirect(url_for('views.home'))
-    # Get all users
-    users = User.query.order_by(User.date_created.desc()).all()
-    
-    return render_template("admin_dashboard.html", users=users)
+    search_query = (request.args.get('q') or '').strip().lower()
+    role_filter = request.args.get('role', '')
+    status_filter = request.args.get('status', '')
+    sort_by = request.args.get('sort', 'newest')
+    if sort_by not in USER_SORTS:
+        sort_by = 'newest'
+    cursor = request.args.get('cursor')
+
+    q = db.select(User)
+    if search_query:
+        q = q.where(or_(
+            _prefix_range(func.lower(User.name), search_query),
+            _prefix_range(func.lower(User.email), search_query),
+        ))
+    if role_filter:
+        q = q.where(User.role == role_filter)
+    if status_filter:
+        q = q.where(User.status == status_filter)
+
+    columns, descending, cursor_key = USER_SORTS[sort_by]
+    q = apply_keyset(q, columns, cursor, descending).limit(USERS_PER_PAGE + 1)
+    users, next_cursor = split_page(db.session.scalars(q).all(), USERS_PER_PAGE, key=cursor_key)
+
+    # per-role and per-status totals from one grouped query
+    role_counts, status_counts, total_users = {}, {}, 0
+    for role, status, count in db.session.execute(
+        db.select(User.role, User.status, func.count()).group_by(User.role, User.status)
+    ):
+        role_counts[role] = role_counts.get(role, 0) + count
+        status_counts[status] = status_counts.get(status, 0) + count
+        total_users += count
+
+    return render_template(
+        "admin_dashboard.html",
+        users=users,
+        next_cursor=next_cursor,
+        is_first_page=not cursor,
+        role_counts=role_counts,
+        status_counts=status_counts,
+        total_users=total_users,
+        allowed_roles=sorted(ALLOWED_ROLES | {"Admin"}),
+        allowed_statuses=sorted(ALLOWED_STATUSES),
+    )
 
 # User admin activate users
 @admin.route('/admin/user/<int:id>/activate')
@@ -36,6 +103,58 @@ def suspend_user(id):
     flash(f"{user.name} suspended.", "warning")
     return redirect(url_for('admin.dashboard'))
 
+# Bulk activate/suspend/delete by checkbox selection or by filter
+@admin.route('/admin/users/bulk', methods=['POST'])
+@login_required
+def bulk_users():
+    wants_json = request.is_json
+    data = (request.get_json(silent=True) or {}) if wants_json else request.form
+
+    def fail(message, code=400):
+        if wants_json:
+            return jsonify({"error": message}), code
+        flash(message, "danger")
+        return redirect(url_for('admin.dashboard'))
+
+    if getattr(current_user, "role", "").lower() != "admin":
+        return fail("Unauthorized", 403)
+
+    action = data.get('action')
+    if action not in moderation.BULK_STATUS_ACTIONS and action != 'delete':
+        return fail("Invalid bulk action.")
+
+    user_ids = data.get('user_ids') if wants_json else request.form.getlist('user_ids')
+    # "apply to all matching" ignores the checkboxes and uses the filters only
+    if data.get('scope') == 'filter':
+        user_ids = None
+
+    try:
+        conds = moderation.user_criteria(
+            user_ids=user_ids,
+            role=data.get('role') or None,
+            status=data.get('status') or None,
+            created_after=_parse_datetime(data.get('created_after')),
+            created_before=_parse_datetime(data.get('created_before')),
+            email_domain=data.get('email_domain') or None,
+        )
+    except ValueError as e:
+        return fail(str(e))
+
+    try:
+        if action == 'delete':
+            affected = moderation.bulk_delete(conds)['users']
+        else:
+            affected = moderation.bulk_set_status(conds, moderation.BULK_STATUS_ACTIONS[action])
+    except Exception as e:
+        print("Error in bulk user action:", e)
+        return fail(f"Error applying bulk action: {str(e)}", 500)
+
+    if wants_json:
+        return jsonify({"action": action, "affected": affected}), 200
+    flash(f"{action.capitalize()}: {affected} user(s) affected.", "success")
+    return redirect(url_for('admin.dashboard'))
+
+
 @admin.route('/edit-profile/<int:user_id>', methods=['GET', 'POST'])
 # @login_required
 def edit_profile(user_id):
@@ -76,28 +195,16 @@ def delete_user(user_id):
     #     return redirect(url_for('views.home'))
 
     user = User.query.get_or_404(user_id)
+    name = user.name
 
-    try:
-        # 1. Delete user's requests
-        Request.query.filter_by(user_id=user.id).delete()
-
-        # 2. If volunteer, unassign requests and delete profile
-        if user.role == 'Volunteer' and hasattr(user, 'volunteer_profile') and user.volunteer_profile:
-            volunteer = user.volunteer_profile
-
-            Request.query.filter_by(volunteer_id=volunteer.id).update({
-                'volunteer_id': None,
-                'status': 'Pending'
-            })
-            db.session.delete(volunteer)
+    # ?dry_run=1 reports what would be deleted without changing anything
+    if request.args.get('dry_run'):
+        return jsonify(cascade.delete_user(user.id, dry_run=True)), 200
 
-        # 3. Delete user
-        db.session.delete(user)
-        db.session.commit()
-
-        flash(f"User {user.name} deleted successfully.", "success")
+    try:
+        cascade.delete_user(user.id)
+        flash(f"User {name} deleted successfully.", "success")
     except Exception as e:
-        db.session.rollback()
         flash(f"Error deleting user: {str(e)}", "danger")
         print("Error deleting user:", e)
 
@@ -130,6 +237,7 @@ def clear_database():
                     db.session.execute(text(f"ALTER SEQUENCE {table.name}_id_seq RESTART WITH 1"))
 
         db.session.commit()
+        changes.bump_all()
         return jsonify({"message": "Database cleared (except users) and auto-increment reset."}), 200
 
     except Exception as e:
@@ -137,6 +245,101 @@ def clear_database():
         return jsonify({"error": str(e)}), 500
 
 
+# --- Database snapshots (SQLite backup API) ---
+@admin.route('/api/snapshots', methods=['GET', 'POST'])
+@login_required
+def snapshots_api():
+    if getattr(current_user, "role", "").lower() != "admin":
+        return jsonify({"error": "Unauthorized"}), 403
+
+    try:
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or request.form
+            name = (data.get('name') or '').strip()
+            snapshots.save_snapshot(name, overwrite=bool(data.get('overwrite')))
+            return jsonify({"message": f"Snapshot '{name}' saved."}), 201
+        return jsonify({"snapshots": snapshots.list_snapshots()}), 200
+    except snapshots.SnapshotError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@admin.route('/api/snapshots/<name>/restore', methods=['POST'])
+@login_required
+def restore_snapshot(name):
+    if getattr(current_user, "role", "").lower() != "admin":
+        return jsonify({"error": "Unauthorized"}), 403
+
+    try:
+        snapshots.restore_snapshot(name)
+        return jsonify({"message": f"Snapshot '{name}' restored."}), 200
+    except snapshots.SnapshotError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+def _parse_datetime(value):
+    """Parse an ISO date/datetime query arg. Return None when missing or invalid."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+# Fragment cache counters for this worker process (hit rate of the card/row cache)
+@admin.route('/api/fragment-cache')
+@login_required
+def fragment_cache_stats():
+    if getattr(current_user, "role", "").lower() != "admin":
+        return jsonify({"error": "Unauthorized"}), 403
+    return jsonify(fragment_cache.stats()), 200
+
+
+# Auth event log (login success/failure, logout) for admins
+@admin.route('/api/auth-events')
+@login_required
+@read_snapshot
+def auth_events():
+    if getattr(current_user, "role", "").lower() != "admin":
+        return jsonify({"error": "Unauthorized"}), 403
+
+    user_id = request.args.get('user_id', type=int)
+    before_id = request.args.get('before_id', type=int)
+    limit = max(1, min(request.args.get('limit', 100, type=int), 1000))
+
+    # unlike _parse_datetime, a bad bound is an error: dropping it would widen the result
+    bounds = {}
+    for key in ('start', 'end'):
+        value = request.args.get(key)
+        if not value:
+            continue
+        try:
+            bounds[key] = datetime.fromisoformat(value)
+        except ValueError:
+            return jsonify({"error": f"Invalid '{key}' (use ISO 8601, e.g. 2025-06-01T10:00)."}), 400
+
+    events = audit.query_events(
+        user_id=user_id,
+        start=bounds.get('start'),
+        end=bounds.get('end'),
+        event=request.args.get('event') or None,
+        before_id=before_id,
+        limit=limit,
+    )
+    return jsonify({
+        "events": [{
+            "id": e.id,
+            "user_id": e.user_id,
+            "email": e.email,
+            "event": e.event,
+            "role": e.role,
+            "ip": e.ip,
+            "timestamp": e.timestamp.isoformat(),
+        } for e in events],
+        "next_before_id": events[-1].id if len(events) == limit else None,
+    }), 200
+
+
 # Function: Create User Profiles for PIN/CSR Rep/Platform Manager/Volunteer with temporary password
 ALLOWED_ROLES = {"CSR", "Platform Manager", "Volunteer", "PIN"}
 ALLOWED_STATUSES = {"Active", "Pending", "Suspended"}  # pick the set your app actually uses
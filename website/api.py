@@ -0,0 +1,216 @@
+from datetime import date, datetime
+
+from flask import Blueprint, jsonify, request
+from flask_login import current_user, login_required
+
+from . import db
+from .models import Category, Request, Review, User, Volunteer
+from .pagination import apply_keyset, split_page
+
+# Versioned, read-only JSON API: /api/v1/...
+api = Blueprint('api', __name__)
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+
+def _name_of(model, fk):
+    """Correlated name lookup, so 'category'/'name' fields don't need a join."""
+    return db.select(model.name).where(model.id == fk).scalar_subquery()
+
+
+def _int(value):
+    return int(value)
+
+
+def _date(value):
+    return datetime.fromisoformat(value)
+
+
+def _own_volunteer_id(user):
+    return db.select(Volunteer.id).where(Volunteer.user_id == user.id).scalar_subquery()
+
+
+# Roles that see every row of a resource (staff)
+STAFF_ROLES = {'Admin', 'Platform Manager', 'CSR'}
+
+# Each resource: model, exposed fields (name -> column expression), filters
+# (query arg -> (column, parser, operator)) and scope: for callers outside the resource's
+# 'roles', {role: user -> WHERE condition} limiting them to their own rows (roles not
+# listed get 403). Only requested fields are selected in SQL.
+RESOURCES = {
+    'requests': {
+        'model': Request,
+        'fields': {
+            'id': Request.id,
+            'title': Request.title,
+            'description': Request.description,
+            'status': Request.status,
+            'category_id': Request.category_id,
+            'category': _name_of(Category, Request.category_id),
+            'user_id': Request.user_id,
+            'volunteer_id': Request.volunteer_id,
+            'csr_id': Request.csr_id,
+            'scheduled_datetime': Request.scheduled_datetime,
+            'latitude': Request.latitude,
+            'longitude': Request.longitude,
+            'date_created': Request.date_created,
+            'view_count': Request.view_count,
+            'trending_score': Request.trending_score,
+            'shortlist_count': Request.shortlist_count,
+        },
+        'filters': {
+            'status': (Request.status, str, '=='),
+            'category_id': (Request.category_id, _int, '=='),
+            'owner': (Request.user_id, _int, '=='),
+            'volunteer': (Request.volunteer_id, _int, '=='),
+            'created_after': (Request.date_created, _date, '>='),
+            'created_before': (Request.date_created, _date, '<'),
+        },
+        'roles': STAFF_ROLES,
+        'scope': {
+            'PIN': lambda user: Request.user_id == user.id,
+            'Volunteer': lambda user: Request.volunteer_id == _own_volunteer_id(user),
+        },
+    },
+    'categories': {
+        'model': Category,
+        'fields': {
+            'id': Category.id,
+            'name': Category.name,
+            'description': Category.description,
+            'date_created': Category.date_created,
+        },
+        'filters': {},
+        'roles': None,  # everyone
+        'scope': {},
+    },
+    'volunteers': {
+        'model': Volunteer,
+        'fields': {
+            'id': Volunteer.id,
+            'user_id': Volunteer.user_id,
+            'name': _name_of(User, Volunteer.user_id),
+            'category_id': Volunteer.category_id,
+            'is_available': Volunteer.is_available,
+            'total_tasks_completed': Volunteer.total_tasks_completed,
+            'latitude': Volunteer.latitude,
+            'longitude': Volunteer.longitude,
+        },
+        'filters': {
+            'category_id': (Volunteer.category_id, _int, '=='),
+            'available': (Volunteer.is_available, lambda v: v.lower() in ('1', 'true', 'yes'), '=='),
+        },
+        'roles': STAFF_ROLES,
+        'scope': {
+            'Volunteer': lambda user: Volunteer.user_id == user.id,
+        },
+    },
+    'reviews': {
+        'model': Review,
+        'fields': {
+            'id': Review.id,
+            'rating': Review.rating,
+            'comment': Review.comment,
+            'request_id': Review.request_id,
+            'volunteer_id': Review.volunteer_id,
+            'user_id': Review.user_id,
+            'date_created': Review.date_created,
+        },
+        'filters': {
+            'volunteer': (Review.volunteer_id, _int, '=='),
+            'owner': (Review.user_id, _int, '=='),
+            'request_id': (Review.request_id, _int, '=='),
+            'created_after': (Review.date_created, _date, '>='),
+            'created_before': (Review.date_created, _date, '<'),
+        },
+        'roles': {'Admin', 'Platform Manager'},
+        'scope': {
+            'PIN': lambda user: Review.user_id == user.id,
+            'Volunteer': lambda user: Review.volunteer_id == _own_volunteer_id(user),
+        },
+    },
+}
+
+_OPERATORS = {
+    '==': lambda col, v: col == v,
+    '>=': lambda col, v: col >= v,
+    '<': lambda col, v: col < v,
+}
+
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _error(message, code=400):
+    return jsonify({"error": message}), code
+
+
+def _list(resource_name):
+    resource = RESOURCES[resource_name]
+    model, fields, filters = resource['model'], resource['fields'], resource['filters']
+
+    # fields=a,b,c -> only those columns; id is always selected for the cursor
+    requested = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+    unknown = [f for f in requested if f not in fields]
+    if unknown:
+        return _error(f"Unknown field(s): {', '.join(unknown)}")
+    names = ['id'] + [f for f in (requested or fields) if f != 'id']
+
+    q = db.select(*[fields[n].label(n) for n in names]).select_from(model)
+    roles = resource['roles']
+    if roles is not None and current_user.role not in roles:
+        scope = resource['scope'].get(current_user.role)
+        if scope is None:
+            return _error("Unauthorized", 403)
+        q = q.where(scope(current_user))
+    for arg, (col, parse, op) in filters.items():
+        raw = request.args.get(arg)
+        if raw is None or raw == '':
+            continue
+        try:
+            q = q.where(_OPERATORS[op](col, parse(raw)))
+        except ValueError:
+            return _error(f"Invalid value for '{arg}'.")
+
+    try:
+        limit = min(max(int(request.args.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+    except ValueError:
+        return _error("Invalid value for 'limit'.")
+    descending = request.args.get('order', 'desc') != 'asc'
+
+    q = apply_keyset(q, [model.id], request.args.get('cursor'), descending)
+    rows, next_cursor = split_page(
+        db.session.execute(q.limit(limit + 1)).all(), limit, key=lambda row: [row[0]]
+    )
+
+    # rows are plain tuples in `names` order; no ORM objects are built
+    data = [{n: _json_value(v) for n, v in zip(names, row)} for row in rows]
+    return jsonify({"data": data, "next_cursor": next_cursor}), 200
+
+
+@api.route('/requests')
+@login_required
+def list_requests():
+    return _list('requests')
+
+
+@api.route('/categories')
+@login_required
+def list_categories():
+    return _list('categories')
+
+
+@api.route('/volunteers')
+@login_required
+def list_volunteers():
+    return _list('volunteers')
+
+
+@api.route('/reviews')
+@login_required
+def list_reviews():
+    return _list('reviews')
@@ -0,0 +1,137 @@
+from datetime import datetime, timedelta
+
+from . import db
+from .models import Request, RequestArchive, RequestLshBand, Review, ReviewArchive, Shortlist
+
+# Defaults, overridable through app.config / the archive_requests CLI
+DEFAULT_ARCHIVE_AFTER_DAYS = 90
+DEFAULT_BATCH_SIZE = 500
+
+_REQUEST_COLUMNS = [c.name for c in RequestArchive.__table__.columns if c.name != 'archived_at']
+_REVIEW_COLUMNS = [c.name for c in ReviewArchive.__table__.columns if c.name != 'archived_at']
+
+
+# --- Archival ---
+# Requests completed before the cut-off move, with their reviews, from the hot tables
+# (scanned by the home feed and the dashboards) to request_archive / review_archive.
+# Ids are kept, so links and reports still line up.
+
+def _archivable(cutoff):
+    # request/review use AUTOINCREMENT with their sequence kept past the archive's ids
+    # (website.schema), so archiving even the newest rows can't get their ids reissued
+    return db.select(Request.id).where(
+        Request.status == 'Completed',
+        Request.date_completed < cutoff,
+    )
+
+
+def archive_completed(older_than_days=DEFAULT_ARCHIVE_AFTER_DAYS, batch_size=DEFAULT_BATCH_SIZE, dry_run=False):
+    """Move requests completed more than older_than_days ago, and their reviews, to the archive.
+
+    Runs in batches of batch_size requests, each in its own short transaction, so the
+    hot tables are never locked for long. Shortlist entries for archived requests are
+    dropped. With dry_run=True only counts what would move.
+    Returns {'requests': n, 'reviews': n, 'batches': n}.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    candidates = _archivable(cutoff)
+
+    if dry_run:
+        ids = candidates.scalar_subquery()
+        return {
+            'requests': db.session.scalar(db.select(db.func.count()).select_from(candidates.subquery())),
+            'reviews': db.session.scalar(
+                db.select(db.func.count()).select_from(Review).where(Review.request_id.in_(ids))
+            ),
+            'batches': 0,
+        }
+
+    totals = {'requests': 0, 'reviews': 0, 'batches': 0}
+    while True:
+        ids = db.session.scalars(candidates.order_by(Request.id).limit(batch_size)).all()
+        if not ids:
+            return totals
+        now = datetime.utcnow()
+        try:
+            db.session.execute(db.insert(RequestArchive).from_select(
+                _REQUEST_COLUMNS + ['archived_at'],
+                db.select(*[Request.__table__.c[n] for n in _REQUEST_COLUMNS], db.literal(now))
+                .where(Request.id.in_(ids)),
+            ))
+            reviews = db.session.execute(db.insert(ReviewArchive).from_select(
+                _REVIEW_COLUMNS + ['archived_at'],
+                db.select(*[Review.__table__.c[n] for n in _REVIEW_COLUMNS], db.literal(now))
+                .where(Review.request_id.in_(ids)),
+            )).rowcount
+            for stmt in (
+                db.delete(Shortlist).where(Shortlist.shortlist_request_id.in_(ids)),
+                db.delete(Review).where(Review.request_id.in_(ids)),
+                db.delete(RequestLshBand).where(RequestLshBand.request_id.in_(ids)),
+                db.delete(Request).where(Request.id.in_(ids)),
+            ):
+                # 'fetch': rows loaded in this session are dropped from it too
+                db.session.execute(stmt.execution_options(synchronize_session='fetch'))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        totals['requests'] += len(ids)
+        totals['reviews'] += reviews
+        totals['batches'] += 1
+
+
+# --- Reads spanning hot + archive ---
+
+def archive_horizon():
+    """Creation date of the newest archived request, or None if nothing is archived.
+
+    Date ranges starting after it can't contain archived rows, so they skip the archive.
+    """
+    return db.session.scalar(db.select(db.func.max(RequestArchive.date_created)))
+
+
+def _newest_first(rows):
+    return sorted(rows, key=lambda r: r.date_created or datetime.min, reverse=True)
+
+
+def requests_between(start, end):
+    """Requests (hot and, when the range reaches back that far, archived) created in [start, end]."""
+    rows = Request.query.filter(Request.date_created.between(start, end)).all()
+    horizon = archive_horizon()
+    if horizon is not None and start <= horizon:
+        rows += RequestArchive.query.filter(RequestArchive.date_created.between(start, end)).all()
+    return rows
+
+
+def requests_for_user(user_id):
+    """A PIN's full request history, newest first."""
+    return _newest_first(
+        Request.query.filter_by(user_id=user_id).all()
+        + RequestArchive.query.filter_by(user_id=user_id).all()
+    )
+
+
+def completed_for_volunteer(volunteer_id):
+    """A volunteer's completed requests, newest first."""
+    return _newest_first(
+        Request.query.filter_by(volunteer_id=volunteer_id, status='Completed').all()
+        + RequestArchive.query.filter_by(volunteer_id=volunteer_id).all()
+    )
+
+
+def all_ratings():
+    """(volunteer_id, rating) rows from hot and archived reviews, as a subquery."""
+    return db.union_all(
+        db.select(Review.volunteer_id, Review.rating),
+        db.select(ReviewArchive.volunteer_id, ReviewArchive.rating),
+    ).subquery()
+
+
+def review_stats(volunteer_id=None):
+    """(count, average rating) over hot and archived reviews, optionally for one volunteer."""
+    ratings = all_ratings()
+    q = db.select(db.func.count(), db.func.avg(ratings.c.rating))
+    if volunteer_id is not None:
+        q = q.where(ratings.c.volunteer_id == volunteer_id)
+    count, avg = db.session.execute(q).one()
+    return count, (float(avg) if avg is not None else None)
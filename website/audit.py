@@ -0,0 +1,163 @@
+import atexit
+import os
+import queue
+import threading
+from datetime import datetime
+
+from flask import request
+
+from . import db
+from .models import AuthEvent
+
+# Event names stored in AuthEvent.event
+LOGIN_SUCCESS = 'login_success'
+LOGIN_FAILURE = 'login_failure'
+LOGOUT = 'logout'
+
+# Defaults, overridable through app.config
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_FLUSH_INTERVAL = 1.0  # seconds
+DEFAULT_QUEUE_SIZE = 10000
+
+
+class AuthEventWriter:
+    """Buffers auth events in memory and inserts them in batches from a background thread.
+
+    The request path only does a non-blocking queue put; the writer thread is started
+    lazily (per process, so it also works after a pre-fork server forks workers).
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.batch_size = app.config.get('AUTH_LOG_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        self.flush_interval = app.config.get('AUTH_LOG_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+        self._queue = queue.Queue(maxsize=app.config.get('AUTH_LOG_QUEUE_SIZE', DEFAULT_QUEUE_SIZE))
+        app.extensions['auth_event_writer'] = self
+        atexit.register(self.flush)
+
+    # ----- producer side -----
+    def record(self, event, user=None, email=None):
+        row = {
+            'user_id': getattr(user, 'id', None),
+            'email': email if email is not None else getattr(user, 'email', None),
+            'event': event,
+            'role': getattr(user, 'role', None),
+            'ip': _client_ip(),
+            'timestamp': datetime.utcnow(),
+        }
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            # never block a login on the audit log
+            self.dropped += 1
+
+    # ----- consumer side -----
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='auth-event-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = [first]
+            batch.extend(self._drain(self.batch_size - 1))
+            self._write(batch)
+
+    def _drain(self, limit):
+        rows = []
+        while len(rows) < limit:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _write(self, rows):
+        if not rows:
+            return
+        with self.app.app_context():
+            try:
+                db.session.execute(db.insert(AuthEvent), rows)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print("Error writing auth events:", e)
+            finally:
+                db.session.remove()
+
+    def flush(self):
+        """Synchronously write everything still queued (used at exit and by the CLI)."""
+        if self._queue is None:
+            return 0
+        written = 0
+        while True:
+            rows = self._drain(self.batch_size)
+            if not rows:
+                return written
+            self._write(rows)
+            written += len(rows)
+
+
+writer = AuthEventWriter()
+
+
+def _client_ip():
+    try:
+        forwarded = request.headers.get('X-Forwarded-For', '')
+        if forwarded:
+            return forwarded.split(',')[0].strip()[:45]
+        return (request.remote_addr or '')[:45] or None
+    except RuntimeError:
+        # outside a request context (CLI)
+        return None
+
+
+def record_login(user, success=True, email=None):
+    writer.record(LOGIN_SUCCESS if success else LOGIN_FAILURE, user=user, email=email)
+
+
+def record_logout(user):
+    writer.record(LOGOUT, user=user)
+
+
+def query_events(user_id=None, start=None, end=None, event=None, before_id=None, limit=100):
+    """Newest-first auth events, read in (timestamp, id) order off the (user_id, timestamp)
+    or (timestamp) index, so no sort is needed.
+
+    before_id is the id of the last row of the previous page (keyset pagination): the page
+    continues below that row's (timestamp, id).
+    """
+    q = db.select(AuthEvent)
+    if user_id is not None:
+        q = q.where(AuthEvent.user_id == user_id)
+    if start is not None:
+        q = q.where(AuthEvent.timestamp >= start)
+    if end is not None:
+        q = q.where(AuthEvent.timestamp <= end)
+    if event:
+        q = q.where(AuthEvent.event == event)
+    if before_id is not None:
+        last_ts = db.select(AuthEvent.timestamp).where(AuthEvent.id == before_id).scalar_subquery()
+        q = q.where(db.tuple_(AuthEvent.timestamp, AuthEvent.id) < db.tuple_(last_ts, before_id))
+    q = q.order_by(AuthEvent.timestamp.desc(), AuthEvent.id.desc()).limit(limit)
+    return db.session.scalars(q).all()
@@ -1,8 +1,10 @@
-import datetime
 from flask import Blueprint, Request, render_template, request, flash, redirect, url_for
-from .models import Category, Review, User, Volunteer, Logout, Shortlist, Csr
-from .models import Request as RequestModel
+from .models import User, Volunteer, Csr
 from . import db
+from . import audit
+from . import cascade
+from . import skills
+from .category_cache import categories as category_cache
 from werkzeug.security import generate_password_hash, check_password_hash
 
 from flask_login import login_user, logout_user, login_required, current_user
@@ -13,7 +15,7 @@ auth = Blueprint('auth', __name__)
 # CREATE Account
 @auth.route('/signup', methods=['GET', 'POST'])
 def sign_up():
-    categories = Category.query.all()
+    categories = category_cache.all()
 
     if request.method == 'POST':
         email = request.form.get('email')
@@ -22,7 +24,8 @@ def sign_up():
         username = request.form.get('userName')
         role = request.form.get('role')
 
-        category_id = request.form.get('categories')
+        # volunteers may cover several categories; the first becomes their primary one
+        skill_ids = skills.parse_skill_ids(request.form.getlist('categories'), category_cache.get)
 
         user = User.query.filter_by(email=email).first()
         if user:
@@ -50,9 +53,11 @@ def sign_up():
 
             if role == 'Volunteer':
                 # Create Volunteer profile
-                new_volunteer = Volunteer(user_id=new_user.id, category_id=int(category_id) if category_id else None)  #
+                new_volunteer = Volunteer(user_id=new_user.id, category_id=skill_ids[0] if skill_ids else None)  #
 
                 db.session.add(new_volunteer)
+                db.session.flush()
+                skills.set_skills(new_volunteer, skill_ids)
                 db.session.commit()
 
             if role == 'CSR':
@@ -87,10 +92,13 @@ def login():
 
                 flash('Logged in successfully!', category='success')
                 login_user(user, remember=True)
+                audit.record_login(user)
                 return redirect(url_for('views.home'))
             else:
+                audit.record_login(user, success=False)
                 flash('Incorrect password, try again.', category='danger')
         else:
+            audit.record_login(None, success=False, email=email)
             flash('Email does not exist. Create account first!', category='danger')
 
     return render_template("login.html")
@@ -99,12 +107,9 @@ def login():
 # Logout User Account
 @auth.route('/logout')
 def logout():
-    userid = current_user.id
-    logout_datetime = datetime.datetime.now()
-
-    logout_info = Logout(user_id=userid, DateTime=logout_datetime)
-    db.session.add(logout_info)
-    db.session.commit()
+    # queued for the background writer, no commit on the request path
+    if current_user.is_authenticated:
+        audit.record_logout(current_user)
     logout_user()
     flash('Logged out successfully!', category='success')
     return redirect(url_for('auth.login'))
@@ -121,43 +126,14 @@ def delete_account():
         return redirect(url_for('views.manager_profile'))
 
     try:
-        user_id = user.id
-        user_role = user.role
-
-        # 1.user is a volunteer
-        if user_role == 'Volunteer':
-            volunteer = Volunteer.query.filter_by(user_id=user_id).first()
-            
-            if volunteer:
-                # Unassign all requests assigned to this volunteer
-                assigned_requests = RequestModel.query.filter_by(volunteer_id=volunteer.id).all()
-                for req in assigned_requests:
-                    req.volunteer_id = None
-                    req.status = 'Pending'  # Reset status back to Pending
-                
-                # Delete all reviews for this volunteer
-                Review.query.filter_by(volunteer_id=volunteer.id).delete()
-                
-                # Delete the volunteer profile
-                db.session.delete(volunteer)
-        
-        # 2. Delete all reviews written by this user (if PIN)
-        Review.query.filter_by(user_id=user_id).delete()
-        # 3. Delete all user's requests
-        RequestModel.query.filter_by(user_id=user_id).delete()
-        # 4. Finally, delete the user
-        
-        db.session.delete(user)
-    
-        # 5. Commit all changes
-        db.session.commit()
+        # One transaction of set-based deletes over every table that references the user
+        cascade.delete_user(user.id)
         # Logoout User
         logout_user()
         flash('Your account has been deleted successfully.', category='success')
         return redirect(url_for('auth.login'))
 
     except Exception as e:
-        db.session.rollback()
         flash('An error occurred while deleting your account. Please try again.', category='danger')
         print("Error deleting account:", e)
         print("Error type:", type(e).__name__)
@@ -0,0 +1,46 @@
+import os
+
+from werkzeug.security import generate_password_hash
+
+from . import db
+from . import duplicates
+from .models import User
+from .schema import upgrade_schema
+
+
+def init_database(echo=print):
+    """One-time setup: instance folder, schema (create or upgrade) and the default admin.
+
+    Run through `flask init` (or main.py's dev server) rather than at app creation, so
+    worker processes start without touching the database. Safe to run repeatedly.
+    """
+    db_path = db.engine.url.database
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)  # make sure folder exists
+
+    if not os.path.exists(db_path):
+        db.create_all()
+        echo(f"Created database at: {db_path}")
+    else:
+        # add tables/columns/indexes introduced since the DB was made
+        upgrade_schema()
+        echo(f"Database already exists at: {db_path} (schema upgraded)")
+        if duplicates.refresh_if_stale():
+            echo("Recomputed near-duplicate signatures.")
+
+    # create admin once
+    exists_admin = db.session.scalar(
+        db.select(User.id).where(User.role == "Admin")
+    )
+    if not exists_admin:
+        admin_user = User(
+            name="Admin",
+            email="admin",
+            password=generate_password_hash("admin", method="pbkdf2:sha256"),
+            role="Admin",
+            status="Active",
+        )
+        db.session.add(admin_user)
+        db.session.commit()
+        echo("Admin account created.")
+    else:
+        echo("Admin account already exists.")
@@ -0,0 +1,260 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy.exc import SQLAlchemyError
+
+from . import db
+from . import duplicates
+from . import feed
+from . import geo
+from . import rollups
+from .category_cache import categories as category_cache
+from .models import Request, RequestLshBand
+
+FORMATS = ('csv', 'ndjson')
+
+# Rows per transaction: a failed chunk only loses that chunk, and memory stays flat
+DEFAULT_CHUNK_SIZE = 1000
+
+# Row errors kept for the report (all of them are counted)
+MAX_REPORTED_ERRORS = 200
+
+TITLE_MAX_LENGTH = Request.__table__.c.title.type.length
+
+_request = Request.__table__
+
+
+class ImportFormatError(ValueError):
+    """The file as a whole can't be read (unknown format, missing columns)."""
+
+
+def format_for(filename, default='csv'):
+    """'csv' or 'ndjson' from a file name's extension."""
+    name = (filename or '').lower()
+    if name.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    if name.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+# --- Reading ---
+# Both readers yield (line number, dict) one record at a time from a text stream, so a
+# file is never held in memory.
+
+def _csv_records(stream):
+    reader = csv.DictReader(stream)
+    if not reader.fieldnames or not {'title', 'description'} <= {f.strip().lower() for f in reader.fieldnames}:
+        raise ImportFormatError('The CSV header must include at least title and description.')
+    for record in reader:
+        yield reader.line_num, {(k or '').strip().lower(): v for k, v in record.items()}
+
+
+def _ndjson_records(stream):
+    for line_no, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line_no, None
+            continue
+        yield line_no, record if isinstance(record, dict) else None
+
+
+def records(stream, fmt):
+    if fmt == 'csv':
+        return _csv_records(stream)
+    if fmt == 'ndjson':
+        return _ndjson_records(stream)
+    raise ImportFormatError(f"Unknown format '{fmt}' (use csv or ndjson).")
+
+
+def text_stream(binary):
+    """Text view of an uploaded/opened binary file (UTF-8, BOM tolerated), read lazily."""
+    return io.TextIOWrapper(binary, encoding='utf-8-sig', newline='')
+
+
+# --- Validation ---
+
+def _text(record, key):
+    value = record.get(key)
+    return '' if value is None else str(value).strip()
+
+
+def _category_map():
+    """{lower-cased name or id as text: id}, from the category cache (no query per row)."""
+    by_key = {}
+    for cat in category_cache.all():
+        by_key[cat.name.lower()] = cat.id
+        by_key[str(cat.id)] = cat.id
+    return by_key
+
+
+def validate(record, categories):
+    """Column values for one record, or raise ValueError with a message for the report."""
+    if record is None:
+        raise ValueError('Not a JSON object.')
+    title = _text(record, 'title')
+    description = _text(record, 'description')
+    if not title:
+        raise ValueError('Title is required.')
+    if len(title) > TITLE_MAX_LENGTH:
+        raise ValueError(f'Title is longer than {TITLE_MAX_LENGTH} characters.')
+    if not description:
+        raise ValueError('Description is required.')
+
+    category = _text(record, 'category') or _text(record, 'category_id')
+    category_id = categories.get(category.lower())
+    if category_id is None:
+        raise ValueError(f"Unknown category '{category}'." if category else 'Category is required.')
+
+    scheduled = _text(record, 'scheduled_datetime')
+    if not scheduled:
+        raise ValueError('scheduled_datetime is required.')
+    try:
+        scheduled_datetime = datetime.fromisoformat(scheduled)
+    except ValueError:
+        raise ValueError(f"Invalid scheduled_datetime '{scheduled}' (use YYYY-MM-DDTHH:MM).")
+
+    latitude, longitude = geo.parse_coordinates(_text(record, 'latitude'), _text(record, 'longitude'))
+
+    return {
+        'title': title,
+        'description': description,
+        'category_id': category_id,
+        'scheduled_datetime': scheduled_datetime,
+        'latitude': latitude,
+        'longitude': longitude,
+    }
+
+
+# --- Writing ---
+
+def _insert_chunk(rows, user_id, now, duplicate_action):
+    """Insert validated rows in the current transaction and bring the derived tables along.
+
+    One executemany INSERT for the requests; mapper events don't run for it, so the daily
+    rollup, CSR feeds and near-duplicate bands are updated here with set-based statements
+    over the new rows (the request_title stamp and the change markers pick the INSERT up
+    on their own).
+
+    Each row is then checked for near-duplicates among the older open requests, earlier
+    rows of the file included, as create_request would: with duplicate_action 'flag' the
+    best match goes in duplicate_of, with 'block' the row is dropped again. Returns
+    ([(position in rows, duplicate_of)] of the dropped rows, number of flagged rows).
+    """
+    for row in rows:
+        row.update(
+            user_id=user_id,
+            status='Pending',
+            date_created=now,
+            view_count=0,
+            shortlist_count=0,
+            version=1,
+            minhash=duplicates.signature(row['title'], row['description']),
+        )
+    last_id = db.session.scalar(db.select(db.func.max(Request.id))) or 0
+    db.session.execute(db.insert(Request), rows)
+    # this chunk's rows: new ids, this owner, this chunk's timestamp
+    new = (Request.id > last_id) & (Request.user_id == user_id) & (Request.date_created == now)
+    inserted = db.session.execute(
+        db.select(Request.id, Request.minhash).where(new).order_by(Request.id)
+    ).all()
+    duplicates.add_bands(db.session, [(row.id, row.minhash) for row in inserted])
+
+    blocked, flagged = [], []
+    if duplicate_action != 'off':
+        found = duplicates.find_many([row.id for row in inserted])
+        dropped = set()
+        for position, row in enumerate(inserted):
+            matches = [(match_id, score) for match_id, score in found.get(row.id, ()) if match_id not in dropped]
+            if not matches:
+                continue
+            if duplicate_action == 'block':
+                dropped.add(row.id)
+                blocked.append((position, matches[0][0]))
+            else:
+                flagged.append({'rid': row.id, 'dup': matches[0][0]})
+    if flagged:
+        db.session.execute(
+            _request.update().where(_request.c.id == db.bindparam('rid')).values(duplicate_of=db.bindparam('dup')),
+            flagged,
+        )
+    if blocked:
+        blocked_ids = [inserted[position].id for position, _ in blocked]
+        db.session.execute(db.delete(RequestLshBand).where(RequestLshBand.request_id.in_(blocked_ids)))
+        db.session.execute(_request.delete().where(_request.c.id.in_(blocked_ids)))
+
+    rollups.adjust_where(Request, new, sign=1)
+    feed.sync_requests(db.session, new)
+    return blocked, len(flagged)
+
+
+def import_requests(stream, fmt, user_id, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Create Pending requests owned by user_id from a CSV or NDJSON text stream.
+
+    Columns: title, description, category (name or id), scheduled_datetime (ISO 8601),
+    optional latitude/longitude. Invalid rows are skipped and reported; valid ones are
+    inserted chunk_size at a time, each chunk in its own transaction. Near-duplicates are
+    handled as DUPLICATE_REQUEST_ACTION says (blocked ones are reported as skipped rows).
+
+    A chunk the database rejects is rolled back and reported (its rows count as failed)
+    and the import goes on with the next one. If the file stops being readable part way
+    (bad encoding), what was read so far is still imported and 'stopped' says where and
+    why; chunks committed before stay committed either way.
+
+    Returns {'imported': n, 'failed': n, 'flagged': n, 'errors': [(line, message)],
+    'chunks': n, 'stopped': message or None}; row errors are capped at MAX_REPORTED_ERRORS.
+    """
+    categories = _category_map()
+    duplicate_action = current_app.config.get('DUPLICATE_REQUEST_ACTION', duplicates.DEFAULT_ACTION)
+    result = {'imported': 0, 'failed': 0, 'flagged': 0, 'errors': [], 'chunks': 0, 'stopped': None}
+
+    def fail(line_no, message):
+        result['failed'] += 1
+        if len(result['errors']) < MAX_REPORTED_ERRORS:
+            result['errors'].append((line_no, message))
+
+    def flush(chunk, lines):
+        try:
+            blocked, flagged = _insert_chunk(chunk, user_id, datetime.utcnow(), duplicate_action)
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            result['failed'] += len(chunk)
+            # always listed, whatever the row error cap: it accounts for a whole chunk
+            result['errors'].append(
+                (lines[0], f"Lines {lines[0]}-{lines[-1]} were not imported: {getattr(e, 'orig', None) or e}"))
+            return
+        except Exception:
+            db.session.rollback()
+            raise
+        for position, duplicate_of in blocked:
+            fail(lines[position], f'Looks like a duplicate of request #{duplicate_of}.')
+        result['imported'] += len(chunk) - len(blocked)
+        result['flagged'] += flagged
+        result['chunks'] += 1
+
+    chunk, lines = [], []
+    line_no = 0
+    try:
+        for line_no, record in records(stream, fmt):
+            try:
+                chunk.append(validate(record, categories))
+            except ValueError as e:
+                fail(line_no, str(e))
+                continue
+            lines.append(line_no)
+            if len(chunk) >= chunk_size:
+                flush(chunk, lines)
+                chunk, lines = [], []
+    except UnicodeDecodeError as e:
+        where = f' after line {line_no}' if line_no else ''
+        result['stopped'] = f'Could not read the file{where}: {e}'
+    if chunk:
+        flush(chunk, lines)
+    return result
@@ -0,0 +1,122 @@
+from . import db
+from . import feed
+from . import rollups
+from .models import (User, Volunteer, VolunteerSkill, Request, RequestLshBand, Review, Shortlist, Csr,
+                     RequestArchive, ReviewArchive)
+
+
+def _user_steps(conds):
+    """Ordered (name, model, statement) list deleting the users matching conds and their data.
+
+    Every statement is keyed on id subqueries, so nothing is loaded into Python no matter
+    how many requests, reviews or shortlist entries the users have. Children go first
+    so foreign keys are never left dangling.
+    """
+    user_ids = db.select(User.id).where(*conds).scalar_subquery()
+    vol_ids = db.select(Volunteer.id).where(Volunteer.user_id.in_(user_ids)).scalar_subquery()
+    owned_req_ids = db.select(Request.id).where(Request.user_id.in_(user_ids)).scalar_subquery()
+    owned_archived_ids = db.select(RequestArchive.id).where(RequestArchive.user_id.in_(user_ids)).scalar_subquery()
+
+    return [
+        # reviews of their requests, for them as volunteer, or written by them
+        ('reviews', Review, db.delete(Review).where(
+            Review.request_id.in_(owned_req_ids)
+            | Review.volunteer_id.in_(vol_ids)
+            | Review.user_id.in_(user_ids)
+        )),
+        # keep Request.shortlist_count in step with the shortlist rows removed next
+        ('shortlist_counts', Request, db.update(Request)
+            .where(Request.id.in_(
+                db.select(Shortlist.shortlist_request_id).where(Shortlist.user_id.in_(user_ids))
+            ))
+            .values(shortlist_count=Request.shortlist_count - (
+                db.select(db.func.count())
+                .select_from(Shortlist)
+                .where(Shortlist.shortlist_request_id == Request.id, Shortlist.user_id.in_(user_ids))
+                .scalar_subquery()
+            ), version=Request.version + 1)),
+        # shortlist entries made by them (CSR) or pointing at their requests
+        ('shortlists', Shortlist, db.delete(Shortlist).where(
+            Shortlist.user_id.in_(user_ids) | Shortlist.shortlist_request_id.in_(owned_req_ids)
+        )),
+        ('request_lsh_bands', RequestLshBand, db.delete(RequestLshBand).where(
+            RequestLshBand.request_id.in_(owned_req_ids)
+        )),
+        ('requests', Request, db.delete(Request).where(Request.user_id.in_(user_ids))),
+        # work assigned to deleted volunteers goes back to Pending
+        ('unassigned_requests', Request, db.update(Request)
+            .where(Request.volunteer_id.in_(vol_ids))
+            .values(volunteer_id=None, status='Pending', version=Request.version + 1,
+                    # a status change: forms rendered before it must fail their CAS
+                    state_version=Request.state_version + 1)),
+        # requests handled by deleted CSRs lose their CSR
+        ('csr_cleared_requests', Request, db.update(Request)
+            .where(Request.csr_id.in_(user_ids))
+            .values(csr_id=None, version=Request.version + 1)),
+        # the same for archived requests and reviews
+        ('archived_reviews', ReviewArchive, db.delete(ReviewArchive).where(
+            ReviewArchive.request_id.in_(owned_archived_ids)
+            | ReviewArchive.volunteer_id.in_(vol_ids)
+            | ReviewArchive.user_id.in_(user_ids)
+        )),
+        ('archived_requests', RequestArchive, db.delete(RequestArchive).where(RequestArchive.user_id.in_(user_ids))),
+        ('archived_unassigned', RequestArchive, db.update(RequestArchive)
+            .where(RequestArchive.volunteer_id.in_(vol_ids))
+            .values(volunteer_id=None)),
+        ('archived_csr_cleared', RequestArchive, db.update(RequestArchive)
+            .where(RequestArchive.csr_id.in_(user_ids))
+            .values(csr_id=None)),
+        ('volunteer_skills', VolunteerSkill, db.delete(VolunteerSkill).where(VolunteerSkill.volunteer_id.in_(vol_ids))),
+        ('volunteers', Volunteer, db.delete(Volunteer).where(Volunteer.user_id.in_(user_ids))),
+        ('csr_profiles', Csr, db.delete(Csr).where(Csr.user_id.in_(user_ids))),
+        ('users', User, db.delete(User).where(User.id.in_(user_ids))),
+    ]
+
+
+def _adjust_rollups(conds):
+    """Take the requests the steps delete or reset out of the daily rollup (before they run)."""
+    user_ids = db.select(User.id).where(*conds).scalar_subquery()
+    vol_ids = db.select(Volunteer.id).where(Volunteer.user_id.in_(user_ids)).scalar_subquery()
+    rollups.adjust_where(Request, Request.user_id.in_(user_ids))
+    rollups.adjust_where(RequestArchive, RequestArchive.user_id.in_(user_ids))
+    # requests assigned to deleted volunteers move to Pending
+    unassigned = Request.volunteer_id.in_(vol_ids) & Request.user_id.not_in(user_ids)
+    rollups.adjust_where(Request, unassigned)
+    rollups.adjust_where(Request, unassigned, sign=1, status='Pending')
+
+
+def delete_users(conds, dry_run=False):
+    """Delete the users matching conds (WHERE conditions on User) and everything that depends on them.
+
+    All statements run in one transaction, committed at the end and rolled back on error.
+    With dry_run=True nothing is changed and the counts of rows each step would touch
+    are returned instead. Returns {step name: row count} in execution order.
+    """
+    steps = _user_steps(conds)
+
+    if dry_run:
+        # count each step against the untouched tables
+        return {
+            name: db.session.scalar(
+                db.select(db.func.count()).select_from(model).where(stmt.whereclause)
+            )
+            for name, model, stmt in steps
+        }
+
+    counts = {}
+    try:
+        _adjust_rollups(conds)
+        feed.forget_users(conds)
+        for name, model, stmt in steps:
+            result = db.session.execute(stmt.execution_options(synchronize_session=False))
+            counts[name] = result.rowcount
+        # commit also expires objects the bulk statements made stale
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return counts
+
+
+def delete_user(user_id, dry_run=False):
+    return delete_users([User.id == user_id], dry_run=dry_run)
@@ -0,0 +1,69 @@
+import threading
+from collections import namedtuple
+
+from . import db
+from . import changes
+from . import read_routing
+from .models import Category
+
+# Lightweight stand-in for Category rows; templates use .id, .name and .description
+CategoryInfo = namedtuple('CategoryInfo', ['id', 'name', 'description'])
+
+_Snapshot = namedtuple('_Snapshot', ['stamp', 'by_id', 'sorted', 'by_lower_name'])
+
+
+class CategoryCache:
+    """Per-process copy of the category table, reloaded only when it changed.
+
+    Every commit touching `category` (routes, seed CLI, another worker) rewrites the
+    category stamp file through website.changes; reads compare that stamp and only
+    query the database when it differs. The stamp is read once per request, so a page
+    doing hundreds of lookups pays a single file read, not a query or a read each.
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def _current(self):
+        current_stamp = changes.request_stamp('category')
+        snap = self._snapshot
+        if snap is not None and snap.stamp == current_stamp:
+            return snap
+        with self._lock:
+            snap = self._snapshot
+            if snap is not None and snap.stamp == current_stamp:
+                return snap
+            rows = db.session.execute(
+                db.select(Category.id, Category.name, Category.description).order_by(Category.name),
+                bind_arguments=read_routing.primary(),
+            ).all()
+            ordered = [CategoryInfo(*row) for row in rows]
+            snap = _Snapshot(
+                stamp=current_stamp,
+                by_id={c.id: c for c in ordered},
+                sorted=ordered,
+                by_lower_name={c.name.lower(): c for c in ordered},
+            )
+            self._snapshot = snap
+            return snap
+
+    def all(self):
+        """Categories sorted by name."""
+        return self._current().sorted
+
+    def get(self, category_id):
+        try:
+            return self._current().by_id.get(int(category_id))
+        except (TypeError, ValueError):
+            return None
+
+    def by_name(self, name):
+        """Case-insensitive lookup by name."""
+        return self._current().by_lower_name.get((name or '').strip().lower())
+
+    def invalidate(self):
+        self._snapshot = None
+
+
+categories = CategoryCache()
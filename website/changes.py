@@ -0,0 +1,233 @@
+import hashlib
+import os
+import time
+import uuid
+from datetime import datetime
+from functools import wraps
+
+from flask import g, has_app_context, make_response, request, session
+from flask_login import current_user
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from . import db
+from .models import ChangeMarker
+
+# Tables whose writes don't affect any page, so they don't bump a marker
+UNTRACKED_TABLES = {'change_marker', 'auth_event', 'request_event', 'csr_affinity', 'csr_feed',
+                    'request_lsh_band'}
+
+# Tables whose commits also rewrite a stamp file (instance/stamps/<table>), so in-process
+# caches in every worker can detect changes with a tiny file read instead of a query
+STAMPED_TABLES = {'category', 'volunteer_skill'}
+
+# Finer-grained stamps other modules rewrite themselves (website.skills); bump_all
+# rewrites them too
+DERIVED_STAMPS = {'volunteer_availability'}
+
+# Columns that only count activity (views, trending, shortlists). An ORM update touching
+# nothing else bumps '<table>_counters' instead of the table's own marker, so a page view
+# doesn't invalidate every page listing requests; pages that order by these columns
+# depend on the counters marker too (see conditional_get's `extra`).
+COUNTER_COLUMNS = {'request': {'view_count', 'trending_score', 'shortlist_count', 'version'}}
+
+STAMP_DIR_NAME = 'stamps'
+
+_SESSION_KEY = 'changed_tables'
+_STAMPS_KEY = '_change_stamps'
+_COMMITTING_KEY = 'committing_tables'
+
+
+# --- Tracking writes ---
+# Every ORM flush and every ORM-level bulk INSERT/UPDATE/DELETE records the tables it
+# touched; just before commit the matching ChangeMarker rows are bumped in the same
+# transaction, so the markers can't drift from the data and work across processes.
+
+def _note(session, table_name):
+    if table_name not in UNTRACKED_TABLES:
+        session.info.setdefault(_SESSION_KEY, set()).add(table_name)
+
+
+def note(session, table_name):
+    """Record a write the hooks can't see (Core statements on the flush connection)."""
+    _note(session, table_name)
+
+
+def _counters_only(obj, table_name):
+    counters = COUNTER_COLUMNS.get(table_name)
+    if not counters:
+        return False
+    state = inspect(obj)
+    changed = {attr.key for attr in state.attrs if attr.history.has_changes()}
+    return bool(changed) and changed <= counters
+
+
+def _after_flush(session, flush_context):
+    for obj in (*session.new, *session.deleted):
+        table = getattr(obj, '__table__', None)
+        if table is not None:
+            _note(session, table.name)
+    for obj in session.dirty:
+        table = getattr(obj, '__table__', None)
+        if table is not None:
+            _note(session, f'{table.name}_counters' if _counters_only(obj, table.name) else table.name)
+
+
+def _do_orm_execute(state):
+    if (state.is_insert or state.is_update or state.is_delete) and state.bind_mapper is not None:
+        _note(state.session, state.bind_mapper.local_table.name)
+
+
+def _before_commit(session):
+    # flush first so changes flushed by commit itself are noted too
+    session.flush()
+    tables = session.info.pop(_SESSION_KEY, None)
+    if tables:
+        bump(session, tables)
+        session.info[_COMMITTING_KEY] = tables
+
+
+def _after_commit(session):
+    for table in session.info.pop(_COMMITTING_KEY, set()) & STAMPED_TABLES:
+        touch_stamp(table)
+
+
+def _after_rollback(session):
+    session.info.pop(_SESSION_KEY, None)
+    session.info.pop(_COMMITTING_KEY, None)
+
+
+def _stamp_path(table):
+    database = db.engine.url.database
+    if not database or database == ':memory:':
+        return None
+    return os.path.join(os.path.dirname(os.path.abspath(database)), STAMP_DIR_NAME, table)
+
+
+def touch_stamp(table):
+    """Give a table's stamp file new unique contents (atomic rename, so readers never see it empty)."""
+    path = _stamp_path(table)
+    if path is None:
+        return
+    if has_app_context():
+        g.pop(_STAMPS_KEY, None)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        f.write(f"{time.time_ns()}-{os.getpid()}-{uuid.uuid4().hex}")
+    os.replace(tmp, path)
+
+
+def stamp(table):
+    """Current contents of a table's stamp file; '' if it was never touched."""
+    path = _stamp_path(table)
+    if path is None:
+        return ''
+    try:
+        with open(path) as f:
+            return f.read()
+    except FileNotFoundError:
+        return ''
+
+
+def request_stamp(table):
+    """stamp(table), read once per request (app context) and reused by every lookup in it.
+
+    Caches validating against it serve a whole page from one snapshot for the price of
+    one file read; a commit of this process rewriting the stamp drops the saved values.
+    """
+    if not has_app_context():
+        return stamp(table)
+    stamps = g.setdefault(_STAMPS_KEY, {})
+    if table not in stamps:
+        stamps[table] = stamp(table)
+    return stamps[table]
+
+
+def bump(session, tables):
+    """Increment the markers for tables (creating them on first use)."""
+    now = datetime.utcnow()
+    stmt = sqlite_insert(ChangeMarker.__table__).values(
+        [{'name': name, 'version': 1, 'updated_at': now} for name in sorted(tables)]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['name'],
+        set_={'version': ChangeMarker.__table__.c.version + 1, 'updated_at': now},
+    )
+    # Core table statement: doesn't re-enter _do_orm_execute
+    session.execute(stmt)
+
+
+def bump_all():
+    """Invalidate every marker, for out-of-band changes (snapshot restore, clearing the DB)."""
+    names = [t.name for t in db.metadata.sorted_tables if t.name not in UNTRACKED_TABLES]
+    bump(db.session, names + [f'{name}_counters' for name in COUNTER_COLUMNS])
+    db.session.commit()
+    for table in STAMPED_TABLES | DERIVED_STAMPS:
+        touch_stamp(table)
+
+
+def init_app(app):
+    if getattr(Session, '_change_tracking', False):
+        return
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'do_orm_execute', _do_orm_execute)
+    event.listen(Session, 'before_commit', _before_commit)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
+    Session._change_tracking = True
+
+
+def markers(*tables):
+    """{table: (version, updated_at)} for the given tables, in one query."""
+    rows = db.session.execute(
+        db.select(ChangeMarker.name, ChangeMarker.version, ChangeMarker.updated_at)
+        .where(ChangeMarker.name.in_(tables))
+    ).all()
+    found = {name: (version, updated_at) for name, version, updated_at in rows}
+    return {t: found.get(t, (0, None)) for t in tables}
+
+
+# --- Conditional GET ---
+
+def conditional_get(*base_tables, extra=None):
+    """Answer repeat GETs with 304 when none of `tables` changed since the client's copy.
+
+    The ETag covers the table markers, the viewer (id, role, status) and the full URL,
+    and is computed with one small query before the view runs, so a 304 skips the
+    page's own queries and template rendering entirely. `extra` is an optional callable
+    returning more markers for the current request (e.g. 'request_counters' for a
+    listing sorted by views).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # pages with pending flash messages must render them
+            if (request.method != 'GET' or not current_user.is_authenticated
+                    or session.get('_flashes')):
+                return view(*args, **kwargs)
+
+            tables = base_tables + tuple(extra() if extra is not None else ())
+            state = markers(*tables)
+            viewer = f"{current_user.id}:{current_user.role}:{current_user.status}"
+            raw = '|'.join([viewer, request.full_path] + [f"{t}={state[t][0]}" for t in tables])
+            etag = hashlib.sha1(raw.encode('utf-8')).hexdigest()
+            stamps = [ts for _, ts in state.values() if ts is not None]
+            last_modified = max(stamps) if stamps else None
+
+            # weak match: compressed responses carry the weak form of the tag
+            if request.if_none_match.contains_weak(etag):
+                resp = make_response('', 304)
+            else:
+                resp = make_response(view(*args, **kwargs))
+                if resp.status_code != 200:
+                    return resp
+            resp.set_etag(etag)
+            if last_modified is not None:
+                resp.last_modified = last_modified
+            # always revalidate; the check itself is the cheap part
+            resp.headers['Cache-Control'] = 'private, no-cache'
+            return resp
+        return wrapper
+    return decorator
@@ -0,0 +1,183 @@
+import zlib
+
+from flask import request
+
+# Optional encoders: used when the package is installed, otherwise only gzip is offered
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+DEFAULT_MIMETYPES = (
+    'text/html',
+    'text/css',
+    'text/csv',
+    'text/plain',
+    'text/javascript',
+    'application/javascript',
+    'application/json',
+    'application/x-ndjson',
+    'image/svg+xml',
+)
+
+# Preference order when the client accepts several encodings equally
+DEFAULT_ALGORITHMS = ('zstd', 'br', 'gzip')
+
+
+# --- Encoders ---
+# Each returns an object with compress(chunk) -> bytes and finish() -> bytes; compress()
+# flushes a block per chunk so streamed responses reach the client as they are produced.
+
+class _Gzip:
+    def __init__(self, level, flush):
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)
+        self._flush = flush
+
+    def compress(self, chunk):
+        data = self._obj.compress(chunk)
+        return data + self._obj.flush(zlib.Z_SYNC_FLUSH) if self._flush else data
+
+    def finish(self):
+        return self._obj.flush()
+
+
+class _Brotli:
+    def __init__(self, level, flush):
+        self._obj = brotli.Compressor(quality=level)
+        self._flush = flush
+
+    def compress(self, chunk):
+        data = self._obj.process(chunk)
+        return data + self._obj.flush() if self._flush else data
+
+    def finish(self):
+        return self._obj.finish()
+
+
+class _Zstd:
+    def __init__(self, level, flush):
+        self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+        self._flush = flush
+
+    def compress(self, chunk):
+        data = self._obj.compress(chunk)
+        return data + self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK) if self._flush else data
+
+    def finish(self):
+        return self._obj.flush()
+
+
+# encoding -> (encoder class, config key for its level, default level, available?)
+_ENCODERS = {
+    'gzip': (_Gzip, 'COMPRESS_LEVEL', 6, True),
+    'br': (_Brotli, 'COMPRESS_BR_LEVEL', 4, brotli is not None),
+    'zstd': (_Zstd, 'COMPRESS_ZSTD_LEVEL', 3, zstandard is not None),
+}
+
+
+class Compressor:
+    """Compresses eligible responses according to the client's Accept-Encoding.
+
+    Settings (app.config):
+      COMPRESS_MIN_SIZE    smallest body worth compressing, in bytes (default 500)
+      COMPRESS_MIMETYPES   content types to compress (default: text, JSON, CSV, SVG)
+      COMPRESS_ALGORITHMS  preference order among installed encoders (default zstd, br, gzip)
+      COMPRESS_LEVEL       gzip level (default 6); COMPRESS_BR_LEVEL / COMPRESS_ZSTD_LEVEL
+      COMPRESS_ENABLED     set False to turn compression off
+
+    Buffered responses are compressed in one go; streamed responses (generators, send_file)
+    are wrapped so each chunk is compressed and flushed as it is produced.
+    """
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_ENABLED', True)
+        app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+        app.config.setdefault('COMPRESS_MIMETYPES', DEFAULT_MIMETYPES)
+        app.config.setdefault('COMPRESS_ALGORITHMS', DEFAULT_ALGORITHMS)
+        for _, level_key, default_level, _ in _ENCODERS.values():
+            app.config.setdefault(level_key, default_level)
+        self.app = app
+        app.after_request(self.after_request)
+        app.extensions['compressor'] = self
+
+    def available(self):
+        return [name for name in self.app.config['COMPRESS_ALGORITHMS']
+                if name in _ENCODERS and _ENCODERS[name][3]]
+
+    def choose_encoding(self):
+        """Best installed encoding the client accepts, or None."""
+        accepted = request.accept_encodings
+        best, best_quality = None, 0
+        for name in self.available():
+            quality = accepted[name]
+            if quality > best_quality:
+                best, best_quality = name, quality
+        return best
+
+    def _encoder(self, name, flush):
+        cls, level_key, _, _ = _ENCODERS[name]
+        return cls(self.app.config[level_key], flush)
+
+    def _eligible(self, response):
+        config = self.app.config
+        if not config['COMPRESS_ENABLED']:
+            return False
+        if response.status_code < 200 or response.status_code >= 300 or response.status_code in (204, 206):
+            return False
+        if 'Content-Encoding' in response.headers:
+            return False
+        if response.mimetype not in config['COMPRESS_MIMETYPES']:
+            return False
+        length = response.content_length
+        if length is not None and length < config['COMPRESS_MIN_SIZE']:
+            return False
+        return True
+
+    def after_request(self, response):
+        if not self._eligible(response):
+            return response
+        response.vary.add('Accept-Encoding')
+
+        encoding = self.choose_encoding()
+        if encoding is None:
+            return response
+
+        if response.is_streamed:
+            response.response = self._stream(response.response, self._encoder(encoding, flush=True))
+            response.direct_passthrough = False
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.app.config['COMPRESS_MIN_SIZE']:
+                return response
+            encoder = self._encoder(encoding, flush=False)
+            response.set_data(encoder.compress(data) + encoder.finish())
+
+        response.headers['Content-Encoding'] = encoding
+        # the compressed body is a different representation of the same resource
+        if response.get_etag()[0]:
+            response.set_etag(response.get_etag()[0], weak=True)
+        return response
+
+    @staticmethod
+    def _stream(chunks, encoder):
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                data = encoder.compress(chunk)
+                if data:
+                    yield data
+            yield encoder.finish()
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+
+
+compressor = Compressor()
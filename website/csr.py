@@ -1,10 +1,19 @@
-from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask import Blueprint, flash, jsonify, redirect, render_template, request, url_for
 from flask_login import current_user, login_required
-from .models import Request, Category, User, Volunteer, Csr
+from sqlalchemy.orm import joinedload
+from .models import Request, User, Volunteer, Csr, Shortlist
 from . import db
+from .category_cache import categories as category_cache
+from . import feed
+from . import transitions
+from .geo import volunteer_locations
+from .skills import skill_index
 
 csr = Blueprint('csr', __name__)
 
+# Suggested volunteers listed first in each assign modal
+SKILL_MATCH_LIMIT = 15
+
 # CSR Dashboard
 @csr.route('/csr/dashboard')
 def csr_dashboard():
@@ -13,30 +22,53 @@ def csr_dashboard():
         flash('Only CSR can access!', 'danger')
         return redirect(url_for('views.home'))
     
-    categories = Category.query.order_by(Category.name).all()
+    categories = category_cache.all()
+
+    # 'feed': open requests ranked by this CSR's category history (website.feed), a page
+    # at a time; 'all': every request, newest first
+    view = 'all' if request.args.get('view') == 'all' else 'feed'
+    next_cursor = None
 
-    # Get all requests with their users
-    requests = Request.query.order_by(Request.date_created.desc()).all()
+    # Get the requests with their users (and assigned volunteer names) in one query
+    query = Request.query.options(
+        joinedload(Request.user),
+        joinedload(Request.volunteer).joinedload(Volunteer.user),
+    )
+    if view == 'feed':
+        ranked, next_cursor = feed.page(current_user.id, request.args.get('after'))
+        by_id = {req.id: req for req in query.filter(Request.id.in_([r.request_id for r in ranked]))}
+        requests = [by_id[r.request_id] for r in ranked if r.request_id in by_id]
+    else:
+        requests = query.order_by(Request.date_created.desc()).all()
     requests_with_users = [(req, req.user) for req in requests]
     
-    # Get all volunteers (regardless of approval status for now)
+    # Get all volunteers (regardless of approval status for now), names loaded up front
     # TODO: Later you can filter by User.status == 'Approved' if needed
-    volunteers = Volunteer.query.join(User).filter(
-        User.role == 'Volunteer'
-    ).all()
+    volunteers = Volunteer.query.options(joinedload(Volunteer.user)).all()
+
+    # Available volunteers with each request's skill, from the in-memory bitmaps:
+    # one lookup per category on the page, no query per request
+    volunteers_by_id = {v.id: v for v in volunteers}
+    skill_matches = {}
+    for req in requests:
+        if req.category_id not in skill_matches:
+            skill_matches[req.category_id] = [
+                volunteers_by_id[vid]
+                for vid in skill_index.available_with(req.category_id, limit=SKILL_MATCH_LIMIT)
+                if vid in volunteers_by_id
+            ]
     
     # Get all users
     users = User.query.all()
-
-        
-    volunteers = Volunteer.query.all()
-    for v in volunteers:
-        print(f"{v.user.name}: is_available = {v.is_available}")
     
     return render_template('csr_dashboard.html', 
                          categories=categories,
                          requests_with_users=requests_with_users,
+                         view=view,
+                         next_cursor=next_cursor,
                          volunteers=volunteers,
+                         skill_matches=skill_matches,
+                         skills_of=skill_index.skills_of,
                          users=users)
 
 # Accept Request
@@ -45,12 +77,44 @@ def csr_dashboard():
 def csr_accept_request(request_id):
     req = Request.query.get_or_404(request_id)
 
-    req.status = 'Accepted'
-    db.session.commit()
+    try:
+        transitions.transition(req, 'accept', transitions.form_version(request.form),
+                               csr_id=current_user.id)
+        # taking a request on is the strongest signal of what this CSR handles
+        feed.learn(current_user.id, req.category_id, feed.ACCEPT_WEIGHT)
+        db.session.commit()
+    except transitions.TransitionError as e:
+        db.session.rollback()
+        flash(str(e), 'warning')
+        return redirect(url_for('csr.csr_dashboard'))
 
     flash('Request has been accepted successfully.', 'success')
     return redirect(url_for('csr.csr_dashboard'))
 
+# Nearest available volunteers for a request (assign modal suggestions)
+@csr.route('/request/<int:request_id>/nearby-volunteers')
+@login_required
+def nearby_volunteers(request_id):
+    if current_user.role != 'CSR':
+        return jsonify({"error": "Unauthorized"}), 403
+
+    req = Request.query.get_or_404(request_id)
+    if req.latitude is None or req.longitude is None:
+        return jsonify({"request_id": req.id, "located": False, "volunteers": []})
+
+    limit = max(1, min(request.args.get('limit', 5, type=int), 20))
+    max_km = request.args.get('max_km', type=float)
+    matches = volunteer_locations.nearest_available(
+        req.latitude, req.longitude, req.category_id, limit=limit, max_km=max_km)
+    return jsonify({
+        "request_id": req.id,
+        "located": True,
+        "volunteers": [
+            {"id": vol.id, "name": vol.user.name, "distance_km": round(distance, 2)}
+            for vol, distance in matches
+        ],
+    })
+
 # Assign Request to Volunteer
 @csr.route('/request/<int:request_id>/assign', methods=['POST'])
 @login_required
@@ -68,7 +132,7 @@ def assign_request(request_id):
     volunteer = Volunteer.query.get_or_404(volunteer_id)
     
     # Check if request is already assigned
-    if req.status == 'Assigned' or req.status == 'Completed':
+    if req.status not in transitions.TRANSITIONS['assign'][0]:
         flash('This request has already been assigned or completed.', 'warning')
         return redirect(url_for('csr.csr_dashboard'))
     
@@ -81,11 +145,17 @@ def assign_request(request_id):
         flash(f'{volunteer.user.name} does not have an active account.', category='warning')
         return redirect(url_for('csr.csr_dashboard'))
     
-    # Assign the volunteer
-    req.volunteer_id = volunteer.id
-    req.status = 'Assigned'
-    volunteer.is_available = False  # Mark volunteer as unavailable (FIXED)
-    db.session.commit()
+    # Assign the volunteer; both updates are compare-and-swap, so two CSRs racing for the
+    # same request (or the same volunteer) can't both win
+    try:
+        transitions.claim_volunteer(volunteer)  # Mark volunteer as unavailable (FIXED)
+        transitions.transition(req, 'assign', transitions.form_version(request.form),
+                               volunteer_id=volunteer.id)
+        db.session.commit()
+    except transitions.TransitionError as e:
+        db.session.rollback()
+        flash(str(e), 'warning')
+        return redirect(url_for('csr.csr_dashboard'))
     
     flash(f'Request assigned to {volunteer.user.name} successfully!', category='success')
     return redirect(url_for('csr.csr_dashboard'))
@@ -97,19 +167,23 @@ def assign_request(request_id):
 def complete_request(request_id):
     req = Request.query.get_or_404(request_id)
     
-    if req.status == 'Assigned':
+    if req.status in transitions.TRANSITIONS['complete'][0]:
         try:
-            req.status = 'Completed'
+            transitions.transition(req, 'complete', transitions.form_version(request.form))
             
             # Increment volunteer's completed tasks count
             if req.volunteer:
-                req.volunteer.total_tasks_completed += 1
+                transitions.release_volunteer(req.volunteer, completed=True)
+            db.session.commit()
+
+            if req.volunteer:
                 volunteer_name = req.volunteer.user.name
                 flash(f'Request "{req.title}" completed by {volunteer_name}. Total tasks completed: {req.volunteer.total_tasks_completed}', 'success')
             else:
                 flash(f'Request "{req.title}" has been marked as completed.', 'success')
-            
-            db.session.commit()
+        except transitions.TransitionError as e:
+            db.session.rollback()
+            flash(str(e), 'warning')
         except Exception as e:
             db.session.rollback()
             flash(f'Error completing request: {str(e)}', 'danger')
@@ -123,6 +197,7 @@ def complete_request(request_id):
 @login_required
 def delete_request(request_id):
     req = Request.query.get_or_404(request_id)
+    Shortlist.query.filter_by(shortlist_request_id=req.id).delete()
     db.session.delete(req)
     db.session.commit()
     flash('Request deleted successfully.', 'danger')
@@ -0,0 +1,349 @@
+import hashlib
+import operator
+import re
+from array import array
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import aliased
+
+from . import db
+from .models import Request, RequestLshBand
+
+# Character shingles of the normalised title + description
+SHINGLE_SIZE = 5
+
+# Signature: NUM_PERM minima, split into BANDS bands of ROWS values for LSH. Requests whose
+# shingle sets have Jaccard similarity s share a band with probability 1 - (1 - s**ROWS)**BANDS:
+# ~0.9 at s = 0.7, ~0.99 at 0.8, under 0.1 at 0.3
+BANDS = 8
+ROWS = 4
+NUM_PERM = BANDS * ROWS
+
+# Estimated similarity from which a request counts as a near-duplicate
+THRESHOLD = 0.75
+
+# Most recent requests find() compares against per band bucket
+BUCKET_CANDIDATES = 4
+
+# What create_request does with one: 'flag' (create it, marked), 'block' or 'off'.
+# Overridden by the DUPLICATE_REQUEST_ACTION config value.
+DEFAULT_ACTION = 'flag'
+ACTIONS = ('flag', 'block', 'off')
+
+# Statuses still being worked on; completed requests are never reported as duplicates
+CLOSED_STATUSES = ('Completed',)
+
+_NON_WORD = re.compile(r'[\W_]+')
+
+# Shingles are hashed as UTF-32 (a fixed 4 bytes per character), so one encode per text
+# and a bytes slice per shingle
+_CHAR_BYTES = 4
+# Above every 8-byte digest: marks a signature slot no shingle fell in yet
+_EMPTY = b'\xff' * 9
+
+_band_table = RequestLshBand.__table__
+
+_candidate_queries = {}
+
+
+# --- Signatures ---
+
+def _shingles(text):
+    raw = _NON_WORD.sub(' ', (text or '').lower()).strip().encode('utf-32-le')
+    width = SHINGLE_SIZE * _CHAR_BYTES
+    if len(raw) <= width:
+        return {raw}
+    return {raw[i:i + width] for i in range(0, len(raw) - width + 1, _CHAR_BYTES)}
+
+
+def signature(title, description):
+    """MinHash signature of a request's text, as bytes (NUM_PERM unsigned 64-bit values).
+
+    One-permutation MinHash: each shingle is hashed once, the first byte of its digest
+    picks the slot it competes for and the least digest per slot is kept, instead of
+    hashing every shingle NUM_PERM times. A slot no shingle fell in (short texts) borrows
+    the next filled one's digest; that digest still carries its own slot bits, so two
+    signatures agree on a slot with probability equal to their Jaccard similarity.
+    """
+    slots = [_EMPTY] * NUM_PERM
+    mask = NUM_PERM - 1
+    for shingle in _shingles(f'{title or ""} {description or ""}'):
+        digest = hashlib.blake2b(shingle, digest_size=8).digest()
+        slot = digest[0] & mask
+        if digest < slots[slot]:
+            slots[slot] = digest
+    if _EMPTY in slots:
+        filled = [k for k in range(NUM_PERM) if slots[k] != _EMPTY]
+        slots = [
+            slots[next((f for f in filled if f > k), filled[0])] if slots[k] == _EMPTY else slots[k]
+            for k in range(NUM_PERM)
+        ]
+    return array('Q', [int.from_bytes(digest, 'big') for digest in slots]).tobytes()
+
+
+def similarity(sig_a, sig_b):
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return sum(map(operator.eq, array('Q', sig_a), array('Q', sig_b))) / NUM_PERM
+
+
+def band_buckets(sig):
+    """[(band, bucket)] of a signature: a signed 64-bit hash of each band's values."""
+    raw = memoryview(sig)
+    width = ROWS * 8
+    return [
+        (band, int.from_bytes(
+            hashlib.blake2b(raw[band * width:(band + 1) * width], digest_size=8).digest(),
+            'little', signed=True))
+        for band in range(BANDS)
+    ]
+
+
+# --- Lookups ---
+
+def _still_open(request):
+    # one comparison per status rather than NOT IN, so cached statements need no
+    # re-rendering per call
+    return [db.func.coalesce(request.status, 'Pending') != status for status in CLOSED_STATUSES]
+
+
+def _candidates(with_exclude, with_before):
+    """find()'s candidate query, built once per shape: the band buckets, user and category
+    (and exclude/before ids) are bound when it runs."""
+    key = (with_exclude, with_before)
+    if key not in _candidate_queries:
+        per_band = []
+        for band in range(BANDS):
+            stmt = (
+                db.select(RequestLshBand.request_id)
+                .join(Request, Request.id == RequestLshBand.request_id)
+                .where(
+                    RequestLshBand.band == band,
+                    RequestLshBand.bucket == db.bindparam(f'bucket_{band}'),
+                    (Request.user_id == db.bindparam('user_id')) | (Request.category_id == db.bindparam('category_id')),
+                    *_still_open(Request),
+                )
+            )
+            if with_exclude:
+                stmt = stmt.where(RequestLshBand.request_id != db.bindparam('exclude_id'))
+            if with_before:
+                stmt = stmt.where(RequestLshBand.request_id < db.bindparam('before_id'))
+            sub = stmt.order_by(RequestLshBand.request_id.desc()).limit(BUCKET_CANDIDATES).subquery()
+            per_band.append(db.select(sub.c.request_id))
+        _candidate_queries[key] = db.select(Request.id, Request.minhash).where(Request.id.in_(db.union(*per_band)))
+    return _candidate_queries[key]
+
+
+def find(title, description, user_id, category_id, exclude_id=None, before_id=None, sig=None):
+    """[(request_id, similarity)] of open near-duplicates, most similar first.
+
+    Only requests by the same user or in the same category are considered. Candidates come
+    from the LSH bands (an index range per band, newest BUCKET_CANDIDATES first), so the
+    cost stays bounded even when thousands of requests share a bucket (templated text).
+    """
+    sig = sig if sig is not None else signature(title, description)
+    params = {f'bucket_{band}': bucket for band, bucket in band_buckets(sig)}
+    params.update(user_id=user_id, category_id=category_id, exclude_id=exclude_id, before_id=before_id)
+    candidates = _candidates(exclude_id is not None, before_id is not None)
+
+    found = []
+    for request_id, other in db.session.execute(candidates, params):
+        if other is None:
+            continue
+        score = similarity(sig, other)
+        if score >= THRESHOLD:
+            found.append((request_id, score))
+    found.sort(key=lambda x: (-x[1], x[0]))
+    return found
+
+
+def find_many(request_ids):
+    """{request_id: [(request_id, similarity)]} for requests already in the index, each
+    checked against the older ones as find(..., before_id=request_id) would, in one query.
+
+    For bulk imports: a correlated subquery per band row takes the bucket's newest
+    BUCKET_CANDIDATES older requests, so the whole batch is a single round trip.
+    """
+    new_band = aliased(RequestLshBand)
+    new_request = aliased(Request)
+    candidate = aliased(Request)
+    newest_in_bucket = (
+        db.select(RequestLshBand.request_id)
+        .join(Request, Request.id == RequestLshBand.request_id)
+        .where(
+            RequestLshBand.band == new_band.band,
+            RequestLshBand.bucket == new_band.bucket,
+            RequestLshBand.request_id < new_band.request_id,
+            (Request.user_id == new_request.user_id) | (Request.category_id == new_request.category_id),
+            *_still_open(Request),
+        )
+        .order_by(RequestLshBand.request_id.desc())
+        .limit(BUCKET_CANDIDATES)
+        .correlate(new_band, new_request)
+    )
+    pairs = (
+        db.select(new_request.id, new_request.minhash, candidate.id, candidate.minhash)
+        .select_from(new_band)
+        .join(new_request, new_request.id == new_band.request_id)
+        .join(candidate, candidate.id.in_(newest_in_bucket))
+        .where(new_band.request_id.in_(request_ids))
+        .distinct()
+    )
+
+    # templated text brings the same candidates up for many rows: unpack each once
+    unpacked = {}
+
+    def slots(request_id, sig):
+        if request_id not in unpacked:
+            unpacked[request_id] = array('Q', sig)
+        return unpacked[request_id]
+
+    found = {}
+    for request_id, sig, other_id, other in db.session.execute(pairs):
+        if sig is None or other is None:
+            continue
+        score = sum(map(operator.eq, slots(request_id, sig), slots(other_id, other))) / NUM_PERM
+        if score >= THRESHOLD:
+            found.setdefault(request_id, []).append((other_id, score))
+    for matches in found.values():
+        matches.sort(key=lambda x: (-x[1], x[0]))
+    return found
+
+
+def scan(flag=False, batch_size=500):
+    """Check every open request against the older ones. Returns [(id, duplicate_of, similarity)].
+
+    flag=True also records the best match in Request.duplicate_of where it is still empty.
+    """
+    pairs = []
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            db.select(Request.id, Request.title, Request.description, Request.user_id,
+                      Request.category_id, Request.minhash, Request.duplicate_of)
+            .where(Request.id > last_id,
+                   db.func.coalesce(Request.status, 'Pending').not_in(CLOSED_STATUSES))
+            .order_by(Request.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        for row in rows:
+            matches = find(row.title, row.description, row.user_id, row.category_id,
+                           before_id=row.id, sig=row.minhash)
+            if not matches:
+                continue
+            best_id, score = matches[0]
+            pairs.append((row.id, best_id, score))
+            if flag and row.duplicate_of is None:
+                db.session.execute(
+                    db.update(Request)
+                    .where(Request.id == row.id)
+                    .values(duplicate_of=best_id, version=Request.version + 1)
+                    .execution_options(synchronize_session=False)
+                )
+        last_id = rows[-1].id
+    if flag:
+        db.session.commit()
+    return pairs
+
+
+# --- Index maintenance ---
+# Request.minhash is computed whenever a request's text is written through the ORM and its
+# band rows replaced in the same flush. Rows of deleted requests are removed by the mapper
+# event or, for bulk deletes, by website.cascade/website.archive; completed requests keep
+# their rows but are filtered out by find().
+
+def add_bands(conn, signatures):
+    """Insert the band rows of new requests: signatures is [(request_id, signature)]."""
+    rows = [
+        {'band': band, 'bucket': bucket, 'request_id': request_id}
+        for request_id, sig in signatures if sig is not None
+        for band, bucket in band_buckets(sig)
+    ]
+    if rows:
+        conn.execute(_band_table.insert(), rows)
+
+
+def _write_bands(conn, request_id, sig):
+    conn.execute(_band_table.delete().where(_band_table.c.request_id == request_id))
+    add_bands(conn, [(request_id, sig)])
+
+
+def _before_insert(mapper, connection, target):
+    target.minhash = signature(target.title, target.description)
+
+
+def _text_changed(target):
+    state = inspect(target)
+    return any(state.attrs[attr].history.has_changes() for attr in ('title', 'description'))
+
+
+def _before_update(mapper, connection, target):
+    if _text_changed(target):
+        target.minhash = signature(target.title, target.description)
+
+
+def _after_insert(mapper, connection, target):
+    _write_bands(connection, target.id, target.minhash)
+
+
+def _after_update(mapper, connection, target):
+    if _text_changed(target):
+        _write_bands(connection, target.id, target.minhash)
+
+
+def _before_delete(mapper, connection, target):
+    connection.execute(_band_table.delete().where(_band_table.c.request_id == target.id))
+
+
+def fill(conn, batch_size=1000):
+    """Compute the signature and band rows of every request (schema backfill)."""
+    conn.execute(_band_table.delete())
+    request = Request.__table__
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            db.select(request.c.id, request.c.title, request.c.description)
+            .where(request.c.id > last_id).order_by(request.c.id).limit(batch_size)
+        ).all()
+        if not rows:
+            return
+        sigs = [(row.id, signature(row.title, row.description)) for row in rows]
+        conn.execute(
+            request.update().where(request.c.id == db.bindparam('rid')).values(minhash=db.bindparam('sig')),
+            [{'rid': rid, 'sig': sig} for rid, sig in sigs],
+        )
+        add_bands(conn, sigs)
+        last_id = rows[-1].id
+
+
+def refresh_if_stale():
+    """Recompute every signature if the stored ones were made by another scheme.
+
+    Compares one stored signature with a fresh one, so it is cheap when nothing changed.
+    Returns True if the index was rebuilt.
+    """
+    row = db.session.execute(
+        db.select(Request.title, Request.description, Request.minhash)
+        .where(Request.minhash.is_not(None)).limit(1)
+    ).first()
+    if row is None or row.minhash == signature(row.title, row.description):
+        return False
+    try:
+        fill(db.session)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return True
+
+
+def init_app(app):
+    if getattr(Request, '_minhash_tracking', False):
+        return
+    event.listen(Request, 'before_insert', _before_insert)
+    event.listen(Request, 'before_update', _before_update)
+    event.listen(Request, 'after_insert', _after_insert)
+    event.listen(Request, 'after_update', _after_update)
+    event.listen(Request, 'before_delete', _before_delete)
+    Request._minhash_tracking = True
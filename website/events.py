@@ -0,0 +1,282 @@
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from flask import Blueprint, Response, current_app
+from flask_login import current_user, login_required
+from sqlalchemy import event as sa_event
+from sqlalchemy.orm import Session
+
+from . import db
+from .models import RequestEvent, Volunteer
+
+events = Blueprint('events', __name__)
+
+# Event names sent on the stream
+REQUEST_STATUS = 'request-status'
+
+# Defaults, overridable through app.config
+DEFAULT_BROKER = 'local'          # 'local' (single process) or 'database' (multi-worker relay)
+DEFAULT_KEEPALIVE = 15.0          # seconds between comment lines on an idle stream
+DEFAULT_QUEUE_SIZE = 100          # per-subscriber backlog before messages are dropped
+DEFAULT_POLL_INTERVAL = 0.5       # database relay: seconds between polls
+DEFAULT_RETENTION = 300           # database relay: seconds relayed rows are kept
+
+_PENDING_KEY = 'pending_events'
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+class Subscription:
+    def __init__(self, broker, channels, maxsize):
+        self.broker = broker
+        self.channels = frozenset(channels)
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def get(self, timeout):
+        """Next (id, event, data) message, or None after timeout seconds."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """In-process pub/sub: each channel fans out to its subscribers' queues.
+
+    Messages are delivered after the publishing transaction commits. Only clients
+    connected to the same process see them, so it suits the single-process server.
+    """
+
+    transactional = False
+
+    def __init__(self, queue_size=DEFAULT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def subscribe(self, channels):
+        sub = Subscription(self, channels, self.queue_size)
+        with self._lock:
+            for channel in sub.channels:
+                self._subscribers[channel].add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            for channel in sub.channels:
+                subs = self._subscribers.get(channel)
+                if subs is not None:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._subscribers[channel]
+
+    def deliver(self, channels, name, data, message_id=None):
+        if message_id is None:
+            message_id = next(self._ids)
+        with self._lock:
+            # a subscriber on several of the channels still gets the message once
+            targets = set().union(*(self._subscribers.get(c, ()) for c in channels))
+        for sub in targets:
+            try:
+                sub.queue.put_nowait((message_id, name, data))
+            except queue.Full:
+                sub.dropped += 1
+
+    def publish_committed(self, messages):
+        for channels, name, data in messages:
+            self.deliver(channels, name, data)
+
+
+class DatabaseBroker(LocalBroker):
+    """Stand-in for an external broker when several workers serve the app.
+
+    Messages are inserted into request_event in the publishing transaction; each worker
+    with connected clients polls for new rows and delivers them locally, then old rows
+    are pruned.
+    """
+
+    transactional = True
+
+    def __init__(self, app, queue_size=DEFAULT_QUEUE_SIZE,
+                 poll_interval=DEFAULT_POLL_INTERVAL, retention=DEFAULT_RETENTION):
+        super().__init__(queue_size)
+        self.app = app
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._thread = None
+        self._pid = None
+        self._thread_lock = threading.Lock()
+
+    def write(self, session, messages):
+        now = datetime.utcnow()
+        session.execute(db.insert(RequestEvent), [
+            {'channels': ' '.join(sorted(channels)), 'event': name,
+             'payload': json.dumps(data), 'created_at': now}
+            for channels, name, data in messages
+        ])
+
+    def publish_committed(self, messages):
+        # the poller delivers them, in every worker
+        pass
+
+    def subscribe(self, channels):
+        self._ensure_thread()
+        return super().subscribe(channels)
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._thread_lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='request-event-relay', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        with self.app.app_context():
+            last_id = db.session.scalar(db.select(db.func.max(RequestEvent.id))) or 0
+            db.session.remove()
+        next_prune = time.monotonic()
+        while True:
+            time.sleep(self.poll_interval)
+            with self.app.app_context():
+                try:
+                    rows = db.session.execute(
+                        db.select(RequestEvent.id, RequestEvent.channels,
+                                  RequestEvent.event, RequestEvent.payload)
+                        .where(RequestEvent.id > last_id)
+                        .order_by(RequestEvent.id)
+                        .limit(500)
+                    ).all()
+                    for row_id, channels, name, payload in rows:
+                        self.deliver(channels.split(), name, json.loads(payload), message_id=row_id)
+                        last_id = row_id
+                    if time.monotonic() >= next_prune:
+                        cutoff = datetime.utcnow() - timedelta(seconds=self.retention)
+                        db.session.execute(db.delete(RequestEvent).where(RequestEvent.created_at < cutoff))
+                        db.session.commit()
+                        next_prune = time.monotonic() + 60
+                except Exception as e:
+                    db.session.rollback()
+                    print("Error relaying request events:", e)
+                finally:
+                    db.session.remove()
+
+
+broker = None
+
+
+# --- Publishing ---
+# Messages are queued on the session and handed to the broker when it commits, so
+# rolled-back transitions are never announced.
+
+def publish(channels, name, data, session=None):
+    session = session if session is not None else db.session()
+    session.info.setdefault(_PENDING_KEY, []).append((frozenset(channels), name, data))
+
+
+def _before_commit(session):
+    messages = session.info.get(_PENDING_KEY)
+    if messages and broker is not None and broker.transactional:
+        broker.write(session, messages)
+
+
+def _after_commit(session):
+    messages = session.info.pop(_PENDING_KEY, None)
+    if messages and broker is not None:
+        broker.publish_committed(messages)
+
+
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def request_status_changed(req, previous_status, previous_volunteer_id=None):
+    """Announce a status transition of req to the users it concerns: its owner, its CSR and
+    its volunteer(s) (the new one and, on reassignment or release, the previous one)."""
+    user_ids = {req.user_id, req.csr_id}
+    for volunteer_id in {req.volunteer_id, previous_volunteer_id}:
+        if volunteer_id is not None:
+            vol = db.session.get(Volunteer, volunteer_id)
+            if vol is not None:
+                user_ids.add(vol.user_id)
+    channels = {user_channel(uid) for uid in user_ids if uid is not None}
+
+    actor = current_user if current_user and current_user.is_authenticated else None
+    publish(channels, REQUEST_STATUS, {
+        'request_id': req.id,
+        'title': req.title,
+        'status': req.status,
+        'previous_status': previous_status,
+        'volunteer_id': req.volunteer_id,
+        'actor_id': getattr(actor, 'id', None),
+        'actor_name': getattr(actor, 'name', None),
+        'at': datetime.utcnow().isoformat(),
+    })
+
+
+def init_app(app):
+    global broker
+    queue_size = app.config.get('EVENTS_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)
+    if app.config.get('EVENTS_BROKER', DEFAULT_BROKER) == 'database':
+        broker = DatabaseBroker(
+            app,
+            queue_size=queue_size,
+            poll_interval=app.config.get('EVENTS_POLL_INTERVAL', DEFAULT_POLL_INTERVAL),
+            retention=app.config.get('EVENTS_RETENTION', DEFAULT_RETENTION),
+        )
+    else:
+        broker = LocalBroker(queue_size=queue_size)
+    app.extensions['events'] = broker
+
+    if not getattr(Session, '_event_publishing', False):
+        sa_event.listen(Session, 'before_commit', _before_commit)
+        sa_event.listen(Session, 'after_commit', _after_commit)
+        sa_event.listen(Session, 'after_rollback', _after_rollback)
+        Session._event_publishing = True
+
+
+# --- Stream ---
+
+def _format(message_id, name, data):
+    return f"id: {message_id}\nevent: {name}\ndata: {json.dumps(data)}\n\n"
+
+
+def _stream(sub, keepalive):
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            message = sub.get(timeout=keepalive)
+            if message is None:
+                yield ": keepalive\n\n"
+            else:
+                yield _format(*message)
+    finally:
+        sub.close()
+
+
+@events.route('/events')
+@login_required
+def stream():
+    sub = broker.subscribe([user_channel(current_user.id)])
+    # the generator doesn't use the request context, so the DB session is released now
+    # rather than held open for the life of the connection
+    return Response(
+        _stream(sub, current_app.config.get('EVENTS_KEEPALIVE', DEFAULT_KEEPALIVE)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
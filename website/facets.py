@@ -0,0 +1,103 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from sqlalchemy import or_
+
+from . import db
+from .models import Request, User
+
+DEFAULT_TTL_SECONDS = 30
+DEFAULT_MAX_ENTRIES = 256
+
+
+def normalize(search_query):
+    """Lower-cased search with runs of whitespace collapsed (facet cache key)."""
+    return ' '.join((search_query or '').lower().split())
+
+
+def search_filter(search_query):
+    """The home page's title/description search condition (None for no search)."""
+    if not search_query:
+        return None
+    pattern = f"%{search_query}%"
+    return or_(Request.title.ilike(pattern), Request.description.ilike(pattern))
+
+
+def _grouped_counts(search_query):
+    """{(category_id, status): n} for one search, in a single GROUP BY query.
+
+    Requests of suspended users are left out, as on the home page.
+    """
+    stmt = (
+        db.select(Request.category_id, Request.status, db.func.count())
+        .join(User, User.id == Request.user_id)
+        .where(db.func.coalesce(User.status, '') != 'Suspended')
+        .group_by(Request.category_id, Request.status)
+    )
+    condition = search_filter(search_query)
+    if condition is not None:
+        stmt = stmt.where(condition)
+    return {(category_id, status): n for category_id, status, n in db.session.execute(stmt)}
+
+
+class FacetCounts:
+    """Per-category and per-status request counts for the home page filters.
+
+    The counts for a search are one grouped query over (category, status); the facets
+    are derived from it in Python, each one honouring the other filter (category counts
+    for the selected status, status counts for the selected category), so changing
+    filters never needs another query. Results are kept for a few seconds per normalised
+    search, in a small LRU.
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.ttl = app.config.get('FACET_CACHE_SECONDS', self.ttl)
+
+    def _grouped(self, search_query):
+        # the query is built from the key itself, so everything sharing an entry matches
+        # the same rows (ILIKE is case-insensitive already)
+        key = normalize(search_query)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                return entry[1]
+        grouped = _grouped_counts(key)
+        with self._lock:
+            self._entries[key] = (now + self.ttl, grouped)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return grouped
+
+    def counts(self, search_query='', category_id=None, status=None):
+        """{'categories': {id: n}, 'statuses': {status: n}, 'total': n} for the filters.
+
+        category_id/status None means that filter isn't applied.
+        """
+        by_category = defaultdict(int)
+        by_status = defaultdict(int)
+        total = 0
+        for (cid, st), n in self._grouped(search_query).items():
+            if status is None or st == status:
+                by_category[cid] += n
+            if category_id is None or cid == category_id:
+                by_status[st] += n
+            if (status is None or st == status) and (category_id is None or cid == category_id):
+                total += n
+        return {'categories': dict(by_category), 'statuses': dict(by_status), 'total': total}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+facet_counts = FacetCounts()
@@ -0,0 +1,230 @@
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from . import db
+from .models import CsrAffinity, CsrFeedEntry, Request, RequestArchive, Shortlist, User, Volunteer
+from .pagination import apply_keyset, decode_cursor, split_page
+
+# Affinity gained per signal
+SHORTLIST_WEIGHT = 1.0
+ACCEPT_WEIGHT = 2.0
+
+# Requests a CSR can still act on (accept or assign; see website.transitions)
+OPEN_STATUSES = ('Pending', 'Approved', 'Accepted')
+
+PAGE_SIZE = 25
+
+_feed = CsrFeedEntry.__table__
+_affinity = CsrAffinity.__table__
+_request = Request.__table__
+_user = User.__table__
+
+
+# --- Feed rows ---
+# A row per (CSR, open request in a category the CSR has a positive affinity for), scored
+# with that affinity. Everything else would score 0; page() reads those requests straight
+# from the request table after the stored rows, so the table doesn't grow with
+# CSRs x requests. Statements take either a Session or the flush Connection (mapper
+# events), like website.rollups.
+
+def _open(status):
+    return db.func.coalesce(status, 'Pending').in_(OPEN_STATUSES)
+
+
+def _rows_select(request_where, csr_where=None, only_open=True):
+    select = (
+        db.select(_user.c.id, _request.c.id, _request.c.category_id, _affinity.c.weight)
+        .select_from(_user)
+        .join(_affinity, _affinity.c.csr_id == _user.c.id)
+        .join(_request, (_request.c.category_id == _affinity.c.category_id) & request_where)
+        .where(_user.c.role == 'CSR', _affinity.c.weight > 0)
+    )
+    if only_open:
+        select = select.where(_open(_request.c.status))
+    if csr_where is not None:
+        select = select.where(csr_where)
+    return select
+
+
+def _upsert(conn, select):
+    stmt = sqlite_insert(_feed).from_select(['csr_id', 'request_id', 'category_id', 'score'], select)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['csr_id', 'request_id'],
+        set_={'category_id': stmt.excluded.category_id, 'score': stmt.excluded.score},
+    )
+    conn.execute(stmt)
+
+
+def sync_requests(conn, request_where):
+    """Bring the feed rows of the requests matching request_where (on request) up to date."""
+    conn.execute(_feed.delete().where(_feed.c.request_id.in_(
+        db.select(_request.c.id).where(request_where)
+    )))
+    conn.execute(_feed.insert().from_select(
+        ['csr_id', 'request_id', 'category_id', 'score'], _rows_select(request_where)
+    ))
+
+
+def request_moved(req):
+    """Record a status change made with a bulk UPDATE (see website.transitions)."""
+    sync_requests(db.session, _request.c.id == req.id)
+
+
+def learn(csr_id, category_id, delta):
+    """Add delta to a CSR's affinity for a category and rescore that category in their feed."""
+    stmt = sqlite_insert(_affinity).values(csr_id=csr_id, category_id=category_id, weight=delta)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['csr_id', 'category_id'],
+        set_={'weight': _affinity.c.weight + stmt.excluded.weight},
+    )
+    db.session.execute(stmt)
+    # rows appear when the affinity turns positive and go when it drops back to 0
+    db.session.execute(
+        _feed.delete().where(_feed.c.csr_id == csr_id, _feed.c.category_id == category_id)
+    )
+    db.session.execute(_feed.insert().from_select(
+        ['csr_id', 'request_id', 'category_id', 'score'],
+        _rows_select(_request.c.category_id == category_id, csr_where=_user.c.id == csr_id),
+    ))
+
+
+def shortlisted(user_id, request_ids, sign=1):
+    """Learn from requests a CSR just added to (sign=1) or removed from (sign=-1) their shortlist."""
+    if not request_ids:
+        return
+    user = db.session.get(User, user_id)
+    if user is None or user.role != 'CSR':
+        return
+    rows = db.session.execute(
+        db.select(Request.category_id, db.func.count())
+        .where(Request.id.in_(request_ids))
+        .group_by(Request.category_id)
+    ).all()
+    for category_id, count in rows:
+        learn(user_id, category_id, sign * count * SHORTLIST_WEIGHT)
+
+
+def forget_users(conds):
+    """Drop the feed and affinity rows of the users matching conds (WHERE conditions on User)
+    and of the requests they own, before website.cascade deletes them."""
+    user_ids = db.select(User.id).where(*conds).scalar_subquery()
+    vol_ids = db.select(Volunteer.id).where(Volunteer.user_id.in_(user_ids)).scalar_subquery()
+    owned = db.select(Request.id).where(Request.user_id.in_(user_ids))
+    db.session.execute(_feed.delete().where(_feed.c.csr_id.in_(user_ids) | _feed.c.request_id.in_(owned)))
+    db.session.execute(_affinity.delete().where(_affinity.c.csr_id.in_(user_ids)))
+    # requests assigned to deleted volunteers are about to go back to Pending
+    _upsert(db.session, _rows_select(
+        _request.c.volunteer_id.in_(vol_ids) & _request.c.user_id.not_in(user_ids),
+        csr_where=_user.c.id.not_in(user_ids),
+        only_open=False,
+    ))
+
+
+# --- Rebuild ---
+
+def _affinity_select():
+    history = db.union_all(
+        db.select(Shortlist.user_id.label('csr_id'), Request.category_id.label('category_id'),
+                  db.literal(SHORTLIST_WEIGHT).label('w'))
+        .join(Request, Request.id == Shortlist.shortlist_request_id),
+        db.select(Request.csr_id, Request.category_id, db.literal(ACCEPT_WEIGHT))
+        .where(Request.csr_id.is_not(None)),
+        db.select(RequestArchive.csr_id, RequestArchive.category_id, db.literal(ACCEPT_WEIGHT))
+        .where(RequestArchive.csr_id.is_not(None)),
+    ).subquery()
+    return (
+        db.select(history.c.csr_id, history.c.category_id, db.func.sum(history.c.w))
+        .join(_user, _user.c.id == history.c.csr_id)
+        .where(_user.c.role == 'CSR')
+        .group_by(history.c.csr_id, history.c.category_id)
+    )
+
+
+def fill(conn):
+    """Recompute every affinity and feed row from the shortlist and acceptance history."""
+    conn.execute(_feed.delete())
+    conn.execute(_affinity.delete())
+    conn.execute(_affinity.insert().from_select(['csr_id', 'category_id', 'weight'], _affinity_select()))
+    conn.execute(_feed.insert().from_select(
+        ['csr_id', 'request_id', 'category_id', 'score'], _rows_select(db.true())
+    ))
+
+
+def rebuild():
+    """fill() in its own transaction. Returns the number of feed rows."""
+    try:
+        fill(db.session)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return db.session.scalar(db.select(db.func.count()).select_from(_feed))
+
+
+# --- Incremental maintenance ---
+# ORM inserts/updates/deletes of requests and CSR accounts are caught by mapper events;
+# set-based statements call request_moved()/forget_users() themselves.
+
+def _after_request_insert(mapper, connection, target):
+    sync_requests(connection, _request.c.id == target.id)
+
+
+def _after_request_update(mapper, connection, target):
+    state = inspect(target)
+    if state.attrs.status.history.has_changes() or state.attrs.category_id.history.has_changes():
+        sync_requests(connection, _request.c.id == target.id)
+
+
+def _before_request_delete(mapper, connection, target):
+    connection.execute(_feed.delete().where(_feed.c.request_id == target.id))
+
+
+def _after_user_write(mapper, connection, target):
+    if not inspect(target).attrs.role.history.has_changes():
+        return
+    connection.execute(_feed.delete().where(_feed.c.csr_id == target.id))
+    if target.role == 'CSR':
+        _upsert(connection, _rows_select(db.true(), csr_where=_user.c.id == target.id))
+
+
+def init_app(app):
+    if getattr(Request, '_feed_tracking', False):
+        return
+    event.listen(Request, 'after_insert', _after_request_insert)
+    event.listen(Request, 'after_update', _after_request_update)
+    event.listen(Request, 'before_delete', _before_request_delete)
+    event.listen(User, 'after_insert', _after_user_write)
+    event.listen(User, 'after_update', _after_user_write)
+    Request._feed_tracking = True
+
+
+# --- Reads ---
+
+def page(csr_id, cursor=None, limit=PAGE_SIZE):
+    """One page of a CSR's ranked feed: ([(request_id, score)], next_cursor).
+
+    Highest score first, newest request first within a score. The stored (positive)
+    rows are a keyset read of ix_csr_feed_rank; once they run out, the page continues
+    with the other open requests, newest first, at score 0.
+    """
+    values = decode_cursor(cursor)
+    if not (values and len(values) == 2 and all(isinstance(v, (int, float)) for v in values)):
+        cursor = values = None
+    rows = []
+    if values is None or values[0] > 0:
+        stmt = db.select(CsrFeedEntry.request_id, CsrFeedEntry.score).where(
+            CsrFeedEntry.csr_id == csr_id, CsrFeedEntry.score > 0)
+        stmt = apply_keyset(stmt, [CsrFeedEntry.score, CsrFeedEntry.request_id], cursor, descending=True)
+        rows = db.session.execute(stmt.limit(limit + 1)).all()
+    if len(rows) <= limit:
+        liked = db.select(CsrAffinity.category_id).where(CsrAffinity.csr_id == csr_id, CsrAffinity.weight > 0)
+        stmt = (
+            db.select(Request.id.label('request_id'), db.literal(0.0).label('score'))
+            .where(_open(Request.status),
+                   Request.category_id.is_(None) | Request.category_id.not_in(liked))
+            .order_by(Request.id.desc())
+        )
+        if values is not None and values[0] <= 0:
+            stmt = stmt.where(Request.id < values[1])
+        rows += db.session.execute(stmt.limit(limit + 1 - len(rows))).all()
+    return split_page(rows, limit, key=lambda r: (r.score, r.request_id))
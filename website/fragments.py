@@ -0,0 +1,115 @@
+import threading
+from collections import OrderedDict
+
+from flask import render_template
+from markupsafe import Markup
+
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+# access counts are halved after this many lookups per cached entry, so fragments
+# that stopped being requested (old versions) lose their claim on the cache
+FREQ_AGING_FACTOR = 10
+MIN_FREQ_SAMPLE = 1000
+
+
+class FragmentCache:
+    """LRU cache of rendered template fragments with a memory cap.
+
+    Keys must include everything the fragment's output depends on (for request cards:
+    the request id and its version stamp plus any per-viewer variant), so entries never
+    need explicit invalidation; stale versions simply age out of the LRU.
+
+    A full page can hold more fragments than fit in the budget. Plain LRU would then
+    evict each render's own entries before the next render reaches them, so a new
+    fragment is only admitted over the LRU victims it would push out if it has been
+    asked for more often than they have (a small TinyLFU-style frequency gate): a
+    page larger than the cache keeps the part that fits cached instead of none of it.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._freq = {}
+        self._sampled = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    def init_app(self, app):
+        self.max_bytes = app.config.get('FRAGMENT_CACHE_MAX_BYTES', self.max_bytes)
+        app.jinja_env.globals['cached_fragment'] = self.render
+        app.extensions['fragment_cache'] = self
+
+    def render(self, template_name, key, **context):
+        """Return the cached rendering of template_name for key, rendering it on a miss."""
+        full_key = (template_name,) + tuple(key)
+        with self._lock:
+            self._count(full_key)
+            html = self._entries.get(full_key)
+            if html is not None:
+                self._entries.move_to_end(full_key)
+                self.hits += 1
+                return html
+            self.misses += 1
+
+        html = Markup(render_template(template_name, **context))
+        self._store(full_key, html)
+        return html
+
+    def _count(self, key):
+        """Record one lookup of key (caller holds the lock), aging all counts periodically."""
+        self._freq[key] = self._freq.get(key, 0) + 1
+        self._sampled += 1
+        if self._sampled >= max(MIN_FREQ_SAMPLE, FREQ_AGING_FACTOR * len(self._entries)):
+            self._freq = {k: n // 2 for k, n in self._freq.items() if n > 1}
+            self._sampled = 0
+
+    def _store(self, key, html):
+        size = len(html)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            # the LRU entries that would have to go to make room; all of them must be
+            # less popular than the newcomer, or it is not admitted
+            victims, freed = [], 0
+            needed = self._bytes + size - self.max_bytes
+            if needed > 0:
+                freq = self._freq.get(key, 0)
+                for victim, victim_html in self._entries.items():
+                    if self._freq.get(victim, 0) >= freq:
+                        self.rejected += 1
+                        return
+                    victims.append(victim)
+                    freed += len(victim_html)
+                    if freed >= needed:
+                        break
+            for victim in victims:
+                self._bytes -= len(self._entries.pop(victim))
+            self._entries[key] = html
+            self._bytes += size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._freq.clear()
+            self._sampled = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            'rejected': self.rejected,
+        }
+
+
+fragment_cache = FragmentCache()
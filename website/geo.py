@@ -0,0 +1,291 @@
+import heapq
+import math
+import threading
+from collections import defaultdict, namedtuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, joinedload, object_session
+
+from . import db
+from . import changes
+from . import read_routing
+from .models import Volunteer, VolunteerSkill
+from .skills import skill_index
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Grid levels, finest first: 0.01° cells (~1.1 km) grouped 4x4 into each coarser level, up to
+# cells of ~164° that cover the globe in a handful. Indices are derived from the finest one
+# by integer division, so every cell lies exactly inside its parent. The small fan-out keeps
+# the number of cells measured per step low.
+FINEST_CELL = 0.01
+LEVEL_FACTORS = (4,) * 7
+LEVEL_SIZES = tuple(FINEST_CELL * math.prod(LEVEL_FACTORS[:i]) for i in range(len(LEVEL_FACTORS) + 1))
+
+# Bucket holding every indexed point, whatever its category
+ALL = None
+
+# Stamp file (see website.changes) rewritten whenever a volunteer's location changes
+STAMP = 'volunteer_location'
+
+_CHANGED_KEY = 'volunteer_location_changed'
+_TRACKED_ATTRS = ('latitude', 'longitude')
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km between two (lat, lon) points given in degrees."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def parse_coordinates(latitude, longitude):
+    """(lat, lon) floats from form values; (None, None) when both are blank.
+
+    Raises ValueError when only one is given or either is out of range.
+    """
+    latitude = (latitude or '').strip()
+    longitude = (longitude or '').strip()
+    if not latitude and not longitude:
+        return None, None
+    if not latitude or not longitude:
+        raise ValueError('Please enter both latitude and longitude, or neither.')
+    try:
+        lat, lon = float(latitude), float(longitude)
+    except ValueError:
+        raise ValueError('Latitude and longitude must be numbers.')
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError('Latitude must be between -90 and 90, longitude between -180 and 180.')
+    return lat, lon
+
+
+def _cell_path(lat, lon):
+    """Cell (iy, ix) of a point at every level, finest first."""
+    iy, ix = math.floor(lat / FINEST_CELL), math.floor(lon / FINEST_CELL)
+    path = [(iy, ix)]
+    for factor in LEVEL_FACTORS:
+        iy, ix = iy // factor, ix // factor
+        path.append((iy, ix))
+    return path
+
+
+def _cell_distance_km(lat, cos_lat, sin_lat, lon, level, iy, ix):
+    """Least great-circle distance from (lat, lon) to any point of a grid cell."""
+    size = LEVEL_SIZES[level]
+    lat0, lon0 = iy * size, ix * size
+    lat1 = lat0 + size
+    if (lon - lon0) % 360 <= size:
+        # within the cell's longitudes: only the latitude gap counts
+        if lat < lat0:
+            return math.radians(lat0 - lat) * EARTH_RADIUS_KM
+        if lat > lat1:
+            return math.radians(lat - lat1) * EARTH_RADIUS_KM
+        return 0.0
+    # otherwise the closest point is on the nearer meridian edge (the short way round, so
+    # cells across ±180° work): at one of its ends, or where the distance along that
+    # meridian bottoms out if that lies within the cell
+    east, west = (lon0 - lon) % 360, (lon - lon0 - size) % 360
+    gap, edge = (east, lon0) if east <= west else (west, lon0 + size)
+    best = min(haversine_km(lat, lon, lat0, edge), haversine_km(lat, lon, lat1, edge))
+    turn = math.degrees(math.atan2(sin_lat, cos_lat * math.cos(math.radians(gap))))
+    if lat0 < turn < lat1:
+        best = min(best, haversine_km(lat, lon, turn, edge))
+    return best
+
+
+class GridIndex:
+    """Points in a hierarchy of lat/lon grid cells (see LEVEL_SIZES).
+
+    Points are (key, lat, lon) and belong to a bucket (e.g. a category); every query is
+    confined to one bucket. Only non-empty cells are stored: finest cells hold their
+    points, coarser ones the set of their non-empty child cells.
+    """
+
+    def __init__(self):
+        self._cells = [defaultdict(list)] + [defaultdict(set) for _ in LEVEL_FACTORS]
+        self._counts = defaultdict(int)
+
+    def add(self, bucket, key, lat, lon):
+        path = _cell_path(lat, lon)
+        self._cells[0][(bucket, *path[0])].append((key, lat, lon))
+        for level in range(1, len(path)):
+            self._cells[level][(bucket, *path[level])].add(path[level - 1])
+        self._counts[bucket] += 1
+
+    def count(self, bucket=ALL):
+        return self._counts.get(bucket, 0)
+
+    def nearest(self, bucket, lat, lon, max_km=None):
+        """Yield (distance_km, key) for the bucket's points, nearest first, lazily.
+
+        Best-first search: one heap holds points and cells, cells keyed by the least
+        distance any point inside them could have. A point is yielded when it reaches the
+        top, i.e. nothing left unexplored can be closer, so taking the first k only opens
+        the cells around the query however large the bucket is.
+        """
+        if not self._counts.get(bucket):
+            return
+        cos_lat, sin_lat = math.cos(math.radians(lat)), math.sin(math.radians(lat))
+        top = len(LEVEL_FACTORS)
+        heap = []
+        for (b, iy, ix), _ in self._cells[top].items():
+            if b == bucket:
+                heap.append((_cell_distance_km(lat, cos_lat, sin_lat, lon, top, iy, ix), 1, top, iy, ix))
+        heapq.heapify(heap)
+
+        while heap:
+            distance, is_cell, a, iy, ix = heapq.heappop(heap)
+            if max_km is not None and distance > max_km:
+                return
+            if not is_cell:
+                yield distance, a
+            elif a == 0:
+                for key, plat, plon in self._cells[0][(bucket, iy, ix)]:
+                    heapq.heappush(heap, (haversine_km(lat, lon, plat, plon), 0, key, 0, 0))
+            else:
+                level = a - 1
+                for cy, cx in self._cells[a][(bucket, iy, ix)]:
+                    heapq.heappush(heap, (_cell_distance_km(lat, cos_lat, sin_lat, lon, level, cy, cx), 1, level, cy, cx))
+
+    def within(self, bucket, lat, lon, radius_km):
+        """[(distance_km, key)] for the bucket's points within radius_km, nearest first."""
+        return list(self.nearest(bucket, lat, lon, max_km=radius_km))
+
+
+_Snapshot = namedtuple('_Snapshot', ['stamp', 'index'])
+
+
+class VolunteerLocations:
+    """Per-process grid of volunteer locations, rebuilt only when one of them changed.
+
+    Each volunteer with a location is indexed under ALL and under each of its skills.
+    Commits that add, delete or move a volunteer rewrite the volunteer_location stamp
+    (skill edits rewrite the volunteer_skill one), like website.category_cache does for
+    categories. Availability changes constantly, so it isn't indexed here: candidates are
+    filtered, nearest first, through the availability bitmap of website.skills.
+    """
+
+    def __init__(self):
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def _current(self):
+        current_stamp = (changes.request_stamp(STAMP), changes.request_stamp('volunteer_skill'))
+        snap = self._snapshot
+        if snap is not None and snap.stamp == current_stamp:
+            return snap
+        with self._lock:
+            snap = self._snapshot
+            if snap is not None and snap.stamp == current_stamp:
+                return snap
+            rows = db.session.execute(
+                db.select(Volunteer.id, Volunteer.latitude, Volunteer.longitude, VolunteerSkill.category_id)
+                .outerjoin(VolunteerSkill, VolunteerSkill.volunteer_id == Volunteer.id)
+                .where(Volunteer.latitude.is_not(None), Volunteer.longitude.is_not(None))
+                .order_by(Volunteer.id),
+                bind_arguments=read_routing.primary(),
+            ).all()
+            index = GridIndex()
+            previous = None
+            for vol_id, lat, lon, category_id in rows:
+                if vol_id != previous:
+                    index.add(ALL, vol_id, lat, lon)
+                    previous = vol_id
+                if category_id is not None:
+                    index.add(category_id, vol_id, lat, lon)
+            snap = _Snapshot(stamp=current_stamp, index=index)
+            self._snapshot = snap
+            return snap
+
+    @property
+    def index(self):
+        return self._current().index
+
+    def nearest(self, lat, lon, category_id=None, limit=5, max_km=None):
+        """[(volunteer_id, distance_km)] of the closest located volunteers, available or not."""
+        bucket = ALL if category_id is None else int(category_id)
+        found = []
+        for distance, vol_id in self.index.nearest(bucket, lat, lon, max_km):
+            found.append((vol_id, distance))
+            if len(found) >= limit:
+                break
+        return found
+
+    def nearest_available(self, lat, lon, category_id=None, limit=5, max_km=None):
+        """[(Volunteer, distance_km)] of the closest available volunteers with an active account.
+
+        category_id=None searches every skill. Only the volunteers returned are loaded
+        (with .user), in one query.
+        """
+        bucket = ALL if category_id is None else int(category_id)
+        available = skill_index.available_bits()
+        found = []
+        for distance, vol_id in self.index.nearest(bucket, lat, lon, max_km):
+            if available >> vol_id & 1:
+                found.append((vol_id, distance))
+                if len(found) >= limit:
+                    break
+        return _load(found)
+
+    def invalidate(self):
+        self._snapshot = None
+
+
+def _load(candidates):
+    """[(Volunteer, distance)] for [(id, distance)], same order, users loaded."""
+    if not candidates:
+        return []
+    rows = db.session.scalars(
+        db.select(Volunteer)
+        .options(joinedload(Volunteer.user))
+        .where(Volunteer.id.in_([vol_id for vol_id, _ in candidates]))
+    ).all()
+    by_id = {vol.id: vol for vol in rows}
+    return [(by_id[vol_id], distance) for vol_id, distance in candidates if vol_id in by_id]
+
+
+volunteer_locations = VolunteerLocations()
+
+
+# --- Invalidation ---
+# Mapper events flag the session when a volunteer is added, deleted or moved; the stamp is
+# rewritten once it commits. Bulk deletes (website.cascade) leave stale ids in the index
+# until the next rebuild; they are no longer in the availability bitmap, so never returned.
+
+def _flag(target):
+    session = object_session(target)
+    if session is not None:
+        session.info[_CHANGED_KEY] = True
+
+
+def _after_insert_or_delete(mapper, connection, target):
+    if target.latitude is not None or target.longitude is not None:
+        _flag(target)
+
+
+def _after_update(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[attr].history.has_changes() for attr in _TRACKED_ATTRS):
+        _flag(target)
+
+
+def _after_commit(session):
+    if session.info.pop(_CHANGED_KEY, None):
+        changes.touch_stamp(STAMP)
+
+
+def _after_rollback(session):
+    session.info.pop(_CHANGED_KEY, None)
+
+
+def init_app(app):
+    if getattr(Volunteer, '_location_tracking', False):
+        return
+    event.listen(Volunteer, 'after_insert', _after_insert_or_delete)
+    event.listen(Volunteer, 'after_delete', _after_insert_or_delete)
+    event.listen(Volunteer, 'after_update', _after_update)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
+    Volunteer._location_tracking = True
@@ -1,10 +1,18 @@
 from datetime import datetime
 from . import db
 from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import object_session
 from sqlalchemy.sql import func
 
 
 class User(db.Model, UserMixin):
+    # Indexes backing the admin user table: role/status filters (name prefix index below)
+    __table_args__ = (
+        db.Index('ix_user_role_status', 'role', 'status', 'id'),
+        db.Index('ix_user_status', 'status', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     # Account details
     name = db.Column(db.String(150))
@@ -30,6 +38,11 @@ class User(db.Model, UserMixin):
         self.num_ratings += 1"""
 
 
+# Case-insensitive name/email prefix search and sort in the admin user table
+db.Index('ix_user_name_lower', func.lower(User.name), User.id)
+db.Index('ix_user_email_lower', func.lower(User.email))
+
+
 class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), unique=True, nullable=False)
@@ -43,15 +56,45 @@ class Volunteer(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), unique=True, nullable=False)
     user = db.relationship('User', backref=db.backref('volunteer_profile', uselist=False))
 
-    # Single category (many-to-one relationship)
+    # Primary category; always one of the volunteer's skills (see website.skills)
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=True)
     category = db.relationship('Category', backref='volunteers', foreign_keys=[category_id])
 
+    # Every category the volunteer covers; edit through website.skills.set_skills
+    skills = db.relationship('Category', secondary='volunteer_skill', viewonly=True, order_by='Category.name')
+
     is_available = db.Column(db.Boolean, default=True)
     total_tasks_completed = db.Column(db.Integer, default=0)
 
+    # Optional home location (WGS84 degrees), indexed in memory by website.geo
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
+
+
+class VolunteerSkill(db.Model):
+    __tablename__ = 'volunteer_skill'
+    __table_args__ = (
+        db.Index('ix_volunteer_skill_category_id', 'category_id', 'volunteer_id'),
+    )
+
+    volunteer_id = db.Column(db.Integer, db.ForeignKey('volunteer.id'), primary_key=True)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), primary_key=True)
+
 
 class Request(db.Model):
+    # (filter, id) indexes so filtered id-keyset pages are index range reads
+    __table_args__ = (
+        db.Index('ix_request_status_id', 'status', 'id'),
+        db.Index('ix_request_category_id', 'category_id', 'id'),
+        db.Index('ix_request_user_id', 'user_id', 'id'),
+        db.Index('ix_request_volunteer_id', 'volunteer_id', 'id'),
+        db.Index('ix_request_date_created', 'date_created'),
+        db.Index('ix_request_trending', 'trending_score', 'id'),
+        # ids are never handed out again, even after the newest rows were archived (the
+        # archive keeps them); see website.schema.ARCHIVED_ID_TABLES
+        {'sqlite_autoincrement': True},
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(150), nullable=False)
     description = db.Column(db.Text, nullable=False)
@@ -63,8 +106,28 @@ class Request(db.Model):
 
     scheduled_datetime = db.Column(db.DateTime, nullable=False)
 
+    # Optional location of the task (WGS84 degrees), for nearby volunteer matching
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
+
     view_count = db.Column(db.Integer, default=0)
+    # time-decayed view count in log space, see website.trending (NULL = never viewed)
+    trending_score = db.Column(db.Float, nullable=True)
+    # MinHash signature of the title and description, see website.duplicates
+    minhash = db.deferred(db.Column(db.LargeBinary, nullable=True))
+    # set when the request was flagged as a near-duplicate of another one (no FK: that one
+    # may since have been archived or deleted)
+    duplicate_of = db.Column(db.Integer, nullable=True)
+    # number of CSR shortlist entries, kept in sync by website.shortlist and website.cascade
+    shortlist_count = db.Column(db.Integer, default=0, nullable=False)
+    # bumped on every change to the row (template fragment cache key)
+    version = db.Column(db.Integer, default=1, nullable=False)
+    # bumped only by status transitions (website.transitions compares and swaps on it), so
+    # views, shortlists and edits don't make a CSR's or volunteer's action fail as a conflict
+    state_version = db.Column(db.Integer, default=1, nullable=False)
     date_created = db.Column(db.DateTime, default=datetime.utcnow)
+    # set when the request becomes Completed (archive age is counted from it)
+    date_completed = db.Column(db.DateTime, nullable=True)
 
     # Foreign key to user who created the request
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -78,7 +141,24 @@ class Request(db.Model):
     user = db.relationship('User', backref=db.backref('requests', lazy=True, cascade='all, delete-orphan'), lazy=True)
     volunteer = db.relationship('Volunteer', backref=db.backref('assigned_requests', lazy=True), lazy=True)
 
+    is_archived = False
+
+@event.listens_for(Request, 'before_update')
+def _bump_request_version(mapper, connection, target):
+    # ORM updates; bulk UPDATE statements bump version themselves
+    session = object_session(target)
+    if session is not None and session.is_modified(target, include_collections=False):
+        target.version = (target.version or 0) + 1
+
+
 class Review(db.Model):
+    __table_args__ = (
+        db.Index('ix_review_volunteer_id', 'volunteer_id', 'id'),
+        db.Index('ix_review_user_id', 'user_id', 'id'),
+        db.Index('ix_review_request_id', 'request_id'),
+        {'sqlite_autoincrement': True},  # as for Request
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     rating = db.Column(db.Integer, nullable=False)  # e.g., 1–5 stars
     comment = db.Column(db.Text, nullable=True)
@@ -97,12 +177,158 @@ class Review(db.Model):
     user = db.relationship('User', backref=db.backref('reviews_written', lazy=True))
 
 
+# --- Archive of completed requests (moved out of the hot tables by website.archive) ---
+# Same columns (and ids) as Request/Review, so templates and reports can treat rows
+# from either table alike; relationships are read-only and have no backrefs.
+
+class RequestArchive(db.Model):
+    __tablename__ = 'request_archive'
+    __table_args__ = (
+        db.Index('ix_request_archive_user_id', 'user_id', 'id'),
+        db.Index('ix_request_archive_volunteer_id', 'volunteer_id', 'id'),
+        db.Index('ix_request_archive_category_id', 'category_id', 'id'),  # category-in-use check
+        db.Index('ix_request_archive_date_created', 'date_created'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    title = db.Column(db.String(150), nullable=False)
+    description = db.Column(db.Text, nullable=False)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=False)
+    status = db.Column(db.String(20))
+    scheduled_datetime = db.Column(db.DateTime, nullable=False)
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
+    view_count = db.Column(db.Integer, default=0)
+    shortlist_count = db.Column(db.Integer, default=0, nullable=False)
+    version = db.Column(db.Integer, default=1, nullable=False)
+    date_created = db.Column(db.DateTime)
+    date_completed = db.Column(db.DateTime, nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    volunteer_id = db.Column(db.Integer, db.ForeignKey('volunteer.id'), nullable=True)
+    csr_id = db.Column(db.Integer, db.ForeignKey("csr.user_id"), nullable=True)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    category = db.relationship('Category', viewonly=True)
+    user = db.relationship('User', viewonly=True)
+    volunteer = db.relationship('Volunteer', viewonly=True)
+    review = db.relationship('ReviewArchive', uselist=False, viewonly=True)
+
+    is_archived = True
+
+
+class ReviewArchive(db.Model):
+    __tablename__ = 'review_archive'
+    __table_args__ = (
+        db.Index('ix_review_archive_volunteer_id', 'volunteer_id', 'id'),
+        db.Index('ix_review_archive_user_id', 'user_id', 'id'),
+        db.Index('ix_review_archive_request_id', 'request_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    rating = db.Column(db.Integer, nullable=False)
+    comment = db.Column(db.Text, nullable=True)
+    date_created = db.Column(db.DateTime)
+    request_id = db.Column(db.Integer, db.ForeignKey('request_archive.id'), nullable=False)
+    volunteer_id = db.Column(db.Integer, db.ForeignKey('volunteer.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    request = db.relationship('RequestArchive', viewonly=True)
+    volunteer = db.relationship('Volunteer', viewonly=True)
+    user = db.relationship('User', viewonly=True)
+
+
+# Requests created per day x category x current status, over hot and archived requests.
+# Kept in step with every insert, status/category change and delete by website.rollups,
+# so reports read a few rows per day instead of scanning the request tables.
+class RequestDailyRollup(db.Model):
+    __tablename__ = 'request_daily_rollup'
+
+    day = db.Column(db.Date, primary_key=True)
+    category_id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+# How much each CSR cares about each category, learned from their shortlists and accepted
+# requests; maintained by website.feed
+class CsrAffinity(db.Model):
+    __tablename__ = 'csr_affinity'
+
+    csr_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    category_id = db.Column(db.Integer, db.ForeignKey('category.id'), primary_key=True)
+    weight = db.Column(db.Float, nullable=False, default=0)
+
+
+# Precomputed per-CSR ranking of the open requests in categories the CSR has a positive
+# affinity for (score = that affinity), so the recommended list is one index range read;
+# the other open requests follow at score 0 from request. Maintained by website.feed
+class CsrFeedEntry(db.Model):
+    __tablename__ = 'csr_feed'
+    __table_args__ = (
+        db.Index('ix_csr_feed_rank', 'csr_id', 'score', 'request_id'),
+        db.Index('ix_csr_feed_category', 'csr_id', 'category_id'),
+        db.Index('ix_csr_feed_request_id', 'request_id'),
+    )
+
+    csr_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    request_id = db.Column(db.Integer, db.ForeignKey('request.id'), primary_key=True)
+    category_id = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False, default=0)
+
+
+# LSH index over Request.minhash: one row per (band, hash of the band's signature values);
+# requests sharing a row are near-duplicate candidates. Maintained by website.duplicates
+class RequestLshBand(db.Model):
+    __tablename__ = 'request_lsh_band'
+    __table_args__ = (
+        db.Index('ix_request_lsh_band_request_id', 'request_id'),
+    )
+
+    band = db.Column(db.Integer, primary_key=True)
+    bucket = db.Column(db.BigInteger, primary_key=True)
+    request_id = db.Column(db.Integer, db.ForeignKey('request.id'), primary_key=True)
+
+
+# Legacy logout table, superseded by AuthEvent (kept so old rows stay readable)
 class Logout(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     DateTime = db.Column(db.Integer, nullable=False)
 
 
+# Append-only log of login/logout attempts, written in batches by website.audit
+class AuthEvent(db.Model):
+    __tablename__ = 'auth_event'
+    __table_args__ = (
+        db.Index('ix_auth_event_user_ts', 'user_id', 'timestamp'),
+        db.Index('ix_auth_event_ts', 'timestamp'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    # No FK: failed logins may not match a user, and the log outlives deleted accounts
+    user_id = db.Column(db.Integer, nullable=True)
+    email = db.Column(db.String(150))
+    event = db.Column(db.String(20), nullable=False)  # login_success, login_failure, logout
+    role = db.Column(db.String(50))
+    ip = db.Column(db.String(45))
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+# Short-lived relay of request status events between workers (website.events database broker)
+class RequestEvent(db.Model):
+    __tablename__ = 'request_event'
+    __table_args__ = (
+        db.Index('ix_request_event_created_at', 'created_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    channels = db.Column(db.String(500), nullable=False)  # space separated, e.g. "user:3 role:CSR"
+    event = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
 class Shortlist(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True, nullable=False)
     shortlist_request_id = db.Column(db.Integer, db.ForeignKey('request.id'), primary_key=True, nullable=False)
@@ -112,4 +338,13 @@ class Csr(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), unique=True, nullable=False)
     name = db.Column(db.String(150))
-    role = db.Column(db.Integer, db.ForeignKey('user.role'), nullable=False)
\ No newline at end of file
+    role = db.Column(db.Integer, db.ForeignKey('user.role'), nullable=False)
+
+# Per-table version counters bumped on every committed write (see website.changes);
+# cheap validators for conditional GETs and cross-process cache invalidation
+class ChangeMarker(db.Model):
+    __tablename__ = 'change_marker'
+
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
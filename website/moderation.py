@@ -0,0 +1,63 @@
+from sqlalchemy import func
+
+from . import db
+from . import cascade
+from .models import User
+
+# Statuses the bulk activate/suspend actions set
+BULK_STATUS_ACTIONS = {
+    'activate': 'Active',
+    'suspend': 'Suspended',
+}
+
+
+def user_criteria(user_ids=None, role=None, status=None, created_after=None,
+                  created_before=None, email_domain=None):
+    """WHERE conditions selecting the users a bulk operation applies to.
+
+    Admin accounts are never included. Raises ValueError when nothing narrows the
+    selection, so a blank form can't moderate every account at once.
+    """
+    conds = []
+    if user_ids:
+        conds.append(User.id.in_([int(i) for i in user_ids]))
+    if role:
+        conds.append(User.role == role)
+    if status:
+        conds.append(User.status == status)
+    if created_after:
+        conds.append(User.date_created >= created_after)
+    if created_before:
+        conds.append(User.date_created < created_before)
+    if email_domain:
+        domain = email_domain.strip().lstrip('@').lower()
+        conds.append(func.lower(User.email).like('%@' + domain))
+
+    if not conds:
+        raise ValueError('Select users or give at least one filter.')
+    conds.append(User.role != 'Admin')
+    return conds
+
+
+def count_users(conds):
+    return db.session.scalar(db.select(func.count()).select_from(User).where(*conds))
+
+
+def bulk_set_status(conds, new_status):
+    """One UPDATE for every matching user not already in new_status. Returns affected count."""
+    result = db.session.execute(
+        db.update(User)
+        .where(*conds, User.status != new_status)
+        .values(status=new_status)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def bulk_delete(conds, dry_run=False):
+    """Delete every matching user and their dependent rows in one transaction.
+
+    Returns the per-table counts from website.cascade (rows that would be touched if dry_run).
+    """
+    return cascade.delete_users(conds, dry_run=dry_run)
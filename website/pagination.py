@@ -0,0 +1,49 @@
+import base64
+import json
+
+from sqlalchemy import tuple_
+
+
+# Keyset ("seek") pagination helpers.
+# A cursor is the sort-key values of the last row on the page, so the next page is an
+# index range read (WHERE (a, id) > (?, ?)) instead of an OFFSET scan.
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Return the list of values in a cursor, or None if it is missing/invalid."""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def apply_keyset(stmt, columns, cursor=None, descending=False):
+    """Add the seek condition for `cursor` and the matching ORDER BY to a select.
+
+    `columns` must end with a unique column (normally the primary key) so the order is total.
+    """
+    values = decode_cursor(cursor)
+    if values is not None and len(values) == len(columns):
+        if len(columns) == 1:
+            key, bound = columns[0], values[0]
+        else:
+            key, bound = tuple_(*columns), tuple(values)
+        stmt = stmt.where(key < bound if descending else key > bound)
+    return stmt.order_by(*[c.desc() if descending else c.asc() for c in columns])
+
+
+def split_page(rows, limit, key):
+    """Trim a result fetched with LIMIT limit+1 and build the cursor for the next page."""
+    rows = list(rows)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(key(rows[-1])) if has_more and rows else None
+    return rows, next_cursor
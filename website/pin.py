@@ -2,18 +2,23 @@ from flask import Blueprint, render_template, flash, redirect, url_for, request
 from flask_login import current_user, login_required
 from . import db
 from website.models import Request, Review, User
+from .changes import conditional_get
+from . import archive
+from . import bulk_import
 
 # url holders
 pin = Blueprint('pin', __name__)
 
 @pin.route('/pin/profile')
 @login_required
+@conditional_get('request', 'review', 'category', 'volunteer', 'user', 'request_counters')
 def pin_profile():
     if current_user.role != 'PIN':
         flash('Access denied.', 'danger')
         return redirect(url_for('views.home'))
     
-    requests = Request.query.filter_by(user_id=current_user.id).order_by(Request.date_created.desc()).all()
+    # full history: archived completed requests are merged in
+    requests = archive.requests_for_user(current_user.id)
     
     return render_template("pin_profile.html", requests=requests)
 
@@ -54,4 +59,36 @@ def review_request(request_id):
         flash("Thank you for your feedback!", "success")
         return redirect(url_for('views.home'))
 
-    return render_template('review.html', req=req)
\ No newline at end of file
+    return render_template('review.html', req=req)
+
+
+# Bulk import of requests from a CSV/NDJSON file (partner organisations' spreadsheets)
+@pin.route('/pin/import-requests', methods=['GET', 'POST'])
+@login_required
+def import_requests():
+    if current_user.role != 'PIN':
+        flash('Access denied.', 'danger')
+        return redirect(url_for('views.home'))
+
+    result = None
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Please choose a file to import.', 'danger')
+            return redirect(url_for('pin.import_requests'))
+        fmt = request.form.get('format') or bulk_import.format_for(upload.filename)
+        try:
+            # the upload is read as a stream (werkzeug spools large files to disk)
+            result = bulk_import.import_requests(
+                bulk_import.text_stream(upload.stream), fmt, current_user.id)
+        except bulk_import.ImportFormatError as e:
+            flash(f'Could not read the file: {e}', 'danger')
+            return redirect(url_for('pin.import_requests'))
+        flash(f"Imported {result['imported']} requests ({result['flagged']} flagged as possible "
+              f"duplicates); {result['failed']} rows skipped.",
+              'success' if not result['failed'] and not result['stopped'] else 'warning')
+        if result['stopped']:
+            flash(f"{result['stopped']} The rest of the file was not imported.", 'danger')
+
+    return render_template('pin_import_requests.html', result=result,
+                           max_errors=bulk_import.MAX_REPORTED_ERRORS)
@@ -1,13 +1,18 @@
 from flask import Blueprint, render_template, flash, redirect, request, url_for
 from flask_login import login_required, current_user
-from .models import Category, Volunteer, Review, Request, User, Csr
+from .models import Category, Volunteer, VolunteerSkill, Review, Request, RequestArchive, User, Csr
 from sqlalchemy import func
 from . import db
+from .category_cache import categories as category_cache
+from . import archive
+from . import rollups
+from .read_routing import read_snapshot
 
 platform = Blueprint('platform', __name__)
 
 @platform.route('/platform-manager/dashboard')
 @login_required
+@read_snapshot
 def platform_manager_dashboard():
     # Check if user is platform manager
     if current_user.role != 'Platform Manager':
@@ -21,33 +26,35 @@ def platform_manager_dashboard():
     # Total volunteers
     total_volunteers = Volunteer.query.count()
     
-    # Total completed tasks
-    total_completed_tasks = Request.query.filter_by(status='Completed').count()
+    # Total completed tasks (archived requests are all completed)
+    total_completed_tasks = Request.query.filter_by(status='Completed').count() + RequestArchive.query.count()
 
     # Get all categories
-    categories = Category.query.order_by(Category.name).all()
+    categories = category_cache.all()
     
-    # Total reviews
-    total_reviews = Review.query.count()
+    # Total reviews and overall average rating (hot + archived reviews)
+    total_reviews, overall_avg_rating = archive.review_stats()
     
-    # Overall average rating
-    avg_rating_result = db.session.query(func.avg(Review.rating)).scalar()
-    overall_avg_rating = float(avg_rating_result) if avg_rating_result else None
-    
-    # Rating distribution (count of each rating 1-5)
-    rating_distribution = {}
-    for rating in range(5, 0, -1):  # 5 to 1 stars
-        count = Review.query.filter_by(rating=rating).count()
-        rating_distribution[rating] = count
+    # Rating distribution (count of each rating 1-5), one grouped query
+    ratings = archive.all_ratings()
+    counts = dict(db.session.execute(
+        db.select(ratings.c.rating, func.count()).group_by(ratings.c.rating)
+    ).all())
+    rating_distribution = {rating: counts.get(rating, 0) for rating in range(5, 0, -1)}  # 5 to 1 stars
     
     # Volunteer statistics with their performance
     volunteer_stats = []
     volunteers = Volunteer.query.all()
+    per_volunteer = {
+        vid: (count, float(avg) if avg is not None else None)
+        for vid, count, avg in db.session.execute(
+            db.select(ratings.c.volunteer_id, func.count(), func.avg(ratings.c.rating))
+            .group_by(ratings.c.volunteer_id)
+        ).all()
+    }
     
     for vol in volunteers:
-        reviews = Review.query.filter_by(volunteer_id=vol.id).all()
-        review_count = len(reviews)
-        avg_rating = sum(r.rating for r in reviews) / review_count if review_count > 0 else None
+        review_count, avg_rating = per_volunteer.get(vol.id, (0, None))
         
         volunteer_stats.append({
             'name': vol.user.name,
@@ -185,8 +192,9 @@ def delete_category(category_id):
 
     category = Category.query.get_or_404(category_id)
 
-    # count dependents - check requests using the category + volunteers linked to category 
-    req_count = Request.query.filter_by(category_id=category.id).count()
+    # count dependents - check requests (live and archived) using the category + volunteers linked to category 
+    req_count = (Request.query.filter_by(category_id=category.id).count()
+                 + RequestArchive.query.filter_by(category_id=category.id).count())
     vol_q = Volunteer.query.filter_by(category_id=category.id)
     vol_count = vol_q.count()
 
@@ -199,17 +207,26 @@ def delete_category(category_id):
         )
         return redirect(url_for('platform.platform_manager_dashboard'))
 
+    # volunteers with it as an extra skill lose just that skill
+    skill_count = db.session.scalar(
+        db.select(func.count()).select_from(VolunteerSkill).where(VolunteerSkill.category_id == category.id)
+    )
+
     # if volunteers are attached to category, remove their relation
     if vol_count > 0:
         for v in vol_q.all():
             v.category_id = None
         db.session.flush()  # stage updates so delete dont violate FKs
+    db.session.execute(
+        db.delete(VolunteerSkill).where(VolunteerSkill.category_id == category.id)
+        .execution_options(synchronize_session=False)
+    )
 
     try:
         db.session.delete(category)
         db.session.commit()
-        if vol_count > 0:
-            flash(f'Category "{category.name}" deleted. {vol_count} volunteer(s) were detached.', 'success')
+        if skill_count > 0:
+            flash(f'Category "{category.name}" deleted. {skill_count} volunteer(s) were detached.', 'success')
         else:
             flash(f'Category "{category.name}" deleted.', 'success')
     except Exception:
@@ -242,12 +259,18 @@ def _safe_date(value, default=None):
     except Exception:
         return default
 
+def _category_name(category_id):
+    category = category_cache.get(category_id)
+    return category.name if category else "Unassigned"
+
+
+def _granularity(value):
+    return value if value in rollups.GRANULARITIES else "day"
 
-def _request_date_col():
-    return Request.date_created
 
 @platform.route("/reports", methods=["GET", "POST"])
 @login_required
+@read_snapshot
 def platform_reports():
     if not _ensure_platform_manager():
         flash("Only Platform Managers can access reports.", "danger")
@@ -259,30 +282,35 @@ def platform_reports():
     default_end = today
 
     # form values
-    if request.method == "POST":
-        start_date = _safe_date(request.form.get("start_date"), default_start)
-        end_date = _safe_date(request.form.get("end_date"), default_end)
-        report_type = request.form.get("report_type") or "summary"
-    else:
-        start_date = _safe_date(request.args.get("start_date"), default_start)
-        end_date = _safe_date(request.args.get("end_date"), default_end)
-        report_type = request.args.get("report_type") or "summary"
-
-    # normalize end to include that full day
-    end_dt_inclusive = datetime.combine(end_date, datetime.max.time())
-    start_dt_inclusive = datetime.combine(start_date, datetime.min.time())
-
-    # build query
-    date_col = _request_date_col()
-    q = Request.query.filter(date_col.between(start_dt_inclusive, end_dt_inclusive))
-
-    # optional: eager load category (only if you have relationship named "category")
-    # q = q.options(joinedload(Request.category))
-
-    requests = q.all()
+    values = request.form if request.method == "POST" else request.args
+    start_date = _safe_date(values.get("start_date"), default_start)
+    end_date = _safe_date(values.get("end_date"), default_end)
+    report_type = values.get("report_type") or "summary"
+    granularity = _granularity(values.get("granularity"))
+
+    if report_type == "trend":
+        # a few rollup rows per day, whatever the range
+        statuses, trend_rows = rollups.trend(start_date, end_date, granularity)
+        return render_template(
+            "platform_reports.html",
+            start_date=start_date,
+            end_date=end_date,
+            report_type=report_type,
+            granularity=granularity,
+            trend={"statuses": statuses, "rows": trend_rows},
+            summary=None,
+            detailed=None
+        )
 
     # --- prepare data for Summary or Detailed
     if report_type == "detailed":
+        # normalize end to include that full day
+        end_dt_inclusive = datetime.combine(end_date, datetime.max.time())
+        start_dt_inclusive = datetime.combine(start_date, datetime.min.time())
+
+        # hot requests, plus archived ones when the range reaches back into the archive
+        requests = archive.requests_between(start_dt_inclusive, end_dt_inclusive)
+
         # rows for table
         detailed_rows = []
         for r in requests:
@@ -306,38 +334,27 @@ def platform_reports():
             start_date=start_date,
             end_date=end_date,
             report_type=report_type,
+            granularity=granularity,
             detailed=detailed_rows,
             summary=None
         )
 
-    # summary (default): totals by category + totals by status
-    by_category = {}
-    by_status = {}
-
-    for r in requests:
-        cat = getattr(getattr(r, "category", None), "name", "Unassigned")
-        by_category[cat] = by_category.get(cat, 0) + 1
-
-        st = getattr(r, "status", "Unknown")
-        by_status[st] = by_status.get(st, 0) + 1
-
-    summary = {
-        "total_requests": len(requests),
-        "by_category": sorted(by_category.items(), key=lambda x: x[0].lower()),
-        "by_status": sorted(by_status.items(), key=lambda x: x[0].lower()),
-    }
+    # summary (default): totals by category + totals by status, from the daily rollup
+    summary = rollups.summary(start_date, end_date, _category_name)
 
     return render_template(
         "platform_reports.html",
         start_date=start_date,
         end_date=end_date,
         report_type="summary",
+        granularity=granularity,
         summary=summary,
         detailed=None
     )
 
 @platform.route("/reports/export", methods=["POST"])
 @login_required
+@read_snapshot
 def platform_reports_export():
     if not _ensure_platform_manager():
         flash("Only Platform Managers can download reports.", "danger")
@@ -350,18 +367,16 @@ def platform_reports_export():
         flash("Please select a valid date range.", "warning")
         return redirect(url_for("platform.platform_reports"))
 
-    date_col = _request_date_col()
-    start_dt_inclusive = datetime.combine(start_date, datetime.min.time())
-    end_dt_inclusive = datetime.combine(end_date, datetime.max.time())
-
-    q = Request.query.filter(date_col.between(start_dt_inclusive, end_dt_inclusive))
-    requests = q.all()
-
     # Create CSV in memory
     si = StringIO()
     writer = csv.writer(si)
 
     if report_type == "detailed":
+        start_dt_inclusive = datetime.combine(start_date, datetime.min.time())
+        end_dt_inclusive = datetime.combine(end_date, datetime.max.time())
+
+        requests = archive.requests_between(start_dt_inclusive, end_dt_inclusive)
+
         writer.writerow(["ID", "Title", "Category", "Status", "Created On", "Views"])
         for r in requests:
             category_name = getattr(getattr(r, "category", None), "name", "Unassigned")
@@ -374,28 +389,31 @@ def platform_reports_export():
 
         filename = f"requests_detailed_{start_date}_to_{end_date}.csv"
 
+    elif report_type == "trend":
+        granularity = _granularity(request.form.get("granularity"))
+        statuses, trend_rows = rollups.trend(start_date, end_date, granularity)
+
+        writer.writerow(["Period (" + granularity + ")", "Created"] + statuses)
+        for period, created, counts in trend_rows:
+            writer.writerow([period.isoformat(), created] + counts)
+
+        filename = f"requests_trend_{granularity}_{start_date}_to_{end_date}.csv"
+
     else:
         # summary
-        by_category = {}
-        by_status = {}
-        for r in requests:
-            cat = getattr(getattr(r, "category", None), "name", "Unassigned")
-            by_category[cat] = by_category.get(cat, 0) + 1
-
-            st = getattr(r, "status", "Unknown")
-            by_status[st] = by_status.get(st, 0) + 1
+        summary = rollups.summary(start_date, end_date, _category_name)
 
         writer.writerow(["Summary", f"{start_date} to {end_date}"])
-        writer.writerow(["Total Requests", len(requests)])
+        writer.writerow(["Total Requests", summary["total_requests"]])
         writer.writerow([])
         writer.writerow(["By Category"])
         writer.writerow(["Category", "Count"])
-        for k, v in sorted(by_category.items(), key=lambda x: x[0].lower()):
+        for k, v in summary["by_category"]:
             writer.writerow([k, v])
         writer.writerow([])
         writer.writerow(["By Status"])
         writer.writerow(["Status", "Count"])
-        for k, v in sorted(by_status.items(), key=lambda x: x[0].lower()):
+        for k, v in summary["by_status"]:
             writer.writerow([k, v])
 
         filename = f"requests_summary_{start_date}_to_{end_date}.csv"
@@ -0,0 +1,93 @@
+from functools import wraps
+
+from flask import current_app
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+# Bind key (SQLALCHEMY_BINDS) of the read engine: the same SQLite file opened read-only.
+# With the database in WAL mode its readers and the primary's writers don't block each
+# other, and it has its own connection pool, so long reports can't hold up request
+# creation/assignment.
+READ_BIND = 'read'
+
+_READING_KEY = 'read_snapshot'
+
+
+def read_uri(db_path):
+    """SQLAlchemy URI opening db_path read-only (SQLite URI filename, mode=ro)."""
+    return 'sqlite:///file:' + db_path.replace('\\', '/') + '?mode=ro&uri=true'
+
+
+class RoutingSession(Session):
+    """Session sending SELECTs to the read engine while a read_snapshot view runs.
+
+    Everything else (flushes, INSERT/UPDATE/DELETE, raw connections) stays on the
+    primary, and outside those views the session behaves as before. Objects loaded
+    from either engine share the identity map.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and self.info.get(_READING_KEY) and not self._flushing
+                and getattr(clause, 'is_select', False)):
+            engine = self._db.engines.get(READ_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def primary():
+    """bind_arguments sending a query to the primary even inside a read_snapshot view.
+
+    For the per-process caches (categories, skills, volunteer locations, titles): they
+    reload because a change stamp moved, and the view's snapshot may be older than that
+    change, so loading from it would keep stale rows under the new stamp.
+    """
+    return {'bind': current_app.extensions['sqlalchemy'].engines[None]}
+
+
+def read_snapshot(view):
+    """Run a read-only view's queries on the read engine, in one read transaction.
+
+    For reports, dashboards and listings: they see a consistent snapshot of the
+    committed data (not this request's own unflushed writes, so don't use it on views
+    that write).
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        session = current_app.extensions['sqlalchemy'].session
+        session.info[_READING_KEY] = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            session.info.pop(_READING_KEY, None)
+    return wrapper
+
+
+# --- Engines ---
+
+def _use_wal(dbapi_connection, connection_record):
+    # persistent in the file; a no-op once the database is in WAL mode
+    dbapi_connection.execute('PRAGMA journal_mode=WAL')
+
+
+def _no_implicit_transactions(dbapi_connection, connection_record):
+    # let SQLAlchemy emit BEGIN itself (below), so a read transaction spans every
+    # SELECT of a view instead of each statement seeing the latest commit
+    dbapi_connection.isolation_level = None
+
+
+def _begin(conn):
+    conn.exec_driver_sql('BEGIN')
+
+
+def init_app(app):
+    with app.app_context():
+        engines = current_app.extensions['sqlalchemy'].engines
+        primary, reader = engines[None], engines.get(READ_BIND)
+    if reader is None:
+        return
+    if not event.contains(primary, 'connect', _use_wal):
+        event.listen(primary, 'connect', _use_wal)
+    if not event.contains(reader, 'connect', _no_implicit_transactions):
+        event.listen(reader, 'connect', _no_implicit_transactions)
+        event.listen(reader, 'begin', _begin)
@@ -0,0 +1,224 @@
+from collections import OrderedDict, defaultdict
+from datetime import timedelta
+
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from . import db
+from .models import Request, RequestArchive, RequestDailyRollup
+
+_rollup = RequestDailyRollup.__table__
+
+# Column order of trend rows; statuses outside this list are appended after them
+TREND_STATUSES = ['Pending', 'Approved', 'Accepted', 'Assigned', 'In Progress', 'Completed']
+
+GRANULARITIES = ('day', 'week', 'month')
+
+
+def _key(day, category_id, status):
+    return (day, category_id, status or 'Pending')
+
+
+def _key_of(req):
+    created = req.date_created
+    return _key(created.date() if created is not None else None, req.category_id, req.status)
+
+
+def _apply(conn, deltas):
+    """Add {(day, category_id, status): delta} to the rollup (upsert; conn may be a Session)."""
+    rows = [
+        {'day': day, 'category_id': category_id, 'status': status, 'count': delta}
+        for (day, category_id, status), delta in deltas.items()
+        if delta and day is not None
+    ]
+    if not rows:
+        return
+    stmt = sqlite_insert(_rollup).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['day', 'category_id', 'status'],
+        set_={'count': _rollup.c.count + stmt.excluded.count},
+    )
+    conn.execute(stmt)
+
+
+# --- Incremental maintenance ---
+# ORM inserts/updates/deletes of Request are caught by mapper events (same connection and
+# transaction as the change); set-based statements call move()/adjust_where() themselves.
+
+def _after_insert(mapper, connection, target):
+    _apply(connection, {_key_of(target): 1})
+
+
+def _after_update(mapper, connection, target):
+    state = inspect(target)
+    changed = False
+    old = {}
+    for attr in ('date_created', 'category_id', 'status'):
+        hist = state.attrs[attr].history
+        if hist.has_changes():
+            changed = True
+            old[attr] = hist.deleted[0] if hist.deleted else None
+        else:
+            old[attr] = getattr(target, attr)
+    if not changed:
+        return
+    created = old['date_created']
+    old_key = _key(created.date() if created is not None else None, old['category_id'], old['status'])
+    new_key = _key_of(target)
+    if old_key != new_key:
+        _apply(connection, {old_key: -1, new_key: 1})
+
+
+def _after_delete(mapper, connection, target):
+    _apply(connection, {_key_of(target): -1})
+
+
+def move(req, previous_status, new_status):
+    """Record a status change made with a bulk UPDATE (see website.transitions)."""
+    created = req.date_created.date() if req.date_created is not None else None
+    old_key = _key(created, req.category_id, previous_status)
+    new_key = _key(created, req.category_id, new_status)
+    if old_key != new_key:
+        _apply(db.session, {old_key: -1, new_key: 1})
+
+
+def adjust_where(model, whereclause, sign=-1, status=None):
+    """Add (sign=1) or remove (sign=-1) the rows of model matching whereclause, in SQL.
+
+    Run it before the bulk statement it accounts for. status overrides the rows' own
+    status (e.g. to count them under the status an UPDATE is about to give them).
+    """
+    status_expr = db.literal(status) if status is not None else db.func.coalesce(model.status, 'Pending')
+    day = db.func.date(model.date_created)
+    select = (
+        db.select(day, model.category_id, status_expr, sign * db.func.count())
+        .where(whereclause)
+        .group_by(day, model.category_id, status_expr)
+    )
+    stmt = sqlite_insert(_rollup).from_select(['day', 'category_id', 'status', 'count'], select)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['day', 'category_id', 'status'],
+        set_={'count': _rollup.c.count + stmt.excluded.count},
+    )
+    db.session.execute(stmt)
+
+
+def rebuild(since=None):
+    """Recompute the rollup from the request and archive tables (all days, or days >= since).
+
+    Returns the number of rollup rows written.
+    """
+    day_cols = []
+    for model in (Request, RequestArchive):
+        day_cols.append(
+            db.select(
+                db.func.date(model.date_created).label('day'),
+                model.category_id.label('category_id'),
+                db.func.coalesce(model.status, 'Pending').label('status'),
+            ).where(model.date_created.is_not(None))
+        )
+    source = db.union_all(*day_cols).subquery()
+    select = db.select(source.c.day, source.c.category_id, source.c.status, db.func.count())
+    delete = db.delete(RequestDailyRollup)
+    if since is not None:
+        select = select.where(source.c.day >= since.isoformat())
+        delete = delete.where(RequestDailyRollup.day >= since)
+    select = select.group_by(source.c.day, source.c.category_id, source.c.status)
+
+    try:
+        db.session.execute(delete)
+        result = db.session.execute(
+            db.insert(RequestDailyRollup).from_select(['day', 'category_id', 'status', 'count'], select)
+        )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return result.rowcount
+
+
+def _keep_old_value(target, value, oldvalue, initiator):
+    return value
+
+
+def init_app(app):
+    if getattr(Request, '_rollup_tracking', False):
+        return
+    # load the previous value when an expired attribute is assigned, so _after_update
+    # knows which rollup row the request is leaving
+    for attr in (Request.date_created, Request.category_id, Request.status):
+        event.listen(attr, 'set', _keep_old_value, active_history=True, retval=True)
+    event.listen(Request, 'after_insert', _after_insert)
+    event.listen(Request, 'after_update', _after_update)
+    event.listen(Request, 'after_delete', _after_delete)
+    Request._rollup_tracking = True
+
+
+# --- Reads ---
+
+def _rows(start, end, category_id=None):
+    q = (
+        db.select(RequestDailyRollup.day, RequestDailyRollup.category_id,
+                  RequestDailyRollup.status, RequestDailyRollup.count)
+        .where(RequestDailyRollup.day.between(start, end), RequestDailyRollup.count != 0)
+    )
+    if category_id is not None:
+        q = q.where(RequestDailyRollup.category_id == category_id)
+    return db.session.execute(q).all()
+
+
+def _period(day, granularity):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def trend(start, end, granularity='day', category_id=None):
+    """Requests created per period in [start, end], split by current status.
+
+    Returns (statuses, rows): rows are (period start, created, [count per status]),
+    oldest first, with empty periods included.
+    """
+    buckets = defaultdict(lambda: defaultdict(int))
+    for day, _, status, count in _rows(start, end, category_id):
+        buckets[_period(day, granularity)][status] += count
+
+    seen = {status for counts in buckets.values() for status in counts}
+    statuses = [s for s in TREND_STATUSES if s in seen] or TREND_STATUSES[:]
+    statuses += sorted(seen - set(statuses))
+
+    periods = OrderedDict()
+    day = _period(start, granularity)
+    while day <= end:
+        periods[day] = buckets.get(day, {})
+        if granularity == 'month':
+            day = (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+        else:
+            day += timedelta(days=7 if granularity == 'week' else 1)
+
+    rows = [
+        (period, sum(counts.values()), [counts.get(s, 0) for s in statuses])
+        for period, counts in periods.items()
+    ]
+    return statuses, rows
+
+
+def summary(start, end, category_name):
+    """Totals by category and by status for requests created in [start, end].
+
+    category_name maps a category id to its display name.
+    """
+    by_category = defaultdict(int)
+    by_status = defaultdict(int)
+    total = 0
+    for _, category_id, status, count in _rows(start, end):
+        by_category[category_name(category_id)] += count
+        by_status[status] += count
+        total += count
+    return {
+        "total_requests": total,
+        "by_category": sorted(by_category.items(), key=lambda x: x[0].lower()),
+        "by_status": sorted(by_status.items(), key=lambda x: x[0].lower()),
+    }
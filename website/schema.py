@@ -0,0 +1,145 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from . import db
+
+# SQL run once right after a column is added, for columns derived from other data
+COLUMN_BACKFILLS = {
+    ('request', 'shortlist_count'):
+        'UPDATE request SET shortlist_count = '
+        '(SELECT COUNT(*) FROM shortlist WHERE shortlist.shortlist_request_id = request.id)',
+    # older views are dated at the request's creation (trending_seed: website.trending)
+    ('request', 'trending_score'):
+        'UPDATE request SET trending_score = trending_seed(date_created, view_count)',
+    # when older requests were completed isn't known: count their archive age from the upgrade
+    ('request', 'date_completed'):
+        "UPDATE request SET date_completed = datetime('now') WHERE status = 'Completed'",
+}
+
+
+def _fill_csr_feed(conn):
+    from .feed import fill  # also fills csr_affinity
+    fill(conn)
+
+
+def _fill_request_lsh(conn):
+    from .duplicates import fill  # also fills request.minhash
+    fill(conn)
+
+
+# Run once right after a table is created on an existing database, for derived tables:
+# SQL, or a function of the connection
+TABLE_BACKFILLS = {
+    'request_daily_rollup':
+        'INSERT INTO request_daily_rollup (day, category_id, status, count) '
+        'SELECT date(date_created), category_id, COALESCE(status, \'Pending\'), COUNT(*) FROM ('
+        ' SELECT date_created, category_id, status FROM request'
+        ' UNION ALL SELECT date_created, category_id, status FROM request_archive'
+        ') WHERE date_created IS NOT NULL GROUP BY 1, 2, 3',
+    'volunteer_skill':
+        'INSERT INTO volunteer_skill (volunteer_id, category_id) '
+        'SELECT id, category_id FROM volunteer WHERE category_id IS NOT NULL',
+    'csr_feed': _fill_csr_feed,
+    'request_lsh_band': _fill_request_lsh,
+}
+
+
+# Tables whose rows move to an archive table keeping their ids: they use AUTOINCREMENT
+# (older databases are rebuilt with it) and their sequence is kept past the archive's ids,
+# so SQLite never reissues an archived id
+ARCHIVED_ID_TABLES = {'request': 'request_archive', 'review': 'review_archive'}
+
+
+def upgrade_schema():
+    """Bring an existing database up to the current models (there are no migrations).
+
+    Creates missing tables, adds missing nullable/defaulted columns with ALTER TABLE and
+    creates indexes declared in the models that an older DB does not have yet.
+    Safe to run repeatedly.
+    """
+    engine = db.engine
+    existing_tables = set(inspect(engine).get_table_names())
+    db.create_all()
+
+    with engine.begin() as conn:
+        # reflect through the same connection: a large backfill would lock out another one
+        inspector = inspect(conn)
+        for table in db.metadata.sorted_tables:
+            existing = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=engine.dialect)
+                ddl = f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {col_type}'
+                default = _server_default_sql(column)
+                if default is not None:
+                    ddl += f' DEFAULT {default}'
+                conn.execute(text(ddl))
+                backfill = COLUMN_BACKFILLS.get((table.name, column.name))
+                if backfill:
+                    conn.execute(text(backfill))
+
+        for table_name, archive_name in ARCHIVED_ID_TABLES.items():
+            _use_autoincrement(conn, db.metadata.tables[table_name])
+            _seed_sequence(conn, table_name, archive_name)
+
+        # after the columns, so backfills can read and write the new ones
+        for table_name, backfill in TABLE_BACKFILLS.items():
+            if table_name not in existing_tables:
+                if callable(backfill):
+                    backfill(conn)
+                else:
+                    conn.execute(text(backfill))
+
+        # also recreates the indexes of tables rebuilt above
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+def _use_autoincrement(conn, table):
+    """Rebuild a table created without AUTOINCREMENT (copy, drop, rename; the caller
+    recreates its indexes)."""
+    sql = conn.execute(
+        text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': table.name}
+    ).scalar()
+    if sql is None or 'AUTOINCREMENT' in sql.upper():
+        return
+    rebuilt = f'{table.name}__rebuild'
+    create = str(CreateTable(table).compile(dialect=conn.dialect))
+    create = create.replace(f'CREATE TABLE {table.name} (', f'CREATE TABLE "{rebuilt}" (', 1)
+    columns = ', '.join(f'"{c.name}"' for c in table.columns)
+    conn.execute(text(create))
+    conn.execute(text(f'INSERT INTO "{rebuilt}" ({columns}) SELECT {columns} FROM "{table.name}"'))
+    conn.execute(text(f'DROP TABLE "{table.name}"'))
+    conn.execute(text(f'ALTER TABLE "{rebuilt}" RENAME TO "{table.name}"'))
+
+
+def _seed_sequence(conn, table_name, archive_name):
+    """Move table_name's AUTOINCREMENT counter past every id in archive_name."""
+    high = conn.execute(text(
+        f'SELECT MAX(COALESCE((SELECT MAX(id) FROM "{table_name}"), 0), '
+        f'COALESCE((SELECT MAX(id) FROM "{archive_name}"), 0))'
+    )).scalar()
+    updated = conn.execute(
+        text('UPDATE sqlite_sequence SET seq = MAX(seq, :high) WHERE name = :name'),
+        {'high': high, 'name': table_name},
+    ).rowcount
+    if not updated and high:
+        conn.execute(text('INSERT INTO sqlite_sequence (name, seq) VALUES (:name, :high)'),
+                     {'name': table_name, 'high': high})
+
+
+def _server_default_sql(column):
+    """Literal default for ALTER TABLE ADD COLUMN, so existing rows get a value."""
+    default = column.default
+    if default is None or not default.is_scalar:
+        return None
+    value = default.arg
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return None
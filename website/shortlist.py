@@ -1,39 +1,230 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify
 from flask_login import login_required, current_user
-import datetime
-from .models import User, Request, Shortlist
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from .models import User, Request, Shortlist, Category
 from . import db
+from . import feed
+from .pagination import apply_keyset, split_page
 
 shortlist = Blueprint('shortlist', __name__)
 
+SHORTLIST_PER_PAGE = 25
 
+
+# --- Shortlist service ---
+# Request.shortlist_count is adjusted in the same transaction as the Shortlist rows,
+# so pages can show popularity without a COUNT per request.
+
+def _clean_ids(request_ids):
+    """Request ids as a sorted list of ints; ValueError names the first one that isn't an id."""
+    ids = set()
+    for i in request_ids:
+        if isinstance(i, str):
+            i = i.strip()
+            if not i:
+                continue
+            if i.isascii() and i.isdigit():
+                ids.add(int(i))
+                continue
+        elif isinstance(i, int) and not isinstance(i, bool) and i >= 0:
+            ids.add(i)
+            continue
+        raise ValueError(f'Invalid request id: {str(i)[:40]!r}. No requests were changed.')
+    return sorted(ids)
+
+
+def add_to_shortlist(user_id, request_ids):
+    """Shortlist every request in request_ids for user_id. Returns how many were newly added."""
+    ids = _clean_ids(request_ids)
+    if not ids:
+        return 0
+    # one INSERT ... SELECT over the requests that exist; the counts follow the rows it
+    # actually inserted, so a concurrent add of the same request can't count it twice
+    new_ids = db.session.scalars(
+        sqlite_insert(Shortlist)
+        .from_select(
+            ['user_id', 'shortlist_request_id'],
+            db.select(db.literal(user_id), Request.id).where(Request.id.in_(ids)),
+        )
+        .on_conflict_do_nothing()
+        .returning(Shortlist.shortlist_request_id)
+    ).all()
+    if not new_ids:
+        return 0
+    db.session.execute(
+        db.update(Request)
+        .where(Request.id.in_(new_ids))
+        .values(shortlist_count=Request.shortlist_count + 1, version=Request.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    feed.shortlisted(user_id, new_ids)
+    return len(new_ids)
+
+
+def remove_from_shortlist(user_id, request_ids):
+    """Remove request_ids from user_id's shortlist. Returns how many were removed."""
+    ids = _clean_ids(request_ids)
+    if not ids:
+        return 0
+    # as in add_to_shortlist, only the rows this DELETE removed are counted down
+    removed_ids = db.session.scalars(
+        db.delete(Shortlist)
+        .where(Shortlist.user_id == user_id, Shortlist.shortlist_request_id.in_(ids))
+        .returning(Shortlist.shortlist_request_id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if not removed_ids:
+        return 0
+    db.session.execute(
+        db.update(Request)
+        .where(Request.id.in_(removed_ids))
+        .values(shortlist_count=Request.shortlist_count - 1, version=Request.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    feed.shortlisted(user_id, removed_ids, sign=-1)
+    return len(removed_ids)
+
+
+def recount_shortlists():
+    """Recompute every Request.shortlist_count from the Shortlist table in one UPDATE."""
+    count = (
+        db.select(db.func.count())
+        .select_from(Shortlist)
+        .where(Shortlist.shortlist_request_id == Request.id)
+        .scalar_subquery()
+    )
+    result = db.session.execute(
+        db.update(Request)
+        .values(shortlist_count=count, version=Request.version + 1)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def _is_csr():
+    return getattr(current_user, 'role', None) == 'CSR'
+
+
+# --- Routes ---
 @shortlist.route('/request/<int:request_id>/csr_shortlist', methods=['POST'])
 @login_required
 def shortlist_request(request_id):
-    csr_account_id = current_user.id
-
-    # check if the item is already shortlisted
-    existing_entry = Shortlist.query.get((csr_account_id, request_id))
+    redirect_page = request.referrer or url_for('views.home')
 
-    redirect_page = request.referrer or url_for('default_page')
+    try:
+        added = add_to_shortlist(current_user.id, [request_id])
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Database Error: {e}")
+        flash('An error occurred while saving to the shortlist.', 'danger')
+        return redirect(redirect_page)
 
-    if existing_entry:
+    if added:
+        flash(f'Request successfully added to shortlist!', 'success')
+    else:
         flash('Item is already in your shortlist.', 'info')
+    return redirect(redirect_page)
+
+
+@shortlist.route('/request/<int:request_id>/csr_unshortlist', methods=['POST'])
+@login_required
+def unshortlist_request(request_id):
+    redirect_page = request.referrer or url_for('shortlist.view_shortlist')
+
+    try:
+        removed = remove_from_shortlist(current_user.id, [request_id])
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Database Error: {e}")
+        flash('An error occurred while updating the shortlist.', 'danger')
         return redirect(redirect_page)
 
-    # create and add the new entry
-    new_shortlist = Shortlist(
-        user_id=csr_account_id,
-        shortlist_request_id=request_id
-    )
+    if removed:
+        flash('Request removed from shortlist.', 'success')
+    else:
+        flash('Item is not in your shortlist.', 'info')
+    return redirect(redirect_page)
+
+
+# Bulk add/remove (form with request_ids checkboxes, or JSON)
+@shortlist.route('/csr/shortlist/bulk', methods=['POST'])
+@login_required
+def bulk_shortlist():
+    wants_json = request.is_json
+    if not _is_csr():
+        if wants_json:
+            return jsonify({"error": "Unauthorized"}), 403
+        flash('Only CSR can access!', 'danger')
+        return redirect(url_for('views.home'))
+
+    if wants_json:
+        data = request.get_json(silent=True) or {}
+        action, request_ids = data.get('action'), data.get('request_ids') or []
+        if not isinstance(request_ids, list):
+            return jsonify({"error": "request_ids must be a list of request ids."}), 400
+    else:
+        action, request_ids = request.form.get('action'), request.form.getlist('request_ids')
+    redirect_page = request.referrer or url_for('shortlist.view_shortlist')
 
     try:
-        db.session.add(new_shortlist)
+        if action == 'add':
+            affected = add_to_shortlist(current_user.id, request_ids)
+        elif action == 'remove':
+            affected = remove_from_shortlist(current_user.id, request_ids)
+        else:
+            raise ValueError('Invalid shortlist action.')
         db.session.commit()
-        flash(f'Request successfully added to shortlist!', 'success')
+    except ValueError as e:
+        db.session.rollback()
+        if wants_json:
+            return jsonify({"error": str(e)}), 400
+        flash(str(e), 'danger')
+        return redirect(redirect_page)
     except Exception as e:
         db.session.rollback()
         print(f"Database Error: {e}")
-        flash('An error occurred while saving to the shortlist.', 'danger')
+        if wants_json:
+            return jsonify({"error": "Could not update shortlist."}), 500
+        flash('An error occurred while updating the shortlist.', 'danger')
+        return redirect(redirect_page)
+
+    if wants_json:
+        return jsonify({"action": action, "affected": affected}), 200
+    verb = 'added to' if action == 'add' else 'removed from'
+    flash(f'{affected} request(s) {verb} your shortlist.', 'success')
+    return redirect(redirect_page)
+
 
-    return redirect(redirect_page)
\ No newline at end of file
+# CSR's shortlist: one joined query per page, keyset paginated
+@shortlist.route('/csr/shortlist')
+@login_required
+def view_shortlist():
+    if not _is_csr():
+        flash('Only CSR can access!', 'danger')
+        return redirect(url_for('views.home'))
+
+    cursor = request.args.get('cursor')
+    q = (
+        db.select(Request, Category.name, User.name)
+        .join(Shortlist, Shortlist.shortlist_request_id == Request.id)
+        .join(Category, Category.id == Request.category_id)
+        .join(User, User.id == Request.user_id)
+        .where(Shortlist.user_id == current_user.id)
+    )
+    # newest requests first; Shortlist's (user_id, request_id) key serves the seek
+    q = apply_keyset(q, [Shortlist.shortlist_request_id], cursor, descending=True)
+    rows, next_cursor = split_page(
+        db.session.execute(q.limit(SHORTLIST_PER_PAGE + 1)).all(),
+        SHORTLIST_PER_PAGE,
+        key=lambda row: [row[0].id],
+    )
+
+    return render_template(
+        'csr_shortlist.html',
+        rows=rows,
+        next_cursor=next_cursor,
+        is_first_page=not cursor,
+    )
@@ -0,0 +1,297 @@
+import re
+import threading
+from collections import namedtuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, object_session
+
+from . import db
+from . import changes
+from . import read_routing
+from .models import User, Volunteer, VolunteerSkill
+
+_skill_table = VolunteerSkill.__table__
+
+# Stamp file (see website.changes) rewritten when who is available may have changed: a
+# volunteer's is_available, volunteers added or removed, or an account's status. Other
+# profile and user writes leave the availability bitmap alone.
+AVAILABILITY_STAMP = 'volunteer_availability'
+
+_AVAILABILITY_KEY = 'volunteer_availability_changed'
+
+_ONE = re.compile('1')
+
+
+# --- Bitmaps ---
+# Sets of volunteer ids as Python ints (bit n set = volunteer n), so "available and has
+# skill X and Y" is a couple of ANDs over a few KB however many volunteers there are.
+
+def bitmap(ids):
+    ids = list(ids)
+    if not ids:
+        return 0
+    buf = bytearray(max(ids) // 8 + 1)
+    for i in ids:
+        buf[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buf, 'little')
+
+
+def members(bits, limit=None):
+    """Ids set in a bitmap, ascending (at most limit of them)."""
+    if not bits:
+        return []
+    # the reversed binary string has bit n at index n; the regex scan runs in C
+    digits = bin(bits)[:1:-1]
+    ids = []
+    for match in _ONE.finditer(digits):
+        ids.append(match.start())
+        if limit is not None and len(ids) >= limit:
+            break
+    return ids
+
+
+_Skills = namedtuple('_Skills', ['stamp', 'by_category', 'by_volunteer'])
+_Availability = namedtuple('_Availability', ['stamp', 'bits', 'matches'])
+
+
+class SkillIndex:
+    """Per-process bitmaps: volunteers per skill (category) and volunteers available now.
+
+    Available means is_available and an Active account. Each bitmap is reloaded, with one
+    query, only when what it is built from changed: commits touching volunteer_skill
+    rewrite its stamp file through website.changes, and commits changing availability
+    rewrite AVAILABILITY_STAMP (from any worker). Stamps are read once per request, so
+    lookups cost neither a query nor a file read each.
+    """
+
+    def __init__(self):
+        self._skills = None
+        self._availability = None
+        self._lock = threading.Lock()
+
+    def _skill_bitmaps(self):
+        current_stamp = changes.request_stamp('volunteer_skill')
+        snap = self._skills
+        if snap is not None and snap.stamp == current_stamp:
+            return snap
+        with self._lock:
+            snap = self._skills
+            if snap is not None and snap.stamp == current_stamp:
+                return snap
+            ids_by_category = {}
+            by_volunteer = {}
+            for volunteer_id, category_id in db.session.execute(
+                db.select(VolunteerSkill.volunteer_id, VolunteerSkill.category_id),
+                bind_arguments=read_routing.primary(),
+            ):
+                ids_by_category.setdefault(category_id, []).append(volunteer_id)
+                by_volunteer.setdefault(volunteer_id, []).append(category_id)
+            snap = _Skills(
+                stamp=current_stamp,
+                by_category={cid: bitmap(ids) for cid, ids in ids_by_category.items()},
+                by_volunteer=by_volunteer,
+            )
+            self._skills = snap
+            return snap
+
+    def _available(self):
+        current_stamp = changes.request_stamp(AVAILABILITY_STAMP)
+        snap = self._availability
+        if snap is not None and snap.stamp == current_stamp:
+            return snap
+        with self._lock:
+            snap = self._availability
+            if snap is not None and snap.stamp == current_stamp:
+                return snap
+            ids = db.session.scalars(
+                db.select(Volunteer.id)
+                .join(User, User.id == Volunteer.user_id)
+                .where(Volunteer.is_available.is_(True), User.status == 'Active'),
+                bind_arguments=read_routing.primary(),
+            ).all()
+            # matches: memo of available_with() results for this availability + skills state
+            snap = _Availability(stamp=current_stamp, bits=bitmap(ids), matches={})
+            self._availability = snap
+            return snap
+
+    def with_skills(self, *category_ids):
+        """Bitmap of volunteers having every one of the skills."""
+        by_category = self._skill_bitmaps().by_category
+        bits = None
+        for category_id in category_ids:
+            skill = by_category.get(int(category_id), 0)
+            bits = skill if bits is None else bits & skill
+        return bits or 0
+
+    def available_bits(self):
+        return self._available().bits
+
+    def available_with(self, *category_ids, limit=None):
+        """Ids of available volunteers having every one of the skills, ascending."""
+        skills = self._skill_bitmaps()
+        available = self._available()
+        key = (skills.stamp, frozenset(int(c) for c in category_ids), limit)
+        ids = available.matches.get(key)
+        if ids is None:
+            ids = members(self.with_skills(*category_ids) & available.bits, limit)
+            available.matches[key] = ids
+        return ids
+
+    def is_available(self, volunteer_id):
+        return bool(self._available().bits >> volunteer_id & 1)
+
+    def skills_of(self, volunteer_id):
+        """Category ids of a volunteer's skills."""
+        return self._skill_bitmaps().by_volunteer.get(volunteer_id, [])
+
+    def invalidate(self):
+        self._skills = None
+        self._availability = None
+
+
+skill_index = SkillIndex()
+
+
+# --- Editing ---
+
+def set_skills(volunteer, category_ids):
+    """Replace a volunteer's skills in the current transaction (caller commits).
+
+    The primary category stays if it is still among them; otherwise the first skill
+    (or None) becomes primary.
+    """
+    wanted = []
+    for category_id in category_ids:
+        category_id = int(category_id)
+        if category_id not in wanted:
+            wanted.append(category_id)
+
+    db.session.execute(
+        db.delete(VolunteerSkill)
+        .where(VolunteerSkill.volunteer_id == volunteer.id, VolunteerSkill.category_id.not_in(wanted))
+        .execution_options(synchronize_session=False)
+    )
+    if wanted:
+        db.session.execute(
+            sqlite_insert(VolunteerSkill)
+            .values([{'volunteer_id': volunteer.id, 'category_id': cid} for cid in wanted])
+            .on_conflict_do_nothing()
+        )
+    if volunteer.category_id not in wanted:
+        volunteer.category_id = wanted[0] if wanted else None
+    db.session.expire(volunteer, ['skills'])
+
+
+def parse_skill_ids(values, known):
+    """Category ids from submitted form values, keeping only those known(id) accepts."""
+    ids = []
+    for value in values:
+        try:
+            category_id = int(value)
+        except (TypeError, ValueError):
+            continue
+        if known(category_id) and category_id not in ids:
+            ids.append(category_id)
+    return ids
+
+
+# --- Primary category ---
+# Code that sets Volunteer.category_id directly (sign-up, seed and mapping CLIs, category
+# deletion) keeps meaning "this volunteer's category": the old primary skill is swapped for
+# the new one, other skills are left alone.
+
+def _sync_primary(connection, target, old_category_id):
+    if old_category_id == target.category_id:
+        return
+    if old_category_id is not None:
+        connection.execute(
+            _skill_table.delete().where(
+                _skill_table.c.volunteer_id == target.id,
+                _skill_table.c.category_id == old_category_id,
+            )
+        )
+    if target.category_id is not None:
+        connection.execute(
+            sqlite_insert(_skill_table)
+            .values(volunteer_id=target.id, category_id=target.category_id)
+            .on_conflict_do_nothing()
+        )
+    session = object_session(target)
+    if session is not None:
+        changes.note(session, 'volunteer_skill')
+
+
+def _after_insert(mapper, connection, target):
+    _sync_primary(connection, target, None)
+
+
+def _after_update(mapper, connection, target):
+    hist = inspect(target).attrs.category_id.history
+    if hist.has_changes():
+        _sync_primary(connection, target, hist.deleted[0] if hist.deleted else None)
+
+
+def _keep_old_value(target, value, oldvalue, initiator):
+    return value
+
+
+# --- Availability changes ---
+# Flagged on the session by mapper events (and by bulk UPDATE/DELETE of volunteers or
+# users, which can't be inspected row by row); the stamp is rewritten once it commits.
+
+def _flag_availability(session):
+    if session is not None:
+        session.info[_AVAILABILITY_KEY] = True
+
+
+def _volunteer_added_or_removed(mapper, connection, target):
+    _flag_availability(object_session(target))
+
+
+def _volunteer_updated(mapper, connection, target):
+    if inspect(target).attrs.is_available.history.has_changes():
+        _flag_availability(object_session(target))
+
+
+def _user_updated(mapper, connection, target):
+    if inspect(target).attrs.status.history.has_changes():
+        _flag_availability(object_session(target))
+
+
+def _user_deleted(mapper, connection, target):
+    _flag_availability(object_session(target))
+
+
+def _do_orm_execute(state):
+    if (state.is_update or state.is_delete) and state.bind_mapper is not None \
+            and state.bind_mapper.class_ in (Volunteer, User):
+        _flag_availability(state.session)
+
+
+def _after_commit(session):
+    if session.info.pop(_AVAILABILITY_KEY, None):
+        changes.touch_stamp(AVAILABILITY_STAMP)
+
+
+def _after_rollback(session):
+    session.info.pop(_AVAILABILITY_KEY, None)
+
+
+def init_app(app):
+    if getattr(Volunteer, '_skill_tracking', False):
+        return
+    # load the previous category when an expired attribute is assigned, so _after_update
+    # knows which skill row to swap out
+    event.listen(Volunteer.category_id, 'set', _keep_old_value, active_history=True, retval=True)
+    event.listen(Volunteer, 'after_insert', _after_insert)
+    event.listen(Volunteer, 'after_update', _after_update)
+    event.listen(Volunteer, 'after_insert', _volunteer_added_or_removed)
+    event.listen(Volunteer, 'after_delete', _volunteer_added_or_removed)
+    event.listen(Volunteer, 'after_update', _volunteer_updated)
+    event.listen(User, 'after_update', _user_updated)
+    event.listen(User, 'after_delete', _user_deleted)
+    event.listen(Session, 'do_orm_execute', _do_orm_execute)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
+    Volunteer._skill_tracking = True
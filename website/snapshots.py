@@ -0,0 +1,126 @@
+import os
+import re
+import shutil
+import sqlite3
+from datetime import datetime
+
+from . import db
+
+SNAPSHOT_DIR_NAME = "snapshots"
+SNAPSHOT_EXT = ".db"
+
+# snapshot names become file names under instance/snapshots
+_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$")
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def _db_path():
+    url = db.engine.url
+    if url.get_backend_name() != "sqlite" or not url.database:
+        raise SnapshotError("Snapshots are only supported for file-based SQLite databases.")
+    return url.database
+
+
+def snapshot_dir():
+    # next to the live DB, i.e. instance/snapshots
+    path = os.path.join(os.path.dirname(_db_path()), SNAPSHOT_DIR_NAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _snapshot_path(name):
+    if not name or not _NAME_RE.match(name):
+        raise SnapshotError("Snapshot names may only use letters, digits, '.', '_' and '-'.")
+    return os.path.join(snapshot_dir(), name + SNAPSHOT_EXT)
+
+
+def list_snapshots():
+    snapshots = []
+    for entry in os.scandir(snapshot_dir()):
+        if entry.is_file() and entry.name.endswith(SNAPSHOT_EXT):
+            stat = entry.stat()
+            snapshots.append({
+                "name": entry.name[:-len(SNAPSHOT_EXT)],
+                "size": stat.st_size,
+                "created": datetime.fromtimestamp(stat.st_mtime).isoformat(timespec="seconds"),
+            })
+    return sorted(snapshots, key=lambda s: s["created"], reverse=True)
+
+
+def save_snapshot(name, overwrite=False):
+    """Copy the live database to a named snapshot with SQLite's online backup API.
+
+    The backup reads the source under a shared lock, so live readers keep working.
+    It is written to a temp file and renamed, so a half-written snapshot never
+    replaces a good one.
+    """
+    target = _snapshot_path(name)
+    if os.path.exists(target) and not overwrite:
+        raise SnapshotError(f"Snapshot '{name}' already exists.")
+
+    tmp = target + ".tmp"
+    src = sqlite3.connect(_db_path())
+    dst = sqlite3.connect(tmp)
+    try:
+        with dst:
+            src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+    os.replace(tmp, target)
+    return target
+
+
+def restore_snapshot(name, method="backup"):
+    """Replace the live database with a named snapshot.
+
+    method="backup" streams the snapshot into the live file through the backup API,
+    which takes the write lock for the duration and is safe while the app is running.
+    method="copy" swaps the file in place and is only safe when nothing else has the
+    database open (e.g. a stopped server restoring a benchmark fixture).
+    """
+    source = _snapshot_path(name)
+    if not os.path.exists(source):
+        raise SnapshotError(f"Snapshot '{name}' does not exist.")
+    live = _db_path()
+
+    # drop pooled connections so nothing keeps reading the old pages/file
+    db.session.remove()
+    for engine in db.engines.values():
+        engine.dispose()
+
+    if method == "copy":
+        tmp = live + ".restore"
+        shutil.copyfile(source, tmp)
+        for suffix in ("-wal", "-shm", "-journal"):
+            if os.path.exists(live + suffix):
+                os.remove(live + suffix)
+        os.replace(tmp, live)
+    elif method == "backup":
+        src = sqlite3.connect(source)
+        dst = sqlite3.connect(live)
+        try:
+            with dst:
+                src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+    else:
+        raise SnapshotError(f"Unknown restore method '{method}'.")
+
+    # snapshots taken before a schema change still need the newer tables/indexes
+    from .schema import upgrade_schema
+    from . import changes
+    upgrade_schema()
+    # the restored markers may repeat versions clients already hold ETags for
+    changes.bump_all()
+
+
+def delete_snapshot(name):
+    path = _snapshot_path(name)
+    if not os.path.exists(path):
+        raise SnapshotError(f"Snapshot '{name}' does not exist.")
+    os.remove(path)
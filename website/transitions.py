@@ -0,0 +1,124 @@
+from datetime import datetime
+
+from sqlalchemy.orm.attributes import set_committed_value
+
+from . import db
+from . import events as request_events
+from . import feed
+from . import rollups
+from .models import Request, Volunteer
+
+# Request states
+PENDING = 'Pending'
+APPROVED = 'Approved'
+ACCEPTED = 'Accepted'
+ASSIGNED = 'Assigned'
+IN_PROGRESS = 'In Progress'
+COMPLETED = 'Completed'
+
+# action -> (states it may start from, resulting state)
+TRANSITIONS = {
+    'accept': ({PENDING, APPROVED}, ACCEPTED),                   # CSR takes the request on
+    'assign': ({PENDING, APPROVED, ACCEPTED}, ASSIGNED),         # CSR assigns a volunteer
+    'start': ({ASSIGNED}, IN_PROGRESS),                          # volunteer accepts the task
+    'decline': ({ASSIGNED, IN_PROGRESS}, ACCEPTED),              # volunteer hands it back
+    'complete': ({ASSIGNED, IN_PROGRESS}, COMPLETED),            # CSR or volunteer finishes it
+}
+
+
+class TransitionError(Exception):
+    """The action isn't allowed from the request's current state."""
+
+
+class TransitionConflict(TransitionError):
+    """Someone else changed the request (or claimed the volunteer) since it was read."""
+
+
+# --- Compare-and-swap ---
+# Each transition is a single UPDATE ... WHERE id = ? AND state_version = ? AND status IN (...);
+# if another worker got there first, no row matches and the caller gets a conflict
+# instead of silently overwriting it. No locks are held between the read and the write.
+# state_version only moves here; Request.version (bumped by any write) isn't compared.
+
+def transition(req, action, expected_version=None, assigned_to=None, **values):
+    """Move req through `action`, also setting `values` on it, in the current transaction.
+
+    expected_version is the state_version the user acted on (e.g. a hidden form field);
+    defaults to the one loaded in req. assigned_to, when given, requires the request
+    to still be assigned to that volunteer id. Returns the previous status.
+    """
+    allowed, target = TRANSITIONS[action]
+    if target == COMPLETED:
+        values.setdefault('date_completed', datetime.utcnow())
+    version = req.state_version if expected_version is None else expected_version
+    if req.state_version != version:
+        raise TransitionConflict(_conflict_message(req))
+    if req.status not in allowed:
+        raise TransitionError(f'Cannot {action} a request that is {req.status}.')
+
+    stmt = (
+        db.update(Request)
+        .where(Request.id == req.id, Request.state_version == version, Request.status.in_(allowed))
+        .values(status=target, state_version=version + 1, version=Request.version + 1, **values)
+        .execution_options(synchronize_session=False)
+    )
+    if assigned_to is not None:
+        stmt = stmt.where(Request.volunteer_id == assigned_to)
+    if db.session.execute(stmt).rowcount != 1:
+        raise TransitionConflict(_conflict_message(req))
+
+    previous_status, previous_volunteer_id = req.status, req.volunteer_id
+    # mirror the row without marking req dirty (that would bump the version again)
+    set_committed_value(req, 'status', target)
+    set_committed_value(req, 'state_version', version + 1)
+    db.session.expire(req, ['version'])
+    for key, value in values.items():
+        set_committed_value(req, key, value)
+
+    rollups.move(req, previous_status, target)
+    feed.request_moved(req)
+    request_events.request_status_changed(req, previous_status, previous_volunteer_id)
+    return previous_status
+
+
+def claim_volunteer(volunteer, required=True):
+    """Mark an available volunteer as busy; conflict if another assignment claimed them first.
+
+    required=False is for a volunteer who may already be busy with this very request
+    (starting a task they were assigned): no conflict then, the row is just left as is.
+    """
+    result = db.session.execute(
+        db.update(Volunteer)
+        .where(Volunteer.id == volunteer.id, Volunteer.is_available.is_(True))
+        .values(is_available=False)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1 and required:
+        db.session.refresh(volunteer)
+        raise TransitionConflict('That volunteer was just assigned to another request.')
+    set_committed_value(volunteer, 'is_available', False)
+
+
+def release_volunteer(volunteer, completed=False):
+    """Mark a volunteer available again, counting a completed task atomically in SQL."""
+    values = {'is_available': True}
+    if completed:
+        values['total_tasks_completed'] = Volunteer.total_tasks_completed + 1
+    db.session.execute(
+        db.update(Volunteer)
+        .where(Volunteer.id == volunteer.id)
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.expire(volunteer, ['is_available', 'total_tasks_completed'])
+
+
+def _conflict_message(req):
+    db.session.refresh(req)
+    return (f'"{req.title}" was changed by someone else (it is now {req.status}). '
+            'Please review it and try again.')
+
+
+def form_version(form):
+    """The request state_version a submitted form was rendered with, if it carried one."""
+    return form.get('state_version', type=int)
@@ -0,0 +1,74 @@
+import math
+from datetime import datetime
+
+from sqlalchemy import event
+
+from . import db
+from .models import Request
+
+# A view counts half as much after this long
+HALF_LIFE_HOURS = 24
+
+# Scores are kept relative to a fixed origin so they never need decaying in place
+EPOCH = datetime(2024, 1, 1)
+
+
+# --- Scores ---
+# trending_score = log2(sum over views of 2 ** age_units(view time)), where age_units counts
+# half-lives since EPOCH. At any instant every request's decayed view count is
+# 2 ** (trending_score - age_units(now)): the same factor for all of them, so ordering by the
+# stored column is ordering by the decayed count, and a view only touches its own row.
+# NULL means no views yet (sorts last when descending).
+
+def age_units(when):
+    return (when - EPOCH).total_seconds() / (HALF_LIFE_HOURS * 3600)
+
+
+def add_view(score, units):
+    """The score after one more view at `units`: log2(2**score + 2**units), overflow-free."""
+    if score is None:
+        return units
+    high, low = (score, units) if score >= units else (units, score)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def seed(date_created, view_count):
+    """A score for view_count views all dated at date_created (backfill of older rows)."""
+    if not view_count or date_created is None:
+        return None
+    if isinstance(date_created, str):
+        date_created = datetime.fromisoformat(date_created)
+    return age_units(date_created) + math.log2(view_count)
+
+
+def heat(score, now=None):
+    """Decayed view count of a score as of now (for display)."""
+    if score is None:
+        return 0.0
+    return 2 ** (score - age_units(now or datetime.utcnow()))
+
+
+def record_view(req):
+    """Count one view of req in the current transaction (caller commits).
+
+    Both columns are updated in SQL from their current values, so concurrent views
+    don't overwrite each other.
+    """
+    req.view_count = Request.view_count + 1
+    req.trending_score = db.func.trending_add(Request.trending_score, age_units(datetime.utcnow()))
+
+
+# --- SQL functions ---
+# Registered on every SQLite connection: trending_add(score, units) for record_view() and
+# trending_seed(date_created, view_count) for the schema backfill (website.schema).
+
+def _register_functions(dbapi_connection, connection_record):
+    dbapi_connection.create_function('trending_add', 2, add_view, deterministic=True)
+    dbapi_connection.create_function('trending_seed', 2, seed, deterministic=True)
+
+
+def init_app(app):
+    with app.app_context():
+        engine = db.engine
+    if not event.contains(engine, 'connect', _register_functions):
+        event.listen(engine, 'connect', _register_functions)
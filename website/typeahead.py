@@ -0,0 +1,254 @@
+import re
+import threading
+from bisect import bisect_left, insort
+
+from flask import current_app
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+from . import db
+from . import changes
+from . import read_routing
+from .category_cache import categories as category_cache
+from .models import Request
+
+# Entries looked at per suggestion query, whatever the prefix: bounds the work for very
+# short prefixes that match a large part of the index
+SCAN_LIMIT = 300
+
+DEFAULT_LIMIT = 8
+
+# Stamp file (see website.changes) rewritten when request titles change in another way than
+# this process can apply incrementally
+STAMP = 'request_title'
+
+_PENDING_KEY = 'typeahead_pending'
+_RESET_KEY = 'typeahead_reset'
+
+_SPACE = re.compile(r'\s+')
+
+
+def normalize(text):
+    return _SPACE.sub(' ', (text or '').lower()).strip()
+
+
+def _keys(norm):
+    """Index keys of a normalised title: the title from each word on, so any word can match."""
+    keys = [norm]
+    for match in re.finditer(' ', norm):
+        keys.append(norm[match.end():])
+    return keys
+
+
+class TitleIndex:
+    """Per-process sorted array of request titles, searched by prefix with bisect.
+
+    Each distinct title is stored once with the number of requests using it, under a key
+    per word (so "groc" finds "Weekly grocery shopping"). Titles this process inserts,
+    edits or deletes through the ORM are applied in place after commit; anything else (other
+    workers, bulk statements) rewrites the request_title stamp, and the titles are then
+    reloaded in one query on a background thread while lookups keep answering from the
+    previous index. Only the first lookup of a process waits for a load.
+    """
+
+    def __init__(self):
+        self._stamp = None
+        self._loaded = False
+        self._counts = {}   # title -> number of requests
+        self._keys = []     # sorted (key, title)
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._reloading = None  # background reload thread, while one runs
+
+    def _read(self):
+        """({title: count}, sorted [(key, title)]) of every request title."""
+        counts = {}
+        for title, count in db.session.execute(
+            db.select(Request.title, db.func.count()).group_by(Request.title),
+            bind_arguments=read_routing.primary(),
+        ):
+            if title:
+                counts[title] = count
+        keys = sorted(
+            (key, title) for title in counts for key in _keys(normalize(title))
+        )
+        return counts, keys
+
+    def _swap(self, counts, keys, stamp):
+        with self._lock:
+            self._counts, self._keys, self._stamp, self._loaded = counts, keys, stamp, True
+
+    def _reload(self, app, stamp):
+        try:
+            with app.app_context():
+                try:
+                    counts, keys = self._read()
+                finally:
+                    db.session.remove()
+            self._swap(counts, keys, stamp)
+        except Exception as e:
+            # keep serving the previous index; the next lookup tries again
+            print("Error reloading typeahead titles:", e)
+        finally:
+            self._reloading = None
+
+    def _ensure(self):
+        current_stamp = changes.stamp(STAMP)
+        if self._loaded and self._stamp == current_stamp:
+            return
+        if not self._loaded:
+            with self._load_lock:
+                if not self._loaded:
+                    self._swap(*self._read(), current_stamp)
+            return
+        with self._load_lock:
+            if self._reloading is None:
+                self._reloading = threading.Thread(
+                    target=self._reload, args=(current_app._get_current_object(), current_stamp),
+                    name='typeahead-reload', daemon=True)
+                self._reloading.start()
+
+    def _add(self, title, delta):
+        if not title:
+            return
+        before = self._counts.get(title, 0)
+        after = max(before + delta, 0)
+        if after:
+            self._counts[title] = after
+        else:
+            self._counts.pop(title, None)
+        if before and not after:
+            for key in _keys(normalize(title)):
+                i = bisect_left(self._keys, (key, title))
+                if i < len(self._keys) and self._keys[i] == (key, title):
+                    del self._keys[i]
+        elif after and not before:
+            for key in _keys(normalize(title)):
+                insort(self._keys, (key, title))
+
+    def apply(self, deltas, stamp_before, stamp_after):
+        """Apply {title: +n/-n} committed by this process.
+
+        Only if nothing else changed the titles since they were loaded (the stamp was
+        still stamp_before); otherwise the index is left to reload.
+        """
+        with self._lock:
+            if self._stamp is None or self._stamp != stamp_before:
+                return
+            for title, delta in deltas.items():
+                self._add(title, delta)
+            self._stamp = stamp_after
+
+    def suggest(self, prefix, limit=DEFAULT_LIMIT):
+        """Up to limit titles matching prefix at a word start.
+
+        Titles starting with the prefix come first, then the most used ones.
+        """
+        norm = normalize(prefix)
+        if not norm:
+            return []
+        self._ensure()
+        with self._lock:
+            keys, counts = self._keys, self._counts
+            found = {}
+            i = bisect_left(keys, (norm,))
+            end = min(len(keys), i + SCAN_LIMIT)
+            while i < end and keys[i][0].startswith(norm):
+                title = keys[i][1]
+                found[title] = counts.get(title, 0)
+                i += 1
+        ranked = sorted(found.items(), key=lambda x: (not normalize(x[0]).startswith(norm), -x[1], x[0].lower()))
+        return [title for title, _ in ranked[:limit]]
+
+    def invalidate(self):
+        """Reload on the next lookup (in the background if an index is already loaded)."""
+        with self._lock:
+            self._stamp = None
+
+
+titles = TitleIndex()
+
+
+def suggest_categories(prefix, limit=DEFAULT_LIMIT):
+    """Names of categories with a word starting with prefix (from the category cache)."""
+    norm = normalize(prefix)
+    if not norm:
+        return []
+    found = [c.name for c in category_cache.all()
+             if any(key.startswith(norm) for key in _keys(normalize(c.name)))]
+    return found[:limit]
+
+
+# --- Change tracking ---
+# ORM inserts, title edits and deletes of requests are collected per session and applied to
+# this process's index after commit. Bulk INSERT/DELETE statements on request can't be
+# applied piecemeal: they rewrite the stamp so every worker reloads.
+
+def _pending(target):
+    session = object_session(target)
+    if session is None:
+        return None
+    return session.info.setdefault(_PENDING_KEY, {})
+
+
+def _count(target, title, delta):
+    pending = _pending(target)
+    if pending is not None and title:
+        pending[title] = pending.get(title, 0) + delta
+
+
+def _after_insert(mapper, connection, target):
+    _count(target, target.title, 1)
+
+
+def _after_update(mapper, connection, target):
+    hist = inspect(target).attrs.title.history
+    if hist.has_changes():
+        for old in hist.deleted:
+            _count(target, old, -1)
+        _count(target, target.title, 1)
+
+
+def _after_delete(mapper, connection, target):
+    _count(target, target.title, -1)
+
+
+def _do_orm_execute(state):
+    if (state.is_insert or state.is_delete) and state.bind_mapper is not None \
+            and state.bind_mapper.class_ is Request:
+        state.session.info[_RESET_KEY] = True
+
+
+def _after_commit(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    reset = session.info.pop(_RESET_KEY, None)
+    if not pending and not reset:
+        return
+    before = changes.stamp(STAMP)
+    changes.touch_stamp(STAMP)
+    if not reset:
+        titles.apply({t: d for t, d in pending.items() if d}, before, changes.stamp(STAMP))
+
+
+def _after_rollback(session):
+    session.info.pop(_PENDING_KEY, None)
+    session.info.pop(_RESET_KEY, None)
+
+
+def _keep_old_value(target, value, oldvalue, initiator):
+    return value
+
+
+def init_app(app):
+    if getattr(Request, '_title_tracking', False):
+        return
+    # load the previous title when an expired attribute is assigned, so _after_update
+    # knows which title to take out
+    event.listen(Request.title, 'set', _keep_old_value, active_history=True, retval=True)
+    event.listen(Request, 'after_insert', _after_insert)
+    event.listen(Request, 'after_update', _after_update)
+    event.listen(Request, 'after_delete', _after_delete)
+    event.listen(Session, 'do_orm_execute', _do_orm_execute)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
+    Request._title_tracking = True
@@ -1,8 +1,17 @@
-from flask import Blueprint, render_template, flash, redirect, url_for, request
+from flask import Blueprint, current_app, jsonify, render_template, flash, redirect, url_for, request
 from flask_login import current_user, login_required
-from sqlalchemy import or_
+from sqlalchemy.orm import joinedload
 from . import db
-from website.models import Category, Request, User
+from website.models import Request, RequestArchive, User
+from .changes import conditional_get
+from .category_cache import categories as category_cache
+from . import duplicates
+from . import facets
+from .facets import facet_counts
+from . import geo
+from . import skills
+from . import trending
+from . import typeahead
 
 from datetime import datetime
 
@@ -12,13 +21,16 @@ views = Blueprint('views', __name__)
 
 # Home Page
 @views.route('/')
+# view counts on the cards may lag until the next real change; the trending order doesn't
+@conditional_get('request', 'category', 'user',
+                 extra=lambda: ('request_counters',) if request.args.get('sort') == 'views' else ())
 def home():
     # Redirect unauthenticated users to login
     if not current_user.is_authenticated:
         return redirect(url_for('auth.login'))
 
-    # Get all categories from database
-    categories = Category.query.order_by(Category.name).all()
+    # Categories come from the per-process cache (no query)
+    categories = category_cache.all()
 
     # Get filter parameters
     search_query = request.args.get('q', '').strip()
@@ -26,22 +38,21 @@ def home():
     status_filter = request.args.get('status', '')
     sort_by = request.args.get('sort', 'newest')
 
-    # Start with base query
-    query = Request.query
+    # Start with base query (owners loaded in the same query for the cards)
+    query = Request.query.options(joinedload(Request.user))
 
-    # Apply search filter (searches in title and description)
+    # Apply search filter (searches in title and description; normalised as for the
+    # facet counts, so the list and its counts always agree)
     if search_query:
-        search_pattern = f"%{search_query}%"
-        query = query.filter(
-            or_(
-                Request.title.ilike(search_pattern),
-                Request.description.ilike(search_pattern)
-            )
-        )
+        query = query.filter(facets.search_filter(facets.normalize(search_query)))
 
-    # Apply category filter
+    # Apply category filter (name resolved through the cache, filtered by id)
+    category_id = None
     if category_filter:
-        query = query.join(Category).filter(Category.name == category_filter)
+        cat = category_cache.by_name(category_filter)
+        # unknown name: 0 matches no row (not even NULL categories), here and in the counts
+        category_id = cat.id if cat else 0
+        query = query.filter(Request.category_id == category_id)
 
     # Apply status filter
     if status_filter:
@@ -51,7 +62,8 @@ def home():
     if sort_by == 'oldest':
         query = query.order_by(Request.date_created.asc())
     elif sort_by == 'views':
-        query = query.order_by(Request.view_count.desc())
+        # trending: views decayed over time (website.trending), read in ix_request_trending order
+        query = query.order_by(Request.trending_score.desc(), Request.id.desc())
     elif sort_by == 'title':
         query = query.order_by(Request.title.asc())
     else:  # newest (default)
@@ -60,14 +72,32 @@ def home():
     # Execute query
     requests = query.all()
 
+    # Counts for the filter dropdowns: one grouped query per search, cached briefly
+    counts = facet_counts.counts(search_query, category_id, status_filter or None)
+
     return render_template(
         'home.html',
         user=current_user,
         requests=requests,
-        categories=categories
+        categories=categories,
+        facet_counts=counts
     )
 
 
+# Search box suggestions: request titles and category names matching a prefix, served from
+# in-memory indexes (website.typeahead) without querying the database
+@views.route('/search/suggest')
+@login_required
+def search_suggest():
+    prefix = request.args.get('q', '')[:100]
+    limit = max(1, min(request.args.get('limit', typeahead.DEFAULT_LIMIT, type=int), 20))
+    return jsonify({
+        "query": prefix,
+        "titles": typeahead.titles.suggest(prefix, limit),
+        "categories": typeahead.suggest_categories(prefix, limit),
+    })
+
+
 # Edit Profile For all user
 @views.route('/edit-profile', methods=['GET', 'POST'])
 def edit_profile():
@@ -85,6 +115,21 @@ def edit_profile():
             flash("Email is already in use.", "danger")
             return redirect(url_for('views.edit_profile'))
 
+        # Volunteers may set a home location for nearby matching
+        volunteer_profile = current_user.volunteer_profile if current_user.role == 'Volunteer' else None
+        if volunteer_profile is not None:
+            try:
+                latitude, longitude = geo.parse_coordinates(
+                    request.form.get('latitude'), request.form.get('longitude'))
+            except ValueError as e:
+                flash(str(e), "danger")
+                return redirect(url_for('views.edit_profile'))
+            volunteer_profile.latitude = latitude
+            volunteer_profile.longitude = longitude
+            if request.form.get('skills_form'):
+                skills.set_skills(volunteer_profile, skills.parse_skill_ids(
+                    request.form.getlist('skills'), category_cache.get))
+
         # Update user info
         current_user.name = name
         current_user.email = email
@@ -93,7 +138,7 @@ def edit_profile():
         flash("Profile updated successfully!", "success")
         return redirect(url_for('views.home'))
 
-    return render_template('edit_profile.html', user=current_user)
+    return render_template('edit_profile.html', user=current_user, categories=category_cache.all())
 
 
 @views.route('/csr/profile')
@@ -142,22 +187,43 @@ def create_request():
             flash('Please select a category.', 'danger')
             return redirect(url_for('views.create_request'))
 
+        try:
+            latitude, longitude = geo.parse_coordinates(
+                request.form.get('latitude'), request.form.get('longitude'))
+        except ValueError as e:
+            flash(str(e), 'danger')
+            return redirect(url_for('views.create_request'))
+
         # Convert to Python datetime object
         scheduled_datetime = datetime.fromisoformat(scheduled_datetime)
 
+        # Near-duplicates of the user's own or same-category open requests
+        action = current_app.config.get('DUPLICATE_REQUEST_ACTION', duplicates.DEFAULT_ACTION)
+        matches = []
+        if action != 'off':
+            matches = duplicates.find(title, description, current_user.id, category_id)
+        if matches and action == 'block':
+            flash(f'This looks like a duplicate of request #{matches[0][0]}, so it was not created.', 'warning')
+            return redirect(url_for('views.create_request'))
+
         new_request = Request(
             title=title,
             category_id=category_id,
             description=description,
             scheduled_datetime=scheduled_datetime,
-            user_id=current_user.id
+            latitude=latitude,
+            longitude=longitude,
+            user_id=current_user.id,
+            duplicate_of=matches[0][0] if matches else None
         )
         db.session.add(new_request)
         db.session.commit()
         flash('Request created successfully!', 'success')
+        if matches:
+            flash(f'It looks like a duplicate of request #{matches[0][0]} and has been flagged for review.', 'warning')
         return redirect(url_for('pin.pin_profile'))
 
-    categories = Category.query.all()
+    categories = category_cache.all()
     return render_template('create_request.html', categories=categories, now_str=now_str)
 
 
@@ -166,7 +232,7 @@ def create_request():
 @login_required
 def edit_request(id):
     req = Request.query.get_or_404(id)
-    categories = Category.query.all()
+    categories = category_cache.all()
 
     if req.user_id != current_user.id:
         flash("You can only edit your own requests.", "danger")
@@ -177,6 +243,13 @@ def edit_request(id):
         return redirect(url_for('views.home'))
 
     if request.method == 'POST':
+        try:
+            latitude, longitude = geo.parse_coordinates(
+                request.form.get('latitude'), request.form.get('longitude'))
+        except ValueError as e:
+            flash(str(e), "danger")
+            return redirect(url_for('views.edit_request', id=req.id))
+
         req.title = request.form['title']
         req.description = request.form['description']
         req.category_id = request.form['category_id']  # assuming you store category by ID
@@ -184,6 +257,8 @@ def edit_request(id):
         if scheduled_datetime:
             from datetime import datetime
             req.scheduled_datetime = datetime.fromisoformat(scheduled_datetime)
+        req.latitude = latitude
+        req.longitude = longitude
         db.session.commit()
 
         flash("Request updated successfully!", "success")
@@ -222,6 +297,8 @@ def update_request(id):
         flash("Invalid status value.", "danger")
         return redirect(url_for('views.home'))
 
+    if new_status != req.status:
+        req.date_completed = datetime.utcnow() if new_status == 'Completed' else None
     req.status = new_status
     db.session.commit()
     flash(f"Request '{req.title}' status updated to {new_status}.", "success")
@@ -232,12 +309,12 @@ def update_request(id):
 @views.route('/request/<int:id>')
 @login_required
 def view_request(id):
-    # Get the request, or 404 if it doesn't exist
-    req = Request.query.get_or_404(id)
+    # Get the request (archived requests are shown read-only), or 404 if it doesn't exist
+    req = db.session.get(Request, id) or db.get_or_404(RequestArchive, id)
 
     # Increment view count if the viewer is NOT the owner
-    if req.user_id != current_user.id:
-        req.view_count += 1
+    if req.user_id != current_user.id and not req.is_archived:
+        trending.record_view(req)
         db.session.commit()
 
     # Pass request and owner info to template
@@ -2,12 +2,16 @@ from flask import Blueprint, render_template, request, flash, redirect, url_for
 from flask_login import login_required, current_user
 from .models import Request, Review, Volunteer, User
 from . import db
+from .changes import conditional_get
+from . import transitions
+from . import archive
 
 volunteer = Blueprint('volunteer', __name__)
 
 # Volunteer Dashboard
 @volunteer.route('/volunteer/dashboard')
 @login_required
+@conditional_get('request', 'review', 'category', 'volunteer', 'volunteer_skill', 'user', 'request_counters')
 def volunteer_dashboard():
     # Ensure the user has the volunteer role
     if current_user.role != 'Volunteer':
@@ -31,16 +35,11 @@ def volunteer_dashboard():
 ).order_by(Request.date_created.desc()).all()
     
     
-    # Get completed requests
-    completed_requests = Request.query.filter(
-        Request.volunteer_id == volunteer_profile.id,
-        Request.status == 'Completed'
-    ).order_by(Request.date_created.desc()).all()
+    # Get completed requests (including archived ones)
+    completed_requests = archive.completed_for_volunteer(volunteer_profile.id)
     
-    # Calculate review statistics
-    reviews = Review.query.filter_by(volunteer_id=volunteer_profile.id).all()
-    total_reviews = len(reviews)
-    avg_rating = sum(r.rating for r in reviews) / total_reviews if total_reviews > 0 else None
+    # Calculate review statistics in SQL, over hot and archived reviews
+    total_reviews, avg_rating = archive.review_stats(volunteer_profile.id)
 
     # volunteer_profile.is_available = True
     # db.session.commit()
@@ -72,10 +71,14 @@ def volunteer_accept_task(request_id):
     req = Request.query.get_or_404(request_id) # get request
     
     try:
-        volunteer_profile.is_available = False
-        req.status = "In Progress"
+        transitions.transition(req, 'start', transitions.form_version(request.form),
+                               assigned_to=volunteer_profile.id)
+        transitions.claim_volunteer(volunteer_profile, required=False)
         db.session.commit()
         flash(f'You have started working on: "{req.title}". Good luck!', 'success')
+    except transitions.TransitionError as e:
+        db.session.rollback()
+        flash(str(e), 'warning')
     except Exception as e:
         db.session.rollback()
         flash(f'Error starting task: {str(e)}', 'danger')
@@ -106,12 +109,15 @@ def decline_task(request_id):
     
     try:
         # Unassign the volunteer and reset status
-        req.volunteer_id = None
-        req.status = 'Accepted'
+        transitions.transition(req, 'decline', transitions.form_version(request.form),
+                               assigned_to=volunteer_profile.id, volunteer_id=None)
         # FIXED: Make volunteer available again when declining
-        volunteer_profile.is_available = True
+        transitions.release_volunteer(volunteer_profile)
         db.session.commit()
         flash(f'You have declined the task: "{req.title}". It has been returned to pending.', 'info')
+    except transitions.TransitionError as e:
+        db.session.rollback()
+        flash(str(e), 'warning')
     except Exception as e:
         db.session.rollback()
         flash(f'Error declining task: {str(e)}', 'danger')
@@ -141,11 +147,14 @@ def complete_task(request_id):
     
     try:
         # Mark as completed and increment volunteer's count
-        req.status = 'Completed'
-        volunteer_profile.total_tasks_completed += 1
-        volunteer_profile.is_available = True
+        transitions.transition(req, 'complete', transitions.form_version(request.form),
+                               assigned_to=volunteer_profile.id)
+        transitions.release_volunteer(volunteer_profile, completed=True)
         db.session.commit()
         flash(f'Congratulations! You have completed the task: "{req.title}". Total completed: {volunteer_profile.total_tasks_completed}', 'success')
+    except transitions.TransitionError as e:
+        db.session.rollback()
+        flash(str(e), 'warning')
     except Exception as e:
         db.session.rollback()
         flash(f'Error completing task: {str(e)}', 'danger')